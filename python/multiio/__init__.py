@@ -1,75 +1,181 @@
 #!/usr/bin/python3
 
-from smbus2 import SMBus
+import collections
+import contextlib
 import struct
 import datetime
 
 import multiio.multiio_data as data
+from multiio.snapshot import Snapshot, SNAPSHOT_ADDRESS, SNAPSHOT_SIZE
+from multiio.snapshot import Counters, COUNTERS_ADDRESS, COUNTERS_SIZE
+from multiio.snapshot import Pulses, PULSES_ADDRESS, PULSES_SIZE
+from multiio.snapshot import Diagnostics, DIAGNOSTICS_ADDRESS, DIAGNOSTICS_SIZE
+from multiio.pool import pool
+from multiio.cache import ShadowCache
+from multiio.instrument import InstrumentedBus
+from multiio.rdwr import RdwrReader
+from multiio.scheduler import ScheduledBus
+from multiio.trace import RecordingBus
+from multiio import registers
+from multiio.registers import CHANNEL_CHECKS
 I2C_MEM = data.I2C_MEM
 CHANNEL_NO = data.CHANNEL_NO
 CALIB = data.CALIB
 
+# Largest SMBus block transfer (I2C_SMBUS_BLOCK_MAX)
+I2C_BLOCK_MAX = 32
+# End of the card register map (I2C_END in the firmware)
+MEM_END = I2C_MEM.PWM_IN_FILL + CHANNEL_NO["opto"] * 2
+# Output registers buffered by SMmultiio.batch(): U_OUT..SERVO_VAL2
+BATCH_START = I2C_MEM.U_OUT
+BATCH_END = I2C_MEM.RTD_VAL1_ADD
+
 class SMmultiio: 
     """Python class to control the Multiio Card for Raspberry Pi.
 
     Args:
         stack (int): Stack level/device number.
         i2c (int): i2c bus number
+        bus: SMBus compatible backend (e.g. ``multiio.emulator.EmulatedBus``),
+            if None the bus is shared with the other cards through
+            ``multiio.pool`` and released by :meth:`close`
+        rdwr (bool): Read register blocks with I2C_RDWR combined transfers,
+            without the 32 byte SMBus block limit
     """
-    def __init__(self, stack=0, i2c=1):
+    def __init__(self, stack=0, i2c=1, bus=None, rdwr=False):
         if stack < 0 or stack > data.STACK_LEVEL_MAX:
             raise ValueError("Invalid stack level!")
         self._hw_address_ = data.SLAVE_OWN_ADDRESS_BASE + stack
         self._i2c_bus_no = i2c
-        self.bus = SMBus(self._i2c_bus_no)
+        self._pooled = bus is None
+        self._cache = None
+        self._rdwr = RdwrReader(self._hw_address_) if rdwr else None
+        if bus is None:
+            bus = pool.acquire(self._i2c_bus_no)
+        self.bus = bus
         try:
             self._card_rev_major = self.bus.read_byte_data(self._hw_address_, I2C_MEM.REVISION_HW_MAJOR_ADD)
             self._card_rev_minor = self.bus.read_byte_data(self._hw_address_, I2C_MEM.REVISION_HW_MINOR_ADD)
+        except OSError as e:
+            self.close()
+            raise OSError(e.errno, "{} not detected at stack level {}!".format(data.CARD_NAME, stack)) from e
         except Exception:
-            print("{} not detected!".format(data.CARD_NAME))
+            self.close()
             raise
-
+        self._snapshot_buf = bytearray(SNAPSHOT_SIZE)
+        self._counters_buf = bytearray(COUNTERS_SIZE)
+        self._pulses_buf = bytearray(PULSES_SIZE)
+        self._diagnostics_buf = bytearray(DIAGNOSTICS_SIZE)
+        self._mem_buf = bytearray(I2C_MEM.SLAVE_BUFF_SIZE + 1)
+        self._batch_depth = 0
+        self._batch_pending = {}
+
+    def close(self):
+        """Release the pooled i2c bus. Buses passed to the constructor are
+        left open."""
+        if self._pooled:
+            self._pooled = False
+            pool.release(self._i2c_bus_no)
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_cached(self, address, size):
+        buf = self._cache.lookup(address, size)
+        if buf is None:
+            buf = bytes(self.bus.read_i2c_block_data(self._hw_address_, address, size))
+            self._cache.store(address, buf)
+        return buf
     def _get_byte(self, address):
+        if self._cache is not None and address in self._cache:
+            return self._get_cached(address, 1)[0]
         return self.bus.read_byte_data(self._hw_address_, address)
     def _get_word(self, address):
+        if self._cache is not None and address in self._cache:
+            return registers.U16.unpack_from(self._get_cached(address, 2))[0]
         return self.bus.read_word_data(self._hw_address_, address)
     def _get_i16(self, address):
-        buf = self.bus.read_i2c_block_data(self._hw_address_, address, 2)
-        i16_value = struct.unpack("h", bytearray(buf))[0]
-        return i16_value
+        return registers.I16.unpack(bytearray(self._get_block_data(address, 2)))[0]
     def _get_float(self, address):
-        buf = self.bus.read_i2c_block_data(self._hw_address_, address, 4)
-        float_value = struct.unpack("f", bytearray(buf))[0]
-        return float_value
+        return registers.FLOAT.unpack(bytearray(self._get_block_data(address, 4)))[0]
     def _get_i32(self, address):
-        buf = self.bus.read_i2c_block_data(self._hw_address_, address, 4)
-        i32_value = struct.unpack("i", bytearray(buf))[0]
-        return i32_value
+        return registers.I32.unpack(bytearray(self._get_block_data(address, 4)))[0]
     def _get_u32(self, address):
-        buf = self.bus.read_i2c_block_data(self._hw_address_, address, 4)
-        u32_value = struct.unpack("I", bytearray(buf))[0]
-        return u32_value
+        return registers.U32.unpack(bytearray(self._get_block_data(address, 4)))[0]
+    def _get_value(self, register, channel=1):
+        # Validate, read and scale one value of a register table entry
+        address = register.addresses.get(channel)
+        if address is None:
+            raise ValueError(register.error)
+        if register.fmt == "H":
+            raw = self._get_word(address)
+        else:
+            raw = register.unpack(bytearray(self._get_block_data(address, register.size)))[0]
+        return raw / register.scale if register.scaled else raw
+    def _set_value(self, register, channel, value):
+        address = register.addresses.get(channel)
+        if address is None:
+            raise ValueError(register.error)
+        self._set_word(address, value * register.scale)
     def _get_block_data(self, address, byteno=4):
+        if self._cache is not None and address in self._cache:
+            return list(self._get_cached(address, byteno))
         return self.bus.read_i2c_block_data(self._hw_address_, address, byteno)
+    def _read_into(self, address, buf):
+        if self._rdwr is not None:
+            return self._rdwr.read_into(self.bus, address, buf)
+        with self._exclusive():
+            for offset in range(0, len(buf), I2C_BLOCK_MAX):
+                size = min(I2C_BLOCK_MAX, len(buf) - offset)
+                buf[offset:offset + size] = bytes(self.bus.read_i2c_block_data(
+                        self._hw_address_, address + offset, size))
+        return buf
     def _set_byte(self, address, value):
         self.bus.write_byte_data(self._hw_address_, address, int(value))
+        if self._cache is not None:
+            self._cache.written(address, bytes([int(value) & 0xff]))
     def _set_word(self, address, value):
+        if self._batch_depth and BATCH_START <= address < BATCH_END:
+            value = int(value) & 0xffff
+            self._batch_pending[address] = value & 0xff
+            self._batch_pending[address + 1] = value >> 8
+            return
         self.bus.write_word_data(self._hw_address_, address, int(value))
+        if self._cache is not None:
+            self._cache.written(address, registers.U16.pack(int(value) & 0xffff))
     def _set_float(self, address, value):
-        ba = bytearray(struct.pack("f", value))
+        ba = registers.FLOAT.pack(value)
         self.bus.write_block_data(self._hw_address_, address, ba)
+        if self._cache is not None:
+            self._cache.written(address, ba)
     def _set_i32(self, address, value):
-        ba = bytearray(struct.pack("i", value))
+        ba = registers.I32.pack(value)
         self.bus.write_block_data(self._hw_address_, address, ba)
+        if self._cache is not None:
+            self._cache.written(address, ba)
     def _set_block(self, address, ba):
         self.bus.write_i2c_block_data(self._hw_address_, address, ba)
+        if self._cache is not None:
+            self._cache.written(address, bytes(ba))
 
     @staticmethod
     def _check_channel(channel_type, channel):
-        if not (0 < channel and channel <= CHANNEL_NO[channel_type]):
-            raise ValueError("Invalid {} channel number. Must be [1..{}]!".format(channel_type, CHANNEL_NO[channel_type]))
+        channels, error = CHANNEL_CHECKS[channel_type]
+        if channel not in channels:
+            raise ValueError(error)
+    def _batch_begin(self):
+        self._batch_depth += 1
+    def _batch_end(self, commit=True):
+        self._batch_depth -= 1
+        if self._batch_depth:
+            return
+        if commit:
+            self.flush()
+        else:
+            self._batch_pending.clear()
     def _calib_set(self, channel, value):
-        ba = bytearray(struct.pack("f", value))
+        ba = bytearray(registers.FLOAT.pack(value))
         ba.extend([channel, data.CALIBRATION_KEY])
         self._set_block(I2C_MEM.CALIB_VALUE, ba)
 
@@ -86,6 +192,190 @@ class SMmultiio:
         status = self._get_byte(I2C_MEM.CALIB_STATUS)
         return status
 
+    def enable_cache(self, policies=None):
+        """Serve configuration register reads from a shadow copy.
+
+        Revisions, opto edge and encoder masks are kept until written and
+        watchdog periods until the next write; ``policies`` overrides this
+        (see :mod:`multiio.cache`). Writes made through this instance keep
+        the copy current, so read-modify-write methods such as
+        :meth:`set_opto_edge` need a single transaction.
+
+        Args:
+            policies (dict): register -> (size, CachePolicy), defaults if None
+        """
+        self._cache = ShadowCache(policies)
+
+    def disable_cache(self):
+        """Stop using the shadow copy of configuration registers."""
+        self._cache = None
+
+    def refresh(self):
+        """Reload every cached configuration register from the card."""
+        if self._cache is None:
+            return
+        self._cache.invalidate()
+        for address, size in self._cache.ranges():
+            for offset in range(0, size, I2C_BLOCK_MAX):
+                length = min(I2C_BLOCK_MAX, size - offset)
+                self._get_cached(address + offset, length)
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        # Hold the bus for an operation of several transactions: take the
+        # locks and the scheduler of the wrapper chain top down, the order a
+        # single transaction takes them in
+        with contextlib.ExitStack() as stack:
+            bus = self.bus
+            while bus is not None:
+                if isinstance(bus, ScheduledBus):
+                    stack.enter_context(bus.scheduler.exclusive())
+                else:
+                    lock = getattr(bus, "lock", None)
+                    if lock is not None:
+                        stack.enter_context(lock)
+                bus = getattr(bus, "bus", None)
+            yield
+
+    def _unwrap(self, wrapper_type):
+        # Remove every wrapper of a type from the bus chain, wherever it sits
+        parent = self
+        bus = self.bus
+        while bus is not None:
+            if isinstance(bus, wrapper_type):
+                parent.bus = bus.bus
+            else:
+                parent = bus
+            bus = getattr(parent, "bus", None)
+
+    def instrument(self, metrics):
+        """Record statistics of every transaction of this card.
+
+        Args:
+            metrics (multiio.instrument.Metrics): Statistics receiver replacing
+                any previous one, None to stop recording
+
+        Returns:
+            (Metrics) The receiver
+        """
+        self._unwrap(InstrumentedBus)
+        if metrics is not None:
+            self.bus = InstrumentedBus(self.bus, metrics)
+        return metrics
+
+    def record(self, recorder):
+        """Write every transaction of this card to a trace file.
+
+        Args:
+            recorder (multiio.trace.TraceRecorder): Trace writer replacing any
+                previous one, None to stop recording
+
+        Returns:
+            (TraceRecorder) The writer
+        """
+        self._unwrap(RecordingBus)
+        if recorder is not None:
+            self.bus = RecordingBus(self.bus, recorder)
+        return recorder
+
+    def schedule(self, scheduler):
+        """Run every transaction of this card through a bus scheduler, so
+        cards and threads sharing the bus are serialized by priority.
+
+        Args:
+            scheduler (multiio.scheduler.BusScheduler): Scheduler of the bus
+                (see ``multiio.scheduler.get_scheduler``) replacing any
+                previous one, None to stop
+        """
+        self._unwrap(ScheduledBus)
+        if scheduler is not None:
+            self.bus = ScheduledBus(self.bus, scheduler)
+
+    def batch(self):
+        """Buffer output writes and send them merged on exit.
+
+        Inside the context ``set_u_out``, ``set_i_out``, ``set_motor`` and
+        ``set_servo`` are only stored. On exit the buffered values are sent
+        with one block write per contiguous register range, so a full update
+        of all outputs is one transaction. Other writes are sent immediately.
+        Buffered writes are dropped if the block raises. Batches can be
+        nested; the outermost one flushes.
+
+        Example:
+            >>> with mio.batch():
+            ...     mio.set_u_out(1, 2.5)
+            ...     mio.set_i_out(1, 12)
+            ...     mio.set_servo(2, 30)
+
+        Returns:
+            Context manager
+        """
+        return _Batch(self)
+
+    def flush(self):
+        """Send the output writes buffered by :meth:`batch` now."""
+        pending = self._batch_pending
+        if not pending:
+            return
+        addresses = sorted(pending)
+        start = prev = addresses[0]
+        with self._exclusive():
+            for address in addresses[1:] + [None]:
+                if address != prev + 1 or address - start >= I2C_BLOCK_MAX:
+                    self._set_block(start, [pending[a] for a in range(start, prev + 1)])
+                    start = address
+                prev = address
+        pending.clear()
+
+    def read_snapshot(self):
+        """Read relays, leds, opto, analog inputs/outputs, motor, servo and
+        RTD values in one pass (two block transfers).
+
+        Returns:
+            (Snapshot) Immutable record of the card state
+        """
+        buf = self._read_into(SNAPSHOT_ADDRESS, self._snapshot_buf)
+        return Snapshot.from_buffer(buf)
+
+    def get_hw_version(self):
+        """Get hardware revision read when the card was opened.
+
+        Returns: (str) Hardware version number
+        """
+        return str(self._card_rev_major) + "." + str(self._card_rev_minor)
+
+    def read_counters(self):
+        """Read all opto edge counters and encoder counters in one transfer.
+
+        Returns:
+            (Counters) opto: 4 edge counters, encoder: 2 encoder counters
+        """
+        buf = self._read_into(COUNTERS_ADDRESS, self._counters_buf)
+        return Counters.from_buffer(buf)
+
+    def read_registers(self, address=0, length=None):
+        """Read a raw range of card memory.
+
+        With ``rdwr=True`` the range is read in one transfer, otherwise in
+        32 byte blocks.
+
+        Args:
+            address (int): Start address
+            length (int): Number of bytes, up to the end of the register map
+                (PWM_IN_FILL) if None
+
+        Returns:
+            (memoryview) Register bytes, a view of a buffer reused by the next
+                call
+        """
+        if length is None:
+            length = MEM_END - address
+        if not (0 <= address and 0 < length and address + length <= len(self._mem_buf)):
+            raise ValueError("Invalid register range!")
+        view = memoryview(self._mem_buf)[address:address + length]
+        self._read_into(address, view)
+        return view
+
     def get_version(self):
         """Get firmware version.
 
@@ -151,9 +441,7 @@ class SMmultiio:
         Returns:
             (float) Input value in volts
         """
-        self._check_channel("u_in", channel)
-        value = self._get_word(I2C_MEM.U_IN + (channel - 1) * 2)
-        return value / data.VOLT_TO_MILIVOLT
+        return self._get_value(registers.U_IN, channel)
     def cal_u_in(self, channel, value):
         """Calibrate 0-10V input channel.
         Calibration must be done in 2 points at min 5V apart.
@@ -173,9 +461,7 @@ class SMmultiio:
         Returns:
             (float) 0-10V output value
         """
-        self._check_channel("u_out", channel)
-        value = self._get_word(I2C_MEM.U_OUT + (channel - 1) * 2)
-        return value / data.VOLT_TO_MILIVOLT
+        return self._get_value(registers.U_OUT, channel)
     def set_u_out(self, channel, value):
         """Set 0-10V output channel value in volts.
 
@@ -183,9 +469,7 @@ class SMmultiio:
             channel (int): Channel number
             value (float): Voltage value
         """
-        self._check_channel("u_out", channel)
-        value = value * data.VOLT_TO_MILIVOLT
-        self._set_word(I2C_MEM.U_OUT + (channel - 1) * 2, value)
+        self._set_value(registers.U_OUT, channel, value)
     def cal_u_out(self, channel, value):
         """Calibrate 0-10V output channel.
         Calibration must be done in 2 points at min 5V apart.
@@ -206,9 +490,7 @@ class SMmultiio:
         Returns:
             (float) 4-20mA input channel value in mA
         """
-        self._check_channel("i_in", channel)
-        value = self._get_word(I2C_MEM.I_IN + (channel - 1) * 2)
-        return value / data.VOLT_TO_MILIVOLT
+        return self._get_value(registers.I_IN, channel)
     def cal_i_in(self, channel, value):
         """Calibrate 4-20mA input channel.
         Calibration must be done in 2 points at min 10mA apart.
@@ -228,9 +510,7 @@ class SMmultiio:
         Returns:
             (float) 4-20mA output value in mA
         """
-        self._check_channel("i_out", channel)
-        value = self._get_word(I2C_MEM.I_OUT + (channel - 1) * 2)
-        return value / data.VOLT_TO_MILIVOLT
+        return self._get_value(registers.I_OUT, channel)
     def set_i_out(self, channel, value):
         """Set 4-20mA output channel value in mA.
 
@@ -238,9 +518,7 @@ class SMmultiio:
             channel (int): Channel number
             value (float): Amperage value in mA
         """
-        self._check_channel("i_out", channel)
-        value = value * data.VOLT_TO_MILIVOLT
-        self._set_word(I2C_MEM.I_OUT + (channel - 1) * 2, value)
+        self._set_value(registers.I_OUT, channel, value)
     def cal_i_out(self, channel, value):
         """Calibrate 4-20mA output channel.
         Calibration must be done in 2 points at min 10mA apart.
@@ -261,8 +539,7 @@ class SMmultiio:
         Returns:
             (float) RTD resistance value
         """
-        self._check_channel("rtd", channel)
-        return self._get_float(I2C_MEM.RTD_RES1_ADD + (channel - 1) * 4)
+        return self._get_value(registers.RTD_RES, channel)
     def get_rtd_temp(self, channel):
         """Get RTD temperature in Celsius.
 
@@ -272,8 +549,7 @@ class SMmultiio:
         Returns:
             (float) RTD Celsius value
         """
-        self._check_channel("rtd", channel)
-        return self._get_float(I2C_MEM.RTD_VAL1_ADD + (channel - 1) * 4)
+        return self._get_value(registers.RTD_TEMP, channel)
     def cal_rtd_res(self, channel, value):
         """Calibrate rtd resistance.
 
@@ -449,8 +725,7 @@ class SMmultiio:
                 0(none)/1(rising)/2(falling)/3(both)
         """
         self._check_channel("opto", channel)
-        rising = self._get_byte(I2C_MEM.OPTO_IT_RISING_ADD)
-        falling = self._get_byte(I2C_MEM.OPTO_IT_FALLING_ADD)
+        rising, falling = self._get_block_data(I2C_MEM.OPTO_IT_RISING_ADD, 2)
         channel_bit = 1 << (channel - 1)
         value = 0
         if(rising & channel_bit):
@@ -467,19 +742,18 @@ class SMmultiio:
                 0(none)/1(rising)/2(falling)/3(both)
         """
         self._check_channel("opto", channel)
-        rising = self._get_byte(I2C_MEM.OPTO_IT_RISING_ADD)
-        falling = self._get_byte(I2C_MEM.OPTO_IT_FALLING_ADD)
-        channel_bit = 1 << (channel - 1)
-        if(value & 1):
-            rising |= channel_bit
-        else:
-            rising &= ~channel_bit
-        if(value & 2):
-            falling |= channel_bit
-        else:
-            falling &= ~channel_bit
-        self._set_byte(I2C_MEM.OPTO_IT_RISING_ADD, rising)
-        self._set_byte(I2C_MEM.OPTO_IT_FALLING_ADD, falling)
+        with self._exclusive():
+            rising, falling = self._get_block_data(I2C_MEM.OPTO_IT_RISING_ADD, 2)
+            channel_bit = 1 << (channel - 1)
+            if(value & 1):
+                rising |= channel_bit
+            else:
+                rising &= ~channel_bit
+            if(value & 2):
+                falling |= channel_bit
+            else:
+                falling &= ~channel_bit
+            self._set_block(I2C_MEM.OPTO_IT_RISING_ADD, [rising & 0xff, falling & 0xff])
     def get_opto_counter(self, channel):
         """Get optocoupled inputs edges counter for one channel.
 
@@ -489,8 +763,7 @@ class SMmultiio:
         Returns:
             (int) opto counter
         """
-        self._check_channel("opto", channel)
-        return self._get_u32(I2C_MEM.OPTO_EDGE_COUNT_ADD + (channel - 1) * 4)
+        return self._get_value(registers.OPTO_COUNTER, channel)
     def reset_opto_counter(self, channel):
         """Reset optocoupled inputs edges counter.
 
@@ -523,15 +796,16 @@ class SMmultiio:
             state (int): 0(disabled)/1(enabled)
         """
         self._check_channel("opto_enc", channel)
-        encoder_mask = self._get_byte(I2C_MEM.OPTO_ENC_ENABLE_ADD)
-        channel_bit = 1 << (channel - 1)
-        if(state == 1):
-            encoder_mask |= channel_bit
-        elif(state == 0):
-            encoder_mask &= ~channel_bit
-        else:
-            raise ValueError("Invalid value! Must be 0 or 1!")
-        self._set_byte(I2C_MEM.OPTO_ENC_ENABLE_ADD, encoder_mask)
+        with self._exclusive():
+            encoder_mask = self._get_byte(I2C_MEM.OPTO_ENC_ENABLE_ADD)
+            channel_bit = 1 << (channel - 1)
+            if(state == 1):
+                encoder_mask |= channel_bit
+            elif(state == 0):
+                encoder_mask &= ~channel_bit
+            else:
+                raise ValueError("Invalid value! Must be 0 or 1!")
+            self._set_byte(I2C_MEM.OPTO_ENC_ENABLE_ADD, encoder_mask)
     def get_opto_encoder_counter(self, channel):
         """Get optocoupled encoder counter for one channel.
 
@@ -541,8 +815,7 @@ class SMmultiio:
         Returns:
             (int) Opto encoder counter
         """
-        self._check_channel("opto_enc", channel)
-        return self._get_i32(I2C_MEM.OPTO_ENC_COUNT_ADD + (channel - 1) * 4)
+        return self._get_value(registers.ENCODER_COUNTER, channel)
     def reset_opto_encoder_counter(self, channel):
         """Reset optocoupled encoder counter for one channel.
 
@@ -560,8 +833,7 @@ class SMmultiio:
         Returns:
             (int) Optocoupled input frequency in Hz.
         """
-        self._check_channel("opto", channel)
-        return self._get_word(I2C_MEM.IN_FREQUENCY + (channel - 1) * 2)
+        return self._get_value(registers.OPTO_FREQUENCY, channel)
     
     def get_opto_pwm_fill(self, channel):
         """Get optocoupled input channel PWM fill value.
@@ -572,9 +844,61 @@ class SMmultiio:
         Returns:
             (float) PWM fill value in %.
         """
-        self._check_channel("opto", channel)
-        raw_value = self._get_word(I2C_MEM.PWM_IN_FILL + (channel - 1) * 2)
-        return float(raw_value) / data.OPTO_FILL_FACTOR_SCALE
+        return self._get_value(registers.OPTO_PWM_FILL, channel)
+
+    def get_opto_pps(self, channel):
+        """Get pulses per second of optocoupled input channel.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (int) Pulses per second
+        """
+        return self._get_value(registers.OPTO_PPS, channel)
+
+    def read_pulses(self):
+        """Read pulses per second, frequency and PWM fill of all optocoupled
+        inputs in one transfer.
+
+        Returns:
+            (Pulses) pps, frequency (Hz) and pwm_fill (%) of the 4 channels
+        """
+        buf = self._read_into(PULSES_ADDRESS, self._pulses_buf)
+        return Pulses.from_buffer(buf)
+
+    def read_diagnostics(self):
+        """Read board temperature and 3.3V rail in one transfer.
+
+        Returns:
+            (Diagnostics) temperature (Celsius) and v3v3 (V)
+        """
+        buf = self._read_into(DIAGNOSTICS_ADDRESS, self._diagnostics_buf)
+        return Diagnostics.from_buffer(buf)
+
+    def get_diag_temperature(self):
+        """Get board temperature.
+
+        Returns:
+            (int) Temperature in Celsius
+        """
+        return self._get_byte(I2C_MEM.DIAG_TEMPERATURE_ADD)
+
+    def get_diag_3v3(self):
+        """Get 3.3V rail voltage.
+
+        Returns:
+            (float) Voltage in volts
+        """
+        return self._get_word(I2C_MEM.DIAG_3V3_MV_ADD) / data.VOLT_TO_MILIVOLT
+
+    def get_analog_type(self):
+        """Get analog channel type register (also in :meth:`read_snapshot`).
+
+        Returns:
+            (int) Raw ANALOG_TYPE value
+        """
+        return self._get_byte(I2C_MEM.ANALOG_TYPE)
 
 
     def get_servo(self, channel):
@@ -586,8 +910,7 @@ class SMmultiio:
         Returns:
             (float) Servo position value in % for specified channel.
         """
-        self._check_channel("servo", channel)
-        return self._get_i16(I2C_MEM.SERVO_VAL1 + (channel - 1) * 2) / 10
+        return self._get_value(registers.SERVO, channel)
     def set_servo(self, channel, value):
         """Set servo position value in %.
 
@@ -595,10 +918,10 @@ class SMmultiio:
             channel (int): Channel number
             value (float): Servo position value in %
         """
-        self._check_channel("servo", channel)
+        address = registers.SERVO.check(channel)
         if(not(-140 <= value and value <= 140)):
             raise ValueError("Servo value out of range! Must be [-140..140]")
-        self._set_word(I2C_MEM.SERVO_VAL1 + (channel - 1) * 2, value * 10)
+        self._set_word(address, registers.SERVO.to_raw(value))
 
     def get_motor(self):
         """Get motor speed value in %.
@@ -606,7 +929,7 @@ class SMmultiio:
         Returns:
             (float) Motor speed value in %
         """
-        return self._get_i16(I2C_MEM.MOT_VAL) / 10
+        return self._get_value(registers.MOTOR)
     def set_motor(self, value):
         """Set motor speed value in %.
 
@@ -615,7 +938,7 @@ class SMmultiio:
         """
         if(not(-100 <= value and value <= 100)):
             raise ValueError("Motor value out of range! Must be [-100..100]")
-        self._set_word(I2C_MEM.MOT_VAL, value * 10)
+        self._set_word(I2C_MEM.MOT_VAL, registers.MOTOR.to_raw(value))
 
     def get_button(self):
         """Get button status.
@@ -636,10 +959,58 @@ class SMmultiio:
             (bool) status
                 True(ON)/False(OFF)
         """
-        state = self._get_byte(I2C_MEM.BUTTON)
-        if(state & 2):
-            state &= ~2
-            self._set_byte(I2C_MEM.BUTTON, state)
-            return True
-        else:
-            return False
+        with self._exclusive():
+            state = self._get_byte(I2C_MEM.BUTTON)
+            if(state & 2):
+                state &= ~2
+                self._set_byte(I2C_MEM.BUTTON, state)
+                return True
+            else:
+                return False
+
+
+DiscoveredCard = collections.namedtuple(
+        "DiscoveredCard", ["stack", "hw_version", "fw_version", "card"])
+
+def discover(i2c=1, bus=None):
+    """Find the cards present on all stack levels of a bus.
+
+    Each stack level is probed with one read of the revision registers;
+    missing levels are skipped silently.
+
+    Args:
+        i2c (int): i2c bus number
+        bus: SMBus compatible backend, the pooled bus if None
+
+    Returns:
+        (list) DiscoveredCard(stack, hw_version, fw_version, card) for every
+            card found, ordered by stack level. Close the cards when done.
+    """
+    probe_bus = pool.acquire(i2c) if bus is None else bus
+    found = []
+    try:
+        for stack in range(data.STACK_LEVEL_MAX + 1):
+            try:
+                hw_major, hw_minor, fw_major, fw_minor = probe_bus.read_i2c_block_data(
+                        data.SLAVE_OWN_ADDRESS_BASE + stack, I2C_MEM.REVISION_HW_MAJOR_ADD, 4)
+            except OSError:
+                continue
+            found.append(DiscoveredCard(
+                    stack,
+                    "{}.{}".format(hw_major, hw_minor),
+                    "{}.{}".format(fw_major, fw_minor),
+                    SMmultiio(stack, i2c, bus)))
+    finally:
+        if bus is None:
+            pool.release(i2c)
+    return found
+
+
+class _Batch:
+    def __init__(self, card):
+        self._card = card
+    def __enter__(self):
+        self._card._batch_begin()
+        return self._card
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._card._batch_end(exc_type is None)
@@ -0,0 +1,191 @@
+"""asyncio interface for the Multi-IO card.
+
+Every i2c bus gets one worker thread shared by all :class:`AsyncSMmultiio`
+instances on that bus, so bus transactions are serialized and never run on
+the event loop thread::
+
+    >>> card = await AsyncSMmultiio.open(stack=0)
+    >>> volts = await card.get_u_in(1)
+    >>> async with card.batch():
+    ...     await card.set_u_out(1, 2.5)
+    ...     await card.set_servo(1, 40)
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import threading
+
+from multiio import SMmultiio
+from multiio.registers import REGISTERS, READ_WRITE
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+# Merge policies for calls queued but not started yet
+_MERGE_SAME_ARGS = 1    # identical calls share one transaction
+_MERGE_LAST_VALUE = 2   # calls on the same register keep the last value
+
+
+def get_executor(i2c=1):
+    """Get the single worker thread executor serving an i2c bus.
+
+    Args:
+        i2c (int): i2c bus number
+
+    Returns:
+        (concurrent.futures.ThreadPoolExecutor) Bus executor
+    """
+    with _executors_lock:
+        executor = _executors.get(i2c)
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="multiio-i2c-{}".format(i2c))
+            _executors[i2c] = executor
+        return executor
+
+
+def _merge_policy(name):
+    if name.startswith(("get_", "wdt_get_", "read_")) or name in ("calib_status", "wdt_reload"):
+        return _MERGE_SAME_ARGS
+    if name.startswith(("set_", "wdt_set_")):
+        return _MERGE_LAST_VALUE
+    return None
+
+
+def _write_target(name, args):
+    # Register written by a setter call, the method and channel otherwise
+    register = REGISTERS.get(name[4:]) if name.startswith("set_") else None
+    if register is not None and register.access == READ_WRITE:
+        channel = args[0] if register.count > 1 else 1
+        address = register.addresses.get(channel)
+        if address is not None:
+            return address
+    return (name,) + tuple(args[:-1]) if len(args) == 2 else (name,)
+
+
+class AsyncSMmultiio:
+    """asyncio counterpart of :class:`multiio.SMmultiio`.
+
+    All public ``SMmultiio`` methods are available as coroutines with the
+    same arguments. Calls that are still queued when an identical read (or
+    a write to the same register) arrives are merged: a read is done once
+    for all callers and a write sends only the last value. Reads are not
+    merged across a write, and a write only merges with the call queued
+    just before it, so the order of writes is kept; batch boundaries are
+    never merged across. ``read_registers`` returns bytes instead of the
+    reused buffer of the card.
+
+    Args:
+        stack (int): Stack level/device number.
+        i2c (int): i2c bus number
+        bus: SMBus compatible backend, see :class:`multiio.SMmultiio`
+        card (SMmultiio): Existing card to wrap instead of opening one
+    """
+    def __init__(self, stack=0, i2c=1, bus=None, card=None):
+        if card is None:
+            card = SMmultiio(stack, i2c, bus)
+        self.card = card
+        self._executor = get_executor(i2c)
+        self._pending = {}
+        self._epoch = 0
+        self._last_key = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    async def open(cls, stack=0, i2c=1, bus=None):
+        """Open a card without blocking the event loop.
+
+        Args:
+            stack (int): Stack level/device number.
+            i2c (int): i2c bus number
+            bus: SMBus compatible backend
+
+        Returns:
+            (AsyncSMmultiio) Card handle
+        """
+        loop = asyncio.get_running_loop()
+        card = await loop.run_in_executor(get_executor(i2c), SMmultiio, stack, i2c, bus)
+        return cls(i2c=i2c, card=card)
+
+    def _invoke(self, name, args):
+        result = getattr(self.card, name)(*args)
+        if isinstance(result, memoryview):
+            # Buffer of the card, overwritten by the next call on the worker
+            result = bytes(result)
+        return result
+
+    def _run(self, key, name, job):
+        with self._lock:
+            if self._pending.get(key) is job:
+                del self._pending[key]
+            args = job[0]
+        return self._invoke(name, args)
+
+    def _call(self, name, args, merge):
+        with self._lock:
+            if merge is None:
+                # Not merged, and nothing is merged across it
+                self._epoch += 1
+                self._last_key = None
+                return asyncio.wrap_future(self._executor.submit(self._invoke, name, args))
+            if merge == _MERGE_SAME_ARGS:
+                key = (name, args, self._epoch)
+                job = self._pending.get(key)
+            else:
+                key = (_write_target(name, args),)
+                job = self._pending.get(key) if self._last_key == key else None
+                if job is None:
+                    self._epoch += 1
+            if job is None:
+                job = [args, None]
+                self._pending[key] = job
+                job[1] = self._executor.submit(self._run, key, name, job)
+            else:
+                job[0] = args
+            self._last_key = key
+        return asyncio.wrap_future(job[1])
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def batch(self):
+        """Async version of :meth:`multiio.SMmultiio.batch`.
+
+        Returns:
+            Async context manager
+        """
+        return _AsyncBatch(self)
+
+
+class _AsyncBatch:
+    def __init__(self, card):
+        self._card = card
+    async def __aenter__(self):
+        await self._card._call("_batch_begin", (), None)
+        return self._card
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._card._call("_batch_end", (exc_type is None,), None)
+
+
+def _make_method(name, merge):
+    method = getattr(SMmultiio, name)
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        # Keyword arguments as positional, so merged calls compare equal
+        args = signature.bind(self.card, *args, **kwargs).args[1:]
+        return await self._call(name, args, merge)
+    return wrapper
+
+
+for _name in dir(SMmultiio):
+    if _name.startswith("_") or _name == "batch" or not callable(getattr(SMmultiio, _name)):
+        continue
+    setattr(AsyncSMmultiio, _name, _make_method(_name, _merge_policy(_name)))
+del _name
@@ -0,0 +1,343 @@
+"""Bus cost benchmark of the public API against emulated cards.
+
+Every public :class:`multiio.SMmultiio` method and a few full-card scan
+scenarios are run against a ``multiio.emulator.EmulatedBus``. For each
+operation the benchmark reports:
+
+* SMBus transactions and bytes on the wire (exact, from the emulator)
+* Python time spent in the library per call, excluding the time spent
+  inside the bus object
+* Wall time per call at 100 kHz and 400 kHz: library time plus the wire
+  time of the transferred bytes (9 bits per byte, start/stop per message)
+
+Results are saved as JSON baselines; ``--compare`` flags operations that
+got more transactions or bytes, or slower beyond a tolerance::
+
+    $ python -m multiio.bench --output baseline.json
+    $ python -m multiio.bench --compare baseline.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import multiio.multiio_data as data
+from multiio import SMmultiio, discover
+from multiio.emulator import EmulatedBus
+
+SPEEDS = (100000, 400000)
+
+# Arguments of the benchmarked SMmultiio methods
+METHOD_ARGS = {
+    "calib_status": (),
+    "read_snapshot": (),
+    "get_hw_version": (),
+    "read_counters": (),
+    "read_registers": (),
+    "get_version": (),
+    "get_relay": (1,),
+    "get_all_relays": (),
+    "set_relay": (1, 1),
+    "set_all_relays": (3,),
+    "get_u_in": (1,),
+    "cal_u_in": (1, 5.0),
+    "get_u_out": (1,),
+    "set_u_out": (1, 2.5),
+    "cal_u_out": (1, 5.0),
+    "get_i_in": (1,),
+    "cal_i_in": (1, 12.0),
+    "get_i_out": (1,),
+    "set_i_out": (1, 12.0),
+    "cal_i_out": (1, 12.0),
+    "get_rtd_res": (1,),
+    "get_rtd_temp": (1,),
+    "cal_rtd_res": (1, 100.0),
+    "get_led": (1,),
+    "get_all_leds": (),
+    "set_led": (1, 1),
+    "set_all_leds": (5,),
+    "wdt_reload": (),
+    "wdt_get_period": (),
+    "wdt_set_period": (120,),
+    "wdt_get_init_period": (),
+    "wdt_set_init_period": (270,),
+    "wdt_get_off_period": (),
+    "wdt_set_off_period": (10,),
+    "wdt_get_reset_count": (),
+    "wdt_clear_reset_count": (),
+    "get_rtc": (),
+    "set_rtc": (2024, 1, 1, 12, 0, 0),
+    "get_opto": (1,),
+    "get_all_opto": (),
+    "get_opto_edge": (1,),
+    "set_opto_edge": (1, 3),
+    "get_opto_counter": (1,),
+    "reset_opto_counter": (1,),
+    "get_opto_encoder_state": (1,),
+    "set_opto_encoder_state": (1, 1),
+    "get_opto_encoder_counter": (1,),
+    "reset_opto_encoder_counter": (1,),
+    "get_opto_frequency": (1,),
+    "get_opto_pwm_fill": (1,),
+    "get_opto_pps": (1,),
+    "read_pulses": (),
+    "read_diagnostics": (),
+    "get_diag_temperature": (),
+    "get_diag_3v3": (),
+    "get_analog_type": (),
+    "get_servo": (1,),
+    "set_servo": (1, 30),
+    "get_motor": (),
+    "set_motor": (50,),
+    "get_button": (),
+    "get_button_latch": (),
+}
+
+# Methods configuring the instance rather than talking to the card
+_NOT_BENCHMARKED = ("close", "batch", "flush", "instrument", "record", "schedule",
+                    "enable_cache", "disable_cache", "refresh")
+
+
+def public_methods():
+    """Get the public SMmultiio methods the benchmark should cover."""
+    return sorted(name for name in dir(SMmultiio)
+                  if not name.startswith("_") and name not in _NOT_BENCHMARKED
+                  and callable(getattr(SMmultiio, name)))
+
+
+class _TimedBus:
+    # Accounts the time spent inside the bus to separate it from the
+    # library overhead
+    def __init__(self, bus):
+        self.bus = bus
+        self.seconds = 0.0
+
+
+def _timed(name):
+    def method(self, *args):
+        start = time.perf_counter()
+        try:
+            return getattr(self.bus, name)(*args)
+        finally:
+            self.seconds += time.perf_counter() - start
+    method.__name__ = name
+    return method
+
+
+for _name in ("read_byte", "write_byte", "write_quick", "read_byte_data", "write_byte_data",
+              "read_word_data", "write_word_data", "read_i2c_block_data",
+              "write_i2c_block_data", "write_block_data", "i2c_rdwr"):
+    setattr(_TimedBus, _name, _timed(_name))
+del _name
+
+
+def _scan_getters(card):
+    for kind, getter in (("u_in", card.get_u_in), ("i_in", card.get_i_in),
+                         ("u_out", card.get_u_out), ("i_out", card.get_i_out),
+                         ("rtd", card.get_rtd_temp), ("rtd", card.get_rtd_res),
+                         ("servo", card.get_servo), ("opto", card.get_opto),
+                         ("opto", card.get_opto_counter), ("opto_enc", card.get_opto_encoder_counter)):
+        for channel in range(1, data.CHANNEL_NO[kind] + 1):
+            getter(channel)
+    card.get_all_relays()
+    card.get_all_leds()
+    card.get_motor()
+
+
+def _scan_snapshot(card):
+    card.read_snapshot()
+    card.read_counters()
+
+
+def _scan_pulse_getters(card):
+    for channel in range(1, data.CHANNEL_NO["opto"] + 1):
+        card.get_opto_pps(channel)
+        card.get_opto_frequency(channel)
+        card.get_opto_pwm_fill(channel)
+    card.get_diag_temperature()
+    card.get_diag_3v3()
+
+
+def _scan_pulses(card):
+    card.read_pulses()
+    card.read_diagnostics()
+
+
+def _outputs(card):
+    for channel in (1, 2):
+        card.set_u_out(channel, 2.5)
+        card.set_i_out(channel, 12)
+        card.set_servo(channel, 30)
+    card.set_motor(50)
+
+
+def _outputs_batch(card):
+    with card.batch():
+        _outputs(card)
+
+
+def _stack_discover(card):
+    for found in discover(card._i2c_bus_no, card.bus):
+        found.card.close()
+
+
+# Scenario name -> (function of the card, open the card with rdwr, stacks)
+SCENARIOS = {
+    "scan_getters": (_scan_getters, False, (0,)),
+    "scan_snapshot": (_scan_snapshot, False, (0,)),
+    "scan_snapshot_rdwr": (_scan_snapshot, True, (0,)),
+    "scan_registers": (lambda card: card.read_registers(), False, (0,)),
+    "scan_registers_rdwr": (lambda card: card.read_registers(), True, (0,)),
+    "scan_pulse_getters": (_scan_pulse_getters, False, (0,)),
+    "scan_pulses": (_scan_pulses, False, (0,)),
+    "outputs": (_outputs, False, (0,)),
+    "outputs_batch": (_outputs_batch, False, (0,)),
+    "stack_discover": (_stack_discover, False, tuple(range(data.STACK_LEVEL_MAX + 1))),
+}
+
+
+def measure(fn, rdwr=False, stacks=(0,), iterations=200):
+    """Measure one operation.
+
+    Args:
+        fn (callable): Receives the card
+        rdwr (bool): Open the card with I2C_RDWR block reads
+        stacks (tuple): Emulated stack levels
+        iterations (int): Calls timed for the CPU figures
+
+    Returns:
+        (dict) transactions, bytes, cpu_us and wall_us_<speed> per call
+    """
+    bus = EmulatedBus(stacks=stacks)
+    timed = _TimedBus(bus)
+    card = SMmultiio(stacks[0], bus=timed, rdwr=rdwr)
+    fn(card)
+    bus.reset_counters()
+    fn(card)
+    result = {"transactions": bus.transactions, "bytes": bus.bytes_on_wire}
+    wire_bits = bus.bytes_on_wire * 9 + bus.transactions * 2
+    best = float("inf")
+    # Best of 3 rounds filters scheduler noise
+    for _ in range(3):
+        timed.seconds = 0.0
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(card)
+        elapsed = time.perf_counter() - start
+        best = min(best, (elapsed - timed.seconds) / iterations)
+    result["cpu_us"] = round(best * 1e6, 2)
+    for speed in SPEEDS:
+        result["wall_us_{}k".format(speed // 1000)] = round((best + wire_bits / speed) * 1e6, 2)
+    return result
+
+
+def run(iterations=200, select=None):
+    """Run the benchmark.
+
+    Args:
+        iterations (int): Calls timed per operation
+        select (str): Only run operations whose name contains this text
+
+    Returns:
+        (dict) Baseline: meta information and results by operation name
+    """
+    results = {}
+    missing = [name for name in public_methods() if name not in METHOD_ARGS]
+    for name in public_methods():
+        if name in missing or (select and select not in name):
+            continue
+        args = METHOD_ARGS[name]
+        results[name] = measure(lambda card, n=name, a=args: getattr(card, n)(*a), iterations=iterations)
+    for name, (fn, rdwr, stacks) in SCENARIOS.items():
+        if select and select not in name:
+            continue
+        results[name] = measure(fn, rdwr, stacks, iterations)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "iterations": iterations,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "not_benchmarked": missing,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance=0.25):
+    """Find regressions of a run against a baseline.
+
+    Transactions and bytes are exact and regress on any increase; CPU time
+    regresses when slower than the baseline by more than ``tolerance``.
+
+    Args:
+        baseline (dict): Result of :func:`run` saved earlier
+        current (dict): Result of :func:`run`
+        tolerance (float): Allowed relative CPU time increase
+
+    Returns:
+        (list) Regression descriptions, empty if none
+    """
+    regressions = []
+    for name, old in sorted(baseline["results"].items()):
+        new = current["results"].get(name)
+        if new is None:
+            regressions.append("{}: not measured".format(name))
+            continue
+        for key in ("transactions", "bytes"):
+            if new[key] > old[key]:
+                regressions.append("{}: {} {} -> {}".format(name, key, old[key], new[key]))
+        if new["cpu_us"] > old["cpu_us"] * (1 + tolerance):
+            regressions.append("{}: cpu_us {} -> {}".format(name, old["cpu_us"], new["cpu_us"]))
+    for name in current["meta"].get("not_benchmarked", []):
+        regressions.append("{}: public method without benchmark arguments".format(name))
+    return regressions
+
+
+def format_table(current, baseline=None):
+    """Format results as a text table, with baseline deltas if given."""
+    speeds = ["wall_us_{}k".format(speed // 1000) for speed in SPEEDS]
+    lines = ["{:<28} {:>5} {:>6} {:>9} {:>12} {:>12}".format(
+        "operation", "trans", "bytes", "cpu_us", *speeds)]
+    for name, r in sorted(current["results"].items()):
+        line = "{:<28} {:>5} {:>6} {:>9} {:>12} {:>12}".format(
+            name, r["transactions"], r["bytes"], r["cpu_us"], *[r[s] for s in speeds])
+        old = baseline and baseline["results"].get(name)
+        if old and old["cpu_us"]:
+            line += " {:+6.1f}%".format((r["cpu_us"] / old["cpu_us"] - 1) * 100)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="{} library bus cost benchmark".format(data.CARD_NAME))
+    parser.add_argument("--iterations", type=int, default=200, help="calls timed per operation")
+    parser.add_argument("--select", help="only run operations containing this text")
+    parser.add_argument("--output", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative CPU time increase")
+    args = parser.parse_args(argv)
+    current = run(args.iterations, args.select)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(format_table(current, baseline))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=1, sort_keys=True)
+    if baseline is not None:
+        if args.select:
+            baseline = dict(baseline, results={k: v for k, v in baseline["results"].items()
+                                               if args.select in k})
+        regressions = compare(baseline, current, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Shadow copy of the card configuration registers.
+
+Configuration registers (revisions, opto edge/encoder masks, watchdog
+periods) only change when the host writes them, so :class:`ShadowCache`
+keeps a copy and serves reads from it according to a per-register policy.
+Enable it with :meth:`multiio.SMmultiio.enable_cache`.
+"""
+
+import collections
+import time
+
+import multiio.multiio_data as data
+I2C_MEM = data.I2C_MEM
+
+
+class CachePolicy(collections.namedtuple("CachePolicy", ["ttl", "write_through"])):
+    """Caching rule of one register.
+
+    Args:
+        ttl (float): Seconds a read value stays valid, None to never expire
+        write_through (bool): Update the copy on writes; if False a write
+            invalidates it and the next read goes to the card
+    """
+    __slots__ = ()
+
+
+NEVER_EXPIRE = CachePolicy(None, True)
+INVALIDATE_ON_WRITE = CachePolicy(None, False)
+
+
+def ttl(seconds, write_through=True):
+    """Policy for values that expire after some time.
+
+    Args:
+        seconds (float): Time to live
+        write_through (bool): See :class:`CachePolicy`
+
+    Returns:
+        (CachePolicy) Policy
+    """
+    return CachePolicy(seconds, write_through)
+
+
+# register -> (size, policy)
+DEFAULT_POLICIES = {
+    I2C_MEM.REVISION_HW_MAJOR_ADD: (1, NEVER_EXPIRE),
+    I2C_MEM.REVISION_HW_MINOR_ADD: (1, NEVER_EXPIRE),
+    I2C_MEM.REVISION_MAJOR_ADD: (1, NEVER_EXPIRE),
+    I2C_MEM.REVISION_MINOR_ADD: (1, NEVER_EXPIRE),
+    I2C_MEM.OPTO_IT_RISING_ADD: (1, NEVER_EXPIRE),
+    I2C_MEM.OPTO_IT_FALLING_ADD: (1, NEVER_EXPIRE),
+    I2C_MEM.OPTO_ENC_ENABLE_ADD: (1, NEVER_EXPIRE),
+    # The firmware may clamp watchdog periods, re-read them after a write
+    I2C_MEM.WDT_INTERVAL_GET_ADD: (2, INVALIDATE_ON_WRITE),
+    I2C_MEM.WDT_INIT_INTERVAL_GET_ADD: (2, INVALIDATE_ON_WRITE),
+    I2C_MEM.WDT_POWER_OFF_INTERVAL_GET_ADD: (4, INVALIDATE_ON_WRITE),
+}
+
+# Registers written through a separate set address: set -> get
+WRITE_ALIASES = {
+    I2C_MEM.WDT_INTERVAL_SET_ADD: I2C_MEM.WDT_INTERVAL_GET_ADD,
+    I2C_MEM.WDT_INIT_INTERVAL_SET_ADD: I2C_MEM.WDT_INIT_INTERVAL_GET_ADD,
+    I2C_MEM.WDT_POWER_OFF_INTERVAL_SET_ADD: I2C_MEM.WDT_POWER_OFF_INTERVAL_GET_ADD,
+}
+
+
+class ShadowCache:
+    """Byte copy of cached registers with load timestamps.
+
+    Args:
+        policies (dict): register -> (size, CachePolicy), ``DEFAULT_POLICIES``
+            if None
+    """
+    def __init__(self, policies=None):
+        if policies is None:
+            policies = DEFAULT_POLICIES
+        self.policies = dict(policies)
+        self.hits = 0
+        self.misses = 0
+        self._mem = bytearray(I2C_MEM.SLAVE_BUFF_SIZE + 1)
+        self._loaded = {}
+        self._owner = {}
+        for register, (size, _) in self.policies.items():
+            for address in range(register, register + size):
+                self._owner[address] = register
+
+    def __contains__(self, address):
+        return address in self._owner
+
+    def lookup(self, address, size):
+        """Get cached bytes.
+
+        Args:
+            address (int): Start address
+            size (int): Number of bytes
+
+        Returns:
+            (bytes) Cached content or None if any byte is missing or expired
+        """
+        now = None
+        for register in {self._owner.get(a) for a in range(address, address + size)}:
+            loaded = self._loaded.get(register)
+            if loaded is None:
+                self.misses += 1
+                return None
+            expire = self.policies[register][1].ttl
+            if expire is not None:
+                if now is None:
+                    now = time.monotonic()
+                if now - loaded > expire:
+                    self.misses += 1
+                    return None
+        self.hits += 1
+        return bytes(self._mem[address:address + size])
+
+    def store(self, address, payload):
+        """Record bytes read from the card.
+
+        Args:
+            address (int): Start address
+            payload (bytes): Bytes read
+        """
+        now = time.monotonic()
+        end = address + len(payload)
+        self._mem[address:end] = payload
+        for a in range(address, end):
+            register = self._owner.get(a)
+            if register == a and register + self.policies[register][0] <= end:
+                self._loaded[register] = now
+
+    def written(self, address, payload):
+        """Apply a write sent to the card.
+
+        Args:
+            address (int): Start address
+            payload (bytes): Bytes written
+        """
+        address = WRITE_ALIASES.get(address, address)
+        now = time.monotonic()
+        for a in range(address, address + len(payload)):
+            register = self._owner.get(a)
+            if register is None:
+                continue
+            size, policy = self.policies[register]
+            if policy.write_through and register >= address and register + size <= address + len(payload):
+                self._mem[register:register + size] = payload[register - address:register - address + size]
+                self._loaded[register] = now
+            else:
+                self._loaded.pop(register, None)
+
+    def invalidate(self, address=None):
+        """Drop cached values.
+
+        Args:
+            address (int): Register to drop, all if None
+        """
+        if address is None:
+            self._loaded.clear()
+        else:
+            self._loaded.pop(self._owner.get(address), None)
+
+    def ranges(self):
+        """Get the cached registers merged into contiguous ranges.
+
+        Returns:
+            (list) (address, size) tuples
+        """
+        out = []
+        for address in sorted(self._owner):
+            if out and out[-1][0] + out[-1][1] == address:
+                out[-1][1] += 1
+            else:
+                out.append([address, 1])
+        return [tuple(r) for r in out]
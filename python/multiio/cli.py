@@ -0,0 +1,257 @@
+"""Command line interface running many operations in one process.
+
+``run`` executes a script of :class:`multiio.SMmultiio` calls, one per
+line, from a file or stdin, opening each card once::
+
+    $ cat setup.txt
+    # [stack] method args...
+    0 set_opto_edge 1 1
+    0 reset_opto_counter 1
+    set_relay 1 1
+    sleep 0.1
+    get_opto_counter 1
+    $ multiio-py run setup.txt --format csv
+
+``watch`` streams bulk snapshots of one or more cards at a fixed rate::
+
+    $ multiio-py watch --stack 0 1 --rate 20 --counters
+"""
+
+import argparse
+import csv
+import json
+import shlex
+import sys
+import time
+
+import multiio.multiio_data as data
+from multiio import SMmultiio
+from multiio.serialize import to_json
+
+# SMmultiio methods scripts may not call
+_NOT_SCRIPTABLE = ("batch", "close", "instrument", "record", "schedule")
+
+
+def _parse_value(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _flatten(prefix, value, row):
+    # Snapshot/Counters fields to CSV columns, tuples as name1, name2, ...
+    if hasattr(value, "_asdict"):
+        for k, v in value._asdict().items():
+            _flatten(k, v, row)
+    elif isinstance(value, (tuple, list)):
+        for i, v in enumerate(value):
+            _flatten("{}{}".format(prefix, i + 1), v, row)
+    else:
+        row[prefix] = value
+    return row
+
+
+class _Cards:
+    # Cards opened on first use and kept for the whole run
+    def __init__(self, i2c, bus):
+        self.i2c = i2c
+        self.bus = bus
+        self.cards = {}
+
+    def __getitem__(self, stack):
+        card = self.cards.get(stack)
+        if card is None:
+            card = SMmultiio(stack, self.i2c, self.bus)
+            self.cards[stack] = card
+        return card
+
+    def close(self):
+        for card in self.cards.values():
+            card.close()
+
+
+def parse_script(lines, stack=0):
+    """Parse script lines into operations.
+
+    Each line is ``[stack] method args...`` or ``sleep seconds``; empty
+    lines and ``#`` comments are skipped. Numeric arguments are converted
+    to int or float.
+
+    Args:
+        lines: Iterable of script lines
+        stack (int): Stack used by lines without one
+
+    Returns:
+        (list) (line number, stack, method, args) tuples
+    """
+    operations = []
+    for number, line in enumerate(lines, 1):
+        words = shlex.split(line, comments=True)
+        if not words:
+            continue
+        op_stack = stack
+        if words[0].isdigit():
+            op_stack = int(words.pop(0))
+        if not words:
+            raise ValueError("Line {}: missing method!".format(number))
+        method, args = words[0], [_parse_value(w) for w in words[1:]]
+        if method == "sleep":
+            if len(args) != 1:
+                raise ValueError("Line {}: sleep takes one argument!".format(number))
+        elif (method.startswith("_") or method in _NOT_SCRIPTABLE
+                or not callable(getattr(SMmultiio, method, None))):
+            raise ValueError("Line {}: invalid method {}!".format(number, method))
+        operations.append((number, op_stack, method, args))
+    return operations
+
+
+def run_script(operations, cards, out, fmt="json", keep_going=False):
+    """Execute parsed operations and write one result record per call.
+
+    Args:
+        operations (list): Result of :func:`parse_script`
+        cards: Mapping stack -> SMmultiio
+        out: Text stream for the results
+        fmt (str): "json" (one object per line) or "csv"
+        keep_going (bool): Record errors and continue instead of stopping
+
+    Returns:
+        (int) Number of failed operations
+    """
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(["line", "stack", "method", "args", "result", "error"])
+    failed = 0
+    for number, stack, method, args in operations:
+        if method == "sleep":
+            time.sleep(args[0])
+            continue
+        result = error = None
+        try:
+            result = to_json(getattr(cards[stack], method)(*args))
+        except (OSError, IOError, ValueError, TypeError) as e:
+            failed += 1
+            error = str(e)
+        if writer is not None:
+            if isinstance(result, (dict, list)):
+                result = json.dumps(result)
+            writer.writerow([number, stack, method, " ".join(str(a) for a in args),
+                             "" if result is None else result, error or ""])
+        else:
+            record = {"line": number, "stack": stack, "method": method, "args": args, "result": result}
+            if error is not None:
+                record["error"] = error
+            out.write(json.dumps(record) + "\n")
+        out.flush()
+        if error is not None and not keep_going:
+            break
+    return failed
+
+
+def watch(cards, stacks, rate, out, fmt="json", counters=False, count=None):
+    """Stream card snapshots at a fixed rate.
+
+    Each sample is one record per card with the Unix timestamp, the stack
+    level and the snapshot fields (and counters if requested).
+
+    Args:
+        cards: Mapping stack -> SMmultiio
+        stacks (list): Stack levels to sample
+        rate (float): Samples per second
+        out: Text stream for the records
+        fmt (str): "json" (one object per line) or "csv"
+        counters (bool): Also read the opto and encoder counters
+        count (int): Number of samples, unlimited if None
+    """
+    period = 1.0 / rate
+    writer = None
+    next_time = time.monotonic()
+    sample = 0
+    while count is None or sample < count:
+        timestamp = time.time()
+        for stack in stacks:
+            try:
+                card = cards[stack]
+                snapshot = card.read_snapshot()
+                card_counters = card.read_counters() if counters else None
+            except (OSError, IOError) as e:
+                sys.stderr.write("Stack {}: {}\n".format(stack, e))
+                continue
+            if fmt == "csv":
+                row = _flatten("", snapshot, {"timestamp": timestamp, "stack": stack})
+                if card_counters is not None:
+                    _flatten("opto_count", card_counters.opto, row)
+                    _flatten("encoder", card_counters.encoder, row)
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+            else:
+                record = {"timestamp": timestamp, "stack": stack}
+                record.update(to_json(snapshot))
+                if card_counters is not None:
+                    record["counters"] = to_json(card_counters)
+                out.write(json.dumps(record) + "\n")
+        out.flush()
+        sample += 1
+        next_time += period
+        now = time.monotonic()
+        if next_time < now:
+            next_time = now
+        time.sleep(next_time - now)
+
+
+def main(argv=None):
+    """Entry point of the ``multiio-py`` command."""
+    parser = argparse.ArgumentParser(prog="multiio-py", description="{} command line".format(data.CARD_NAME))
+    parser.add_argument("--i2c", type=int, default=1, help="i2c bus number")
+    parser.add_argument("--format", choices=("json", "csv"), default="json", help="output format")
+    parser.add_argument("--emulate", action="store_true",
+                        help="use emulated cards (multiio.emulator) instead of the i2c bus")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    run_parser = commands.add_parser("run", help="run a script of operations")
+    run_parser.add_argument("script", nargs="?", default="-", help="script file, - for stdin")
+    run_parser.add_argument("--stack", type=int, default=0, help="stack of lines without one")
+    run_parser.add_argument("--keep-going", action="store_true", help="continue after failed operations")
+    watch_parser = commands.add_parser("watch", help="stream card snapshots")
+    watch_parser.add_argument("--stack", type=int, nargs="+", default=[0], help="stack levels")
+    watch_parser.add_argument("--rate", type=float, default=10.0, help="samples per second")
+    watch_parser.add_argument("--count", type=int, help="number of samples")
+    watch_parser.add_argument("--counters", action="store_true", help="include opto and encoder counters")
+    args = parser.parse_args(argv)
+
+    bus = None
+    if args.emulate:
+        from multiio.emulator import EmulatedBus
+        bus = EmulatedBus(stacks=range(data.STACK_LEVEL_MAX + 1))
+    cards = _Cards(args.i2c, bus)
+    try:
+        if args.command == "run":
+            if args.script == "-":
+                lines = sys.stdin.readlines()
+            else:
+                with open(args.script) as f:
+                    lines = f.readlines()
+            try:
+                operations = parse_script(lines, args.stack)
+            except ValueError as e:
+                parser.exit(2, "{}\n".format(e))
+            failed = run_script(operations, cards, sys.stdout, args.format, args.keep_going)
+            return 1 if failed else 0
+        if args.rate <= 0:
+            parser.error("Invalid rate!")
+        watch(cards, args.stack, args.rate, sys.stdout, args.format, args.counters, args.count)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cards.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""Columnar storage of raw card snapshots with vectorized unit conversion.
+
+Each read stores the raw register bytes of a card in preallocated buffers;
+decoding and scaling run once per column over all rows (with NumPy when
+installed) instead of once per value::
+
+    >>> table = ColumnTable(capacity=10000, counters=True)
+    >>> for _ in range(1000):
+    ...     table.read(card)
+    >>> table.columns()["u_in1"]
+    array([4.5  , 4.501, ...])
+    >>> frame = table.to_pandas()
+
+Column names are the ones of ``multiio-py watch --format csv``: relays,
+leds, opto, analog_type, u_in1, u_in2, ..., rtd_res2 and, with counters,
+opto_count1..4 and encoder1..2. NumPy is optional; without it columns are
+``array.array`` objects and the NumPy, Pandas and Arrow exports raise
+ImportError.
+"""
+
+import array
+import struct
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import multiio.multiio_data as data
+from multiio import registers
+from multiio.snapshot import SNAPSHOT_ADDRESS, SNAPSHOT_SIZE, COUNTERS_ADDRESS, COUNTERS_SIZE
+I2C_MEM = data.I2C_MEM
+
+# struct type -> NumPy type, little endian
+_NUMPY_TYPES = {"B": "u1", "H": "<u2", "h": "<i2", "I": "<u4", "i": "<i4", "f": "<f4"}
+
+
+class Layout:
+    """Named columns of a raw register block.
+
+    Args:
+        address (int): Card address of the block
+        size (int): Block size in bytes
+        fields (list): (name, address, struct type, scale) of each column
+
+    Attributes:
+        names (tuple): Column names in address order
+        fields (tuple): (name, offset in the block, struct type, scale) of each column
+        struct (struct.Struct): Codec of one block
+        dtype (numpy.dtype): Structured type of one block, None without NumPy
+    """
+    def __init__(self, address, size, fields):
+        fields = sorted(fields, key=lambda field: field[1])
+        self.address = address
+        self.size = size
+        self.names = tuple(field[0] for field in fields)
+        self.fields = tuple((name, field_address - address, fmt, scale)
+                            for name, field_address, fmt, scale in fields)
+        self.scales = tuple(field[3] for field in fields)
+        fmt, end = "<", address
+        for _, field_address, field_fmt, _ in fields:
+            fmt += "{}x{}".format(field_address - end, field_fmt) if field_address > end else field_fmt
+            end = field_address + struct.calcsize("<" + field_fmt)
+        fmt += "{}x".format(address + size - end) if end < address + size else ""
+        self.struct = struct.Struct(fmt)
+        self.dtype = None
+        if numpy is not None:
+            self.dtype = numpy.dtype({
+                "names": list(self.names),
+                "formats": [_NUMPY_TYPES[field[2]] for field in fields],
+                "offsets": [field[1] - address for field in fields],
+                "itemsize": size,
+            })
+        self._floats = tuple(field[2] == "f" or field[3] != 1 for field in fields)
+
+    def decode(self, buf, count=None, use_numpy=None):
+        """Decode consecutive raw blocks into scaled columns.
+
+        Scaled and float registers give float64 columns in the units of
+        the single-channel getters; the others keep their integer values.
+
+        Args:
+            buf: Buffer holding the blocks back to back
+            count (int): Number of blocks, all whole blocks in buf if None
+            use_numpy (bool): Decode with NumPy, by default if installed
+
+        Returns:
+            (dict) Column name -> NumPy array, or ``array.array`` without NumPy
+        """
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        if count is None:
+            count = len(buf) // self.size
+        if use_numpy:
+            raw = numpy.frombuffer(buf, dtype=self.dtype, count=count)
+            columns = {}
+            for name, scale, is_float in zip(self.names, self.scales, self._floats):
+                if scale != 1:
+                    columns[name] = raw[name] / scale
+                elif is_float:
+                    columns[name] = raw[name].astype(numpy.float64)
+                else:
+                    columns[name] = raw[name].copy()
+            return columns
+        rows = self.struct.iter_unpack(memoryview(buf)[:count * self.size])
+        values = zip(*rows) if count else [()] * len(self.names)
+        columns = {}
+        for name, scale, is_float, column in zip(self.names, self.scales, self._floats, values):
+            if scale != 1:
+                columns[name] = array.array("d", [value / scale for value in column])
+            else:
+                columns[name] = array.array("d" if is_float else "q", column)
+        return columns
+
+
+def _register_fields(register):
+    if register.count == 1:
+        return [(register.name, register.address, register.fmt, register.scale)]
+    return [(register.name + str(channel), address, register.fmt, register.scale)
+            for channel, address in sorted(register.addresses.items())]
+
+
+# Block read by SMmultiio.read_snapshot()
+SNAPSHOT_LAYOUT = Layout(SNAPSHOT_ADDRESS, SNAPSHOT_SIZE, [
+    ("relays", I2C_MEM.RELAYS, "B", 1),
+    ("leds", I2C_MEM.LEDS, "B", 1),
+    ("opto", I2C_MEM.OPTO, "B", 1),
+    ("analog_type", I2C_MEM.ANALOG_TYPE, "B", 1),
+] + [field for register in (registers.U_IN, registers.I_IN, registers.U_OUT, registers.I_OUT,
+                            registers.MOTOR, registers.SERVO, registers.RTD_TEMP, registers.RTD_RES)
+     for field in _register_fields(register)])
+assert SNAPSHOT_LAYOUT.struct.size == SNAPSHOT_SIZE
+
+# Block read by SMmultiio.read_counters(), named like the CSV output of the cli
+COUNTERS_LAYOUT = Layout(COUNTERS_ADDRESS, COUNTERS_SIZE, [
+    ("opto_count{}".format(channel), address, "I", 1)
+    for channel, address in sorted(registers.OPTO_COUNTER.addresses.items())
+] + [
+    ("encoder{}".format(channel), address, "i", 1)
+    for channel, address in sorted(registers.ENCODER_COUNTER.addresses.items())
+])
+assert COUNTERS_LAYOUT.struct.size == COUNTERS_SIZE
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("NumPy is not installed!")
+
+
+class ColumnTable:
+    """Preallocated rows of raw card snapshots, decoded column-wise.
+
+    Every row holds a timestamp, the card stack level, the raw snapshot
+    block and optionally the raw counters block. Rows are only copied from
+    the bus buffers, so reading stays as cheap as :meth:`SMmultiio.read_snapshot`
+    without the decoding.
+
+    Args:
+        capacity (int): Maximum number of rows
+        counters (bool): Also read the opto and encoder counters
+        use_numpy (bool): Decode with NumPy, by default if installed
+
+    Attributes:
+        count (int): Number of stored rows
+    """
+    def __init__(self, capacity=4096, counters=False, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        if use_numpy:
+            _require_numpy()
+        self.capacity = capacity
+        self.counters = counters
+        self.count = 0
+        self._numpy = use_numpy
+        self._times = array.array("d", bytes(8 * capacity))
+        self._stacks = bytearray(capacity)
+        self._snapshots = memoryview(bytearray(SNAPSHOT_SIZE * capacity))
+        self._counters = memoryview(bytearray(COUNTERS_SIZE * capacity if counters else 0))
+
+    def __len__(self):
+        return self.count
+
+    def _next_row(self):
+        if self.count >= self.capacity:
+            raise IndexError("Column table is full!")
+        return self.count
+
+    def read(self, card, timestamp=None):
+        """Read the snapshot (and counters) of a card into the next row.
+
+        Args:
+            card (SMmultiio): Card to read
+            timestamp (float): Row time, ``time.time()`` if None
+
+        Returns:
+            (int) Row index
+        """
+        row = self._next_row()
+        card._read_into(SNAPSHOT_ADDRESS, self._snapshots[row * SNAPSHOT_SIZE:(row + 1) * SNAPSHOT_SIZE])
+        if self.counters:
+            card._read_into(COUNTERS_ADDRESS, self._counters[row * COUNTERS_SIZE:(row + 1) * COUNTERS_SIZE])
+        self._times[row] = time.time() if timestamp is None else timestamp
+        self._stacks[row] = card._hw_address_ - data.SLAVE_OWN_ADDRESS_BASE
+        self.count += 1
+        return row
+
+    def append(self, stack, timestamp, snapshot, counters=None):
+        """Store raw blocks read elsewhere (e.g. ``SMmultiio.read_registers``).
+
+        Args:
+            stack (int): Card stack level
+            timestamp (float): Row time
+            snapshot: SNAPSHOT_SIZE bytes from SNAPSHOT_ADDRESS
+            counters: COUNTERS_SIZE bytes from COUNTERS_ADDRESS, required
+                when the table stores counters
+
+        Returns:
+            (int) Row index
+        """
+        if len(snapshot) != SNAPSHOT_SIZE or (self.counters and (counters is None or len(counters) != COUNTERS_SIZE)):
+            raise ValueError("Invalid raw block size!")
+        row = self._next_row()
+        self._snapshots[row * SNAPSHOT_SIZE:(row + 1) * SNAPSHOT_SIZE] = snapshot
+        if self.counters:
+            self._counters[row * COUNTERS_SIZE:(row + 1) * COUNTERS_SIZE] = counters
+        self._times[row] = timestamp
+        self._stacks[row] = stack
+        self.count += 1
+        return row
+
+    def clear(self):
+        """Drop all rows, keeping the buffers."""
+        self.count = 0
+
+    def raw(self):
+        """Get the raw snapshot (and counter) rows without copying.
+
+        The views change with the next :meth:`read` or :meth:`clear`.
+
+        Returns:
+            (tuple) (snapshots, counters): NumPy structured arrays of
+                SNAPSHOT_LAYOUT.dtype and COUNTERS_LAYOUT.dtype (None
+                without counters)
+        """
+        _require_numpy()
+        snapshots = numpy.frombuffer(self._snapshots, dtype=SNAPSHOT_LAYOUT.dtype, count=self.count)
+        counters = None
+        if self.counters:
+            counters = numpy.frombuffer(self._counters, dtype=COUNTERS_LAYOUT.dtype, count=self.count)
+        return snapshots, counters
+
+    def columns(self):
+        """Decode all rows.
+
+        Returns:
+            (dict) Column name -> values of all rows: timestamp, stack, the
+                SNAPSHOT_LAYOUT columns and, with counters, the
+                COUNTERS_LAYOUT columns
+        """
+        n = self.count
+        if self._numpy:
+            columns = {
+                "timestamp": numpy.array(self._times[:n], dtype=numpy.float64),
+                "stack": numpy.frombuffer(self._stacks, dtype=numpy.uint8, count=n).copy(),
+            }
+        else:
+            columns = {"timestamp": self._times[:n], "stack": array.array("B", self._stacks[:n])}
+        columns.update(SNAPSHOT_LAYOUT.decode(self._snapshots, n, self._numpy))
+        if self.counters:
+            columns.update(COUNTERS_LAYOUT.decode(self._counters, n, self._numpy))
+        return columns
+
+    def to_numpy(self):
+        """Get the decoded rows as one NumPy structured array.
+
+        Returns:
+            (numpy.ndarray) One record per row, fields named like :meth:`columns`
+        """
+        _require_numpy()
+        columns = self.columns()
+        table = numpy.empty(self.count, dtype=[(name, numpy.asarray(column).dtype)
+                                               for name, column in columns.items()])
+        for name, column in columns.items():
+            table[name] = column
+        return table
+
+    def to_pandas(self):
+        """Get the decoded rows as a ``pandas.DataFrame`` (requires pandas)."""
+        import pandas
+        return pandas.DataFrame(self.columns())
+
+    def to_arrow(self):
+        """Get the decoded rows as a ``pyarrow.Table`` (requires pyarrow)."""
+        import pyarrow
+        columns = self.columns()
+        return pyarrow.table({name: numpy.asarray(column) if numpy is not None else list(column)
+                              for name, column in columns.items()})
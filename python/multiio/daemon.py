@@ -0,0 +1,587 @@
+"""Bus owner daemon sharing card snapshots with local processes.
+
+One :class:`MultiioDaemon` process owns the i2c bus. It reads the snapshot
+and counters of every card at a fixed period into a memory mapped segment
+protected by a sequence lock, and runs other calls (writes, RTC, watchdog,
+...) sent over a Unix socket. Any number of processes then use
+:class:`MultiioClient`, which has the :class:`multiio.SMmultiio` method names
+and serves the snapshot values from the segment without bus time::
+
+    $ python -m multiio.daemon --i2c 1 --period 0.05
+
+    >>> card = MultiioClient(stack=0)
+    >>> card.get_u_in(1)          # shared memory
+    >>> card.set_u_out(1, 2.5)    # socket request to the daemon
+"""
+
+import argparse
+import errno
+import grp
+import json
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import multiio.multiio_data as data
+from multiio import SMmultiio, discover, _Batch
+from multiio.snapshot import Snapshot, SNAPSHOT_ADDRESS, SNAPSHOT_SIZE
+from multiio.snapshot import Counters, COUNTERS_ADDRESS, COUNTERS_SIZE
+from multiio.snapshot import Pulses, Diagnostics
+from multiio.serialize import to_json
+CHANNEL_NO = data.CHANNEL_NO
+
+_MAGIC = b"MIOS"
+_VERSION = 1
+# magic, version, slots, slot size
+_HEADER = struct.Struct("<4sHHI")
+# seq, errors, timestamp (monotonic), present
+_SLOT = struct.Struct("<IIdB7x")
+_SLOT_SNAPSHOT = _SLOT.size
+_SLOT_COUNTERS = _SLOT_SNAPSHOT + SNAPSHOT_SIZE
+SLOT_SIZE = (_SLOT_COUNTERS + COUNTERS_SIZE + 7) & ~7
+SLOTS = data.STACK_LEVEL_MAX + 1
+SEGMENT_SIZE = _HEADER.size + SLOTS * SLOT_SIZE
+_SEQ = struct.Struct("<I")
+# Reads of a slot the writer keeps busy before giving up (about 0.1 s); only
+# a writer that died while publishing holds a slot that long
+READ_RETRIES = 1000
+
+# SMmultiio methods that configure the daemon side card and are not served
+_NOT_SERVED = ("batch", "flush", "close", "instrument", "record", "schedule",
+               "enable_cache", "disable_cache", "refresh")
+
+
+def default_paths(i2c=1):
+    """Get the default shared segment and socket paths of a bus.
+
+    Returns:
+        (tuple) (segment path, socket path)
+    """
+    return ("/dev/shm/multiio-i2c-{}".format(i2c),
+            "/tmp/multiio-i2c-{}.sock".format(i2c))
+
+
+class SnapshotSegment:
+    """Memory mapped table of card snapshots, one slot per stack level.
+
+    A single writer updates a slot between two increments of its sequence
+    counter; readers retry while the counter is odd or changed, so they never
+    see a half written slot and never block the writer.
+
+    Args:
+        path (str): Segment file, usually in /dev/shm
+        create (bool): Create (or reset) the segment for writing
+        mode (int): Permissions of a created segment
+    """
+    def __init__(self, path, create=False, mode=0o644):
+        self.path = path
+        if create:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, mode)
+            os.fchmod(fd, mode)
+            os.ftruncate(fd, SEGMENT_SIZE)
+            self._mm = mmap.mmap(fd, SEGMENT_SIZE)
+            self._mm[:] = bytes(SEGMENT_SIZE)
+            _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, SLOTS, SLOT_SIZE)
+        else:
+            fd = os.open(path, os.O_RDONLY)
+            self._mm = mmap.mmap(fd, SEGMENT_SIZE, access=mmap.ACCESS_READ)
+            magic, version, slots, slot_size = _HEADER.unpack_from(self._mm, 0)
+            if (magic, version, slots, slot_size) != (_MAGIC, _VERSION, SLOTS, SLOT_SIZE):
+                self._mm.close()
+                os.close(fd)
+                raise ValueError("Invalid snapshot segment {}!".format(path))
+        os.close(fd)
+        self._view = memoryview(self._mm)
+
+    def close(self):
+        """Unmap the segment."""
+        self._view.release()
+        self._mm.close()
+
+    def _offset(self, stack):
+        return _HEADER.size + stack * SLOT_SIZE
+
+    def publish(self, stack, snapshot_buf, counters_buf, errors=0):
+        """Write the raw registers of one card (writer side).
+
+        Args:
+            stack (int): Stack level
+            snapshot_buf: SNAPSHOT_SIZE register bytes, None to mark the card absent
+            counters_buf: COUNTERS_SIZE register bytes
+            errors (int): Failed reads of the card so far
+        """
+        offset = self._offset(stack)
+        seq = _SEQ.unpack_from(self._mm, offset)[0]
+        _SEQ.pack_into(self._mm, offset, (seq + 1) & 0xffffffff)
+        if snapshot_buf is None:
+            _SLOT.pack_into(self._mm, offset, seq + 1, errors, time.monotonic(), 0)
+        else:
+            self._view[offset + _SLOT_SNAPSHOT:offset + _SLOT_SNAPSHOT + SNAPSHOT_SIZE] = snapshot_buf
+            self._view[offset + _SLOT_COUNTERS:offset + _SLOT_COUNTERS + COUNTERS_SIZE] = counters_buf
+            _SLOT.pack_into(self._mm, offset, seq + 1, errors, time.monotonic(), 1)
+        _SEQ.pack_into(self._mm, offset, (seq + 2) & 0xffffffff)
+
+    def read(self, stack):
+        """Read the latest state of one card (reader side).
+
+        Args:
+            stack (int): Stack level
+
+        Returns:
+            (tuple) (Snapshot, Counters, timestamp); timestamp is the
+                time.monotonic() of the publication
+
+        Raises:
+            OSError: EBUSY if the slot stays busy for READ_RETRIES reads,
+                ENODEV if the card is not served
+        """
+        offset = self._offset(stack)
+        for _ in range(READ_RETRIES):
+            seq, errors, timestamp, present = _SLOT.unpack_from(self._mm, offset)
+            if seq & 1:
+                time.sleep(0.0001)
+                continue
+            if present:
+                snapshot = Snapshot.from_buffer(self._mm, offset + _SLOT_SNAPSHOT)
+                counters = Counters.from_buffer(self._mm, offset + _SLOT_COUNTERS)
+            if _SEQ.unpack_from(self._mm, offset)[0] == seq:
+                break
+        else:
+            raise OSError(errno.EBUSY, "Snapshot of card {} is never complete, "
+                          "the daemon stopped while publishing".format(stack))
+        if not present:
+            raise OSError(errno.ENODEV, "Card {} not served by the daemon".format(stack))
+        return snapshot, counters, timestamp
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = self.server.daemon.call(request["stack"], request.get("calls")
+                                                 or [(request["method"], request.get("args", []))])
+                response = json.dumps({"result": to_json(result)})
+            except (ValueError, KeyError, TypeError) as e:
+                response = json.dumps({"error": "ValueError", "message": str(e)})
+            except (OSError, IOError) as e:
+                response = json.dumps({"error": "OSError", "errno": e.errno, "message": str(e)})
+            self.wfile.write(response.encode() + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MultiioDaemon:
+    """Own the bus, publish card snapshots and run calls of client processes.
+
+    Args:
+        cards (list): SMmultiio cards, every card found with
+            :func:`multiio.discover` if None
+        period (float): Snapshot publication period in seconds
+        i2c (int): i2c bus number
+        bus: SMBus compatible backend used when cards is None
+        segment_path (str): Shared segment file, see :func:`default_paths`
+        socket_path (str): Unix socket path, see :func:`default_paths`
+        socket_mode (int): Permissions of the socket; the segment gets the
+            matching read permissions. Owner only by default
+        socket_group (str or int): Group name or id given the socket and the
+            segment, e.g. with ``socket_mode=0o660``; None to keep the group
+            of the daemon
+
+    Attributes:
+        publications (int): Snapshot cycles published
+        calls (int): Calls run for clients
+    """
+    def __init__(self, cards=None, period=0.05, i2c=1, bus=None, segment_path=None, socket_path=None,
+                 socket_mode=0o600, socket_group=None):
+        default_segment, default_socket = default_paths(i2c)
+        if cards is None:
+            cards = [found.card for found in discover(i2c, bus)]
+        self.cards = {card._hw_address_ - data.SLAVE_OWN_ADDRESS_BASE: card for card in cards}
+        self.period = period
+        self.segment_path = segment_path or default_segment
+        self.socket_path = socket_path or default_socket
+        self.socket_mode = socket_mode
+        self.socket_group = socket_group
+        self.publications = 0
+        self.calls = 0
+        self._errors = dict.fromkeys(self.cards, 0)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._segment = None
+        self._server = None
+        self._threads = []
+
+    def _publish(self, stack):
+        card = self.cards[stack]
+        try:
+            card._read_into(SNAPSHOT_ADDRESS, card._snapshot_buf)
+            card._read_into(COUNTERS_ADDRESS, card._counters_buf)
+        except (OSError, IOError):
+            self._errors[stack] += 1
+            return
+        self._segment.publish(stack, card._snapshot_buf, card._counters_buf, self._errors[stack])
+
+    def call(self, stack, calls):
+        """Run SMmultiio calls on one card, in one batch if several.
+
+        Args:
+            stack (int): Stack level
+            calls (list): (method name, args) pairs
+
+        Returns:
+            Result of the last call
+        """
+        card = self.cards.get(stack)
+        if card is None:
+            raise OSError(errno.ENODEV, "Card {} not served by the daemon".format(stack))
+        methods = []
+        for name, args in calls:
+            if name.startswith("_") or name in _NOT_SERVED or not hasattr(SMmultiio, name):
+                raise ValueError("Invalid method {}!".format(name))
+            methods.append((getattr(card, name), args))
+        with self._lock:
+            self.calls += len(methods)
+            with card.batch():
+                for method, args in methods:
+                    result = method(*args)
+            # Let readers see the effect of writes without waiting a period
+            self._publish(stack)
+        return result
+
+    def _publish_loop(self):
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            with self._lock:
+                for stack in self.cards:
+                    self._publish(stack)
+            self.publications += 1
+            next_time += self.period
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            self._stop.wait(next_time - now)
+
+    def start(self):
+        """Create the segment and socket and start serving in background threads."""
+        self._segment = SnapshotSegment(self.segment_path, create=True,
+                                        mode=(self.socket_mode & 0o444) | 0o600)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # Bind under a umask leaving the socket to its owner until the chmod
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.daemon = self
+        if self.socket_group is not None:
+            gid = self.socket_group
+            if not isinstance(gid, int):
+                gid = grp.getgrnam(gid).gr_gid
+            os.chown(self.segment_path, -1, gid)
+            os.chown(self.socket_path, -1, gid)
+        os.chmod(self.socket_path, self.socket_mode)
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._publish_loop, name="multiio-daemon-publish", daemon=True),
+            threading.Thread(target=self._server.serve_forever, name="multiio-daemon-socket", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def serve_forever(self):
+        """Serve until interrupted."""
+        self.start()
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stop serving and remove the socket and segment files."""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            os.unlink(self.socket_path)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+            os.unlink(self.segment_path)
+
+
+class MultiioClient:
+    """Card served by a :class:`MultiioDaemon`, with the SMmultiio method names.
+
+    ``read_snapshot``, ``read_counters`` and the getters of values they hold
+    are served from the shared segment. Every other public SMmultiio method
+    is sent to the daemon.
+
+    Args:
+        stack (int): Stack level/device number
+        i2c (int): i2c bus number, selects the default paths
+        segment_path (str): Shared segment file of the daemon
+        socket_path (str): Unix socket of the daemon
+    """
+    def __init__(self, stack=0, i2c=1, segment_path=None, socket_path=None):
+        if stack < 0 or stack > data.STACK_LEVEL_MAX:
+            raise ValueError("Invalid stack level!")
+        default_segment, default_socket = default_paths(i2c)
+        self.stack = stack
+        self._segment = SnapshotSegment(segment_path or default_segment)
+        self._socket_path = socket_path or default_socket
+        self._socket = None
+        self._file = None
+        self._batch_depth = 0
+        self._batch_calls = []
+        self._lock = threading.Lock()
+        self.timestamp = None
+
+    def close(self):
+        """Close the socket and unmap the segment."""
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    _check_channel = staticmethod(SMmultiio._check_channel)
+
+    def _request(self, calls):
+        with self._lock:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.connect(self._socket_path)
+                self._file = self._socket.makefile("rwb")
+            self._file.write(json.dumps({"stack": self.stack, "calls": calls}).encode() + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise OSError(errno.ECONNRESET, "Daemon closed the connection")
+        response = json.loads(line)
+        if "error" not in response:
+            return response["result"]
+        if response["error"] == "ValueError":
+            raise ValueError(response["message"])
+        raise OSError(response.get("errno"), response["message"])
+
+    def _call(self, name, args):
+        if self._batch_depth:
+            self._batch_calls.append((name, list(args)))
+            return None
+        return self._request([(name, list(args))])
+
+    def _batch_begin(self):
+        self._batch_depth += 1
+    def _batch_end(self, commit=True):
+        self._batch_depth -= 1
+        if self._batch_depth:
+            return
+        calls, self._batch_calls = self._batch_calls, []
+        if commit and calls:
+            self._request(calls)
+
+    def batch(self):
+        """Buffer calls and send them in one request on exit.
+
+        The daemon runs them inside one :meth:`SMmultiio.batch`, so output
+        writes are merged into block writes. Calls return None inside the
+        context.
+
+        Returns:
+            Context manager
+        """
+        return _Batch(self)
+
+    def flush(self):
+        """Send the calls buffered by :meth:`batch` now."""
+        calls, self._batch_calls = self._batch_calls, []
+        if calls:
+            self._request(calls)
+
+    def read_snapshot(self):
+        """Get the latest published snapshot.
+
+        Returns:
+            (Snapshot) Card state, published at ``self.timestamp``
+        """
+        snapshot, _, self.timestamp = self._segment.read(self.stack)
+        return snapshot
+
+    def read_counters(self):
+        """Get the latest published counters.
+
+        Returns:
+            (Counters) Opto edge and encoder counters
+        """
+        _, counters, self.timestamp = self._segment.read(self.stack)
+        return counters
+
+    def get_relay(self, relay):
+        """Get relay state.
+
+        Args:
+            relay (int): Relay number
+
+        Returns:
+            (int) Relay state
+        """
+        self._check_channel("relay", relay)
+        return self.read_snapshot().get_relay(relay)
+    def get_all_relays(self):
+        """Get all relays state as bitmask."""
+        return self.read_snapshot().relays
+    def get_led(self, led):
+        """Get led state.
+
+        Args:
+            led (int): Led number
+
+        Returns:
+            0(OFF) or 1(ON)
+        """
+        self._check_channel("led", led)
+        return self.read_snapshot().get_led(led)
+    def get_all_leds(self):
+        """Get all leds state as bitmask."""
+        return self.read_snapshot().leds
+    def get_opto(self, channel):
+        """Get optocoupled input status.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (bool) Channel status
+        """
+        self._check_channel("opto", channel)
+        return self.read_snapshot().get_opto(channel)
+    def get_all_opto(self):
+        """Get all optocoupled input status as a bitmask."""
+        return self.read_snapshot().opto
+    def get_motor(self):
+        """Get motor speed value in %."""
+        return self.read_snapshot().motor
+    def get_opto_counter(self, channel):
+        """Get optocoupled inputs edges counter for one channel.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (int) Edge count
+        """
+        self._check_channel("opto", channel)
+        return self.read_counters().opto[channel - 1]
+    def get_opto_encoder_counter(self, channel):
+        """Get optocoupled encoder counter for one channel.
+
+        Args:
+            channel (int): Encoder channel number
+
+        Returns:
+            (int) Encoder counter
+        """
+        self._check_channel("opto_enc", channel)
+        return self.read_counters().encoder[channel - 1]
+
+
+# Getters of per channel snapshot values: method -> (field, channel type)
+_SNAPSHOT_GETTERS = {
+    "get_u_in": ("u_in", "u_in"),
+    "get_i_in": ("i_in", "i_in"),
+    "get_u_out": ("u_out", "u_out"),
+    "get_i_out": ("i_out", "i_out"),
+    "get_servo": ("servo", "servo"),
+    "get_rtd_temp": ("rtd_temp", "rtd"),
+    "get_rtd_res": ("rtd_res", "rtd"),
+}
+
+
+def _make_getter(name, field, channel_type):
+    def method(self, channel):
+        self._check_channel(channel_type, channel)
+        return getattr(self.read_snapshot(), field)[channel - 1]
+    method.__name__ = name
+    method.__doc__ = getattr(SMmultiio, name).__doc__
+    return method
+
+
+# Results sent as JSON objects: method -> record type rebuilt by the client
+_RESULT_TYPES = {
+    "read_snapshot": Snapshot,
+    "read_counters": Counters,
+    "read_pulses": Pulses,
+    "read_diagnostics": Diagnostics,
+}
+
+
+def _from_json(name, result):
+    # Undo the to_json conversion of the daemon for the SMmultiio return types
+    record_type = _RESULT_TYPES.get(name)
+    if record_type is not None and result is not None:
+        return record_type(**{field: tuple(value) if isinstance(value, list) else value
+                              for field, value in result.items()})
+    if name == "read_registers" and result is not None:
+        return bytes.fromhex(result)
+    return result
+
+
+def _make_call(name):
+    def method(self, *args):
+        return _from_json(name, self._call(name, args))
+    method.__name__ = name
+    method.__doc__ = getattr(SMmultiio, name).__doc__
+    return method
+
+
+for _name, (_field, _channel_type) in _SNAPSHOT_GETTERS.items():
+    setattr(MultiioClient, _name, _make_getter(_name, _field, _channel_type))
+for _name in dir(SMmultiio):
+    if _name.startswith("_") or _name in _NOT_SERVED or hasattr(MultiioClient, _name):
+        continue
+    if callable(getattr(SMmultiio, _name)):
+        setattr(MultiioClient, _name, _make_call(_name))
+del _name, _field, _channel_type
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-IO bus owner daemon")
+    parser.add_argument("--i2c", type=int, default=1, help="i2c bus number")
+    parser.add_argument("--period", type=float, default=0.05, help="snapshot period in seconds")
+    parser.add_argument("--segment", help="shared segment path")
+    parser.add_argument("--socket", help="Unix socket path")
+    parser.add_argument("--socket-mode", type=lambda text: int(text, 8), default=0o600,
+                        help="octal socket permissions (default 600)")
+    parser.add_argument("--group", help="group given the socket and segment")
+    args = parser.parse_args(argv)
+    daemon = MultiioDaemon(period=args.period, i2c=args.i2c,
+                           segment_path=args.segment, socket_path=args.socket,
+                           socket_mode=args.socket_mode, socket_group=args.group)
+    if not daemon.cards:
+        parser.exit(1, "No {} found on i2c bus {}\n".format(data.CARD_NAME, args.i2c))
+    daemon.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""Binary data logger writing raw card registers to memory mapped segments.
+
+Each record is fixed width: timestamp, stack level, the raw snapshot block
+(``SMmultiio.read_snapshot`` registers) and the raw counters block. The bus
+reads go straight into the mapped file, so logging costs no decoding, text
+formatting or write calls. Segments are preallocated and rotate when full
+or after ``rotate_seconds``; their header describes the record layout::
+
+    >>> with DataLogger("/var/log/multiio", rotate_seconds=3600) as logger:
+    ...     while True:
+    ...         logger.log(card)
+    ...         time.sleep(0.1)
+
+    >>> reader = LogReader("/var/log/multiio")
+    >>> records = reader.between(start, end)        # NumPy structured views
+    >>> reader.columns(start, end)["rtd_temp1"]     # scaled values
+
+Record fields are named like :mod:`multiio.columnar` columns. Time range
+lookups binary search the timestamps, which must not decrease.
+"""
+
+import bisect
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import multiio.multiio_data as data
+from multiio.columnar import SNAPSHOT_LAYOUT, COUNTERS_LAYOUT
+from multiio.snapshot import Snapshot, SNAPSHOT_ADDRESS, SNAPSHOT_SIZE
+from multiio.snapshot import Counters, COUNTERS_ADDRESS, COUNTERS_SIZE
+
+SUFFIX = ".mlog"
+_MAGIC = b"MIOL"
+_VERSION = 1
+# magic, version, data offset, record size, capacity, records, created, layout length
+_HEADER = struct.Struct("<4sHHIIIdI")
+_COUNT_OFFSET = 16
+_COUNT = struct.Struct("<I")
+# timestamp (time.time()), stack level
+_RECORD = struct.Struct("<dBx")
+_TIMESTAMP = struct.Struct("<d")
+_SNAPSHOT_OFFSET = _RECORD.size
+_COUNTERS_OFFSET = _SNAPSHOT_OFFSET + SNAPSHOT_SIZE
+RECORD_SIZE = (_COUNTERS_OFFSET + COUNTERS_SIZE + 7) & ~7
+
+
+def _layout():
+    fields = [["timestamp", 0, "d", 1], ["stack", 8, "B", 1]]
+    for base, layout in ((_SNAPSHOT_OFFSET, SNAPSHOT_LAYOUT), (_COUNTERS_OFFSET, COUNTERS_LAYOUT)):
+        for name, offset, fmt, scale in layout.fields:
+            fields.append([name, base + offset, fmt, scale])
+    return {
+        "record_size": RECORD_SIZE,
+        "fields": fields,
+        "snapshot": [_SNAPSHOT_OFFSET, SNAPSHOT_ADDRESS, SNAPSHOT_SIZE],
+        "counters": [_COUNTERS_OFFSET, COUNTERS_ADDRESS, COUNTERS_SIZE],
+    }
+
+
+_NUMPY_TYPES = {"B": "u1", "H": "<u2", "h": "<i2", "I": "<u4", "i": "<i4", "f": "<f4", "d": "<f8"}
+
+
+def _dtype(layout):
+    fields = layout["fields"]
+    return numpy.dtype({
+        "names": [field[0] for field in fields],
+        "formats": [_NUMPY_TYPES[field[2]] for field in fields],
+        "offsets": [field[1] for field in fields],
+        "itemsize": layout["record_size"],
+    })
+
+
+class _Segment:
+    # One preallocated segment file being written
+    def __init__(self, path, capacity, created):
+        layout = json.dumps(_layout(), separators=(",", ":")).encode()
+        self.data_offset = (_HEADER.size + len(layout) + 7) & ~7
+        self.path = path
+        self.capacity = capacity
+        self.created = created
+        self.count = 0
+        size = self.data_offset + capacity * RECORD_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        _HEADER.pack_into(self.mm, 0, _MAGIC, _VERSION, self.data_offset, RECORD_SIZE,
+                          capacity, 0, created, len(layout))
+        self.mm[_HEADER.size:_HEADER.size + len(layout)] = layout
+        self.view = memoryview(self.mm)
+
+    def commit(self):
+        # Publish the record written at self.count to readers
+        self.count += 1
+        _COUNT.pack_into(self.mm, _COUNT_OFFSET, self.count)
+
+    def close(self):
+        self.view.release()
+        self.mm.flush()
+        self.mm.close()
+        # Drop the unused preallocated space
+        os.truncate(self.path, self.data_offset + self.count * RECORD_SIZE)
+
+
+class DataLogger:
+    """Append card records to rotating memory mapped segment files.
+
+    Segments are named ``<prefix>-<index><SUFFIX>`` in ``directory``, with
+    the index continuing after the existing segments.
+
+    Args:
+        directory (str): Segment directory, created if missing
+        prefix (str): Segment file name prefix
+        segment_records (int): Records per segment before rotating
+        rotate_seconds (float): Also rotate segments older than this, never if None
+
+    Attributes:
+        records (int): Records logged
+        errors (int): Failed card reads in :meth:`log`
+        segments (list): Paths of the segments written so far
+    """
+    def __init__(self, directory, prefix="multiio", segment_records=65536, rotate_seconds=None):
+        if segment_records <= 0:
+            raise ValueError("Invalid segment size!")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_records = segment_records
+        self.rotate_seconds = rotate_seconds
+        self.records = 0
+        self.errors = 0
+        self.segments = []
+        existing = _segment_paths(directory, prefix)
+        self._index = _segment_index(existing[-1], prefix) + 1 if existing else 0
+        self._segment = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _record(self, timestamp):
+        # Offset of the next record, rotating first if needed
+        segment = self._segment
+        if segment is not None and (segment.count >= segment.capacity or (
+                self.rotate_seconds is not None and timestamp - segment.created >= self.rotate_seconds)):
+            self.rotate()
+            segment = None
+        if segment is None:
+            path = os.path.join(self.directory, "{}-{:06d}{}".format(self.prefix, self._index, SUFFIX))
+            self._index += 1
+            segment = self._segment = _Segment(path, self.segment_records, timestamp)
+            self.segments.append(path)
+        return segment, segment.data_offset + segment.count * RECORD_SIZE
+
+    def log(self, card, timestamp=None):
+        """Read the snapshot and counters of a card into the next record.
+
+        The registers are read directly into the mapped file; a failed read
+        leaves no record.
+
+        Args:
+            card (SMmultiio): Card to read
+            timestamp (float): Record time, ``time.time()`` if None
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        segment, offset = self._record(timestamp)
+        view = segment.view
+        try:
+            card._read_into(SNAPSHOT_ADDRESS, view[offset + _SNAPSHOT_OFFSET:offset + _COUNTERS_OFFSET])
+            card._read_into(COUNTERS_ADDRESS, view[offset + _COUNTERS_OFFSET:offset + _COUNTERS_OFFSET + COUNTERS_SIZE])
+        except (OSError, IOError):
+            self.errors += 1
+            raise
+        _RECORD.pack_into(segment.mm, offset, timestamp, card._hw_address_ - data.SLAVE_OWN_ADDRESS_BASE)
+        segment.commit()
+        self.records += 1
+
+    def append(self, stack, timestamp, snapshot, counters):
+        """Log raw blocks read elsewhere.
+
+        Args:
+            stack (int): Card stack level
+            timestamp (float): Record time
+            snapshot: SNAPSHOT_SIZE bytes from SNAPSHOT_ADDRESS
+            counters: COUNTERS_SIZE bytes from COUNTERS_ADDRESS
+        """
+        if len(snapshot) != SNAPSHOT_SIZE or len(counters) != COUNTERS_SIZE:
+            raise ValueError("Invalid raw block size!")
+        segment, offset = self._record(timestamp)
+        view = segment.view
+        view[offset + _SNAPSHOT_OFFSET:offset + _COUNTERS_OFFSET] = snapshot
+        view[offset + _COUNTERS_OFFSET:offset + _COUNTERS_OFFSET + COUNTERS_SIZE] = counters
+        _RECORD.pack_into(segment.mm, offset, timestamp, stack)
+        segment.commit()
+        self.records += 1
+
+    def rotate(self):
+        """Close the current segment; the next record starts a new one."""
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def flush(self):
+        """Write the mapped pages of the current segment to disk."""
+        if self._segment is not None:
+            self._segment.mm.flush()
+
+    def close(self):
+        """Close the current segment."""
+        self.rotate()
+
+
+def _segment_paths(directory, prefix):
+    # Segments of this prefix only, in index order: "multiio" must not pick
+    # up the "multiio-foo-000001" segments of another logger
+    pattern = re.compile(re.escape(prefix) + r"-(\d+)" + re.escape(SUFFIX) + "$")
+    segments = []
+    for path in glob.glob(os.path.join(glob.escape(directory), glob.escape(prefix) + "-*" + SUFFIX)):
+        match = pattern.match(os.path.basename(path))
+        if match is not None:
+            segments.append((int(match.group(1)), path))
+    return [path for _, path in sorted(segments)]
+
+
+def _segment_index(path, prefix):
+    name = os.path.basename(path)
+    return int(name[len(prefix) + 1:-len(SUFFIX)])
+
+
+class _Timestamps:
+    # Sequence of the record timestamps of a segment for bisect
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __len__(self):
+        return self.segment.count
+
+    def __getitem__(self, index):
+        return _TIMESTAMP.unpack_from(self.segment._mm, self.segment.data_offset + index * self.segment.record_size)[0]
+
+
+class LogSegment:
+    """Read only mapping of one segment file.
+
+    A segment still being written can be read; :attr:`count` follows the
+    records committed by the writer.
+
+    Args:
+        path (str): Segment file
+
+    Attributes:
+        created (float): Time of the first record
+        layout (dict): Record layout from the header
+        dtype (numpy.dtype): Record type, None without NumPy
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.data_offset, self.record_size, self.capacity,
+         _, self.created, layout_length) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._mm.close()
+            raise ValueError("Invalid log segment {}!".format(path))
+        self.layout = json.loads(bytes(self._mm[_HEADER.size:_HEADER.size + layout_length]))
+        self.dtype = _dtype(self.layout) if numpy is not None else None
+        self._timestamps = _Timestamps(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """Unmap the segment, once the views returned by it are released."""
+        try:
+            self._mm.close()
+        except BufferError:
+            # Views still exported, unmapped when they are collected
+            pass
+
+    @property
+    def count(self):
+        """Number of committed records."""
+        count = _COUNT.unpack_from(self._mm, _COUNT_OFFSET)[0]
+        return min(count, (len(self._mm) - self.data_offset) // self.record_size)
+
+    def index(self, timestamp):
+        """Get the index of the first record at or after a time."""
+        return bisect.bisect_left(self._timestamps, timestamp)
+
+    def records(self, start=0, stop=None):
+        """Get records as a NumPy structured array without copying.
+
+        Args:
+            start (int): First record index
+            stop (int): End record index, all committed records if None
+
+        Returns:
+            (numpy.ndarray) View of the mapped records, fields of :attr:`layout`
+        """
+        if numpy is None:
+            raise ImportError("NumPy is not installed!")
+        count = self.count
+        stop = count if stop is None else min(stop, count)
+        start = min(start, stop)
+        return numpy.frombuffer(self._mm, dtype=self.dtype, count=stop - start,
+                                offset=self.data_offset + start * self.record_size)
+
+    def between(self, start=None, end=None):
+        """Get the records of a time range without copying.
+
+        Args:
+            start (float): First time included, from the first record if None
+            end (float): First time excluded, up to the last record if None
+
+        Returns:
+            (numpy.ndarray) View of the matching records
+        """
+        first = 0 if start is None else self.index(start)
+        last = self.count if end is None else self.index(end)
+        return self.records(first, last)
+
+    def raw(self, index):
+        """Get the bytes of one record without copying.
+
+        Returns:
+            (memoryview) record_size bytes, see :attr:`layout`
+        """
+        if not 0 <= index < self.count:
+            raise IndexError("Invalid record index!")
+        offset = self.data_offset + index * self.record_size
+        return memoryview(self._mm)[offset:offset + self.record_size]
+
+    def record(self, index):
+        """Decode one record.
+
+        Returns:
+            (tuple) (timestamp, stack, Snapshot, Counters)
+        """
+        buf = self.raw(index)
+        timestamp, stack = _RECORD.unpack_from(buf)
+        snapshot = Snapshot.from_buffer(buf, self.layout["snapshot"][0])
+        counters = Counters.from_buffer(buf, self.layout["counters"][0])
+        buf.release()
+        return timestamp, stack, snapshot, counters
+
+
+def scale_records(records, layout):
+    """Convert record fields to the units of the single-channel getters.
+
+    Args:
+        records (numpy.ndarray): Records from :meth:`LogSegment.records`
+        layout (dict): Layout of the records
+
+    Returns:
+        (dict) Field name -> NumPy array; scaled fields are float64
+    """
+    columns = {}
+    for name, _, _, scale in layout["fields"]:
+        columns[name] = records[name] / scale if scale != 1 else records[name]
+    return columns
+
+
+class LogReader:
+    """Time range access to the segments of a :class:`DataLogger`.
+
+    Segments are mapped when first needed; segments written after the
+    reader was created are found by :meth:`refresh`.
+
+    Args:
+        directory (str): Segment directory
+        prefix (str): Segment file name prefix
+    """
+    def __init__(self, directory, prefix="multiio"):
+        self.directory = directory
+        self.prefix = prefix
+        self._segments = {}
+        self.paths = []
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def refresh(self):
+        """List the segment files again."""
+        self.paths = _segment_paths(self.directory, self.prefix)
+
+    def segment(self, path):
+        """Get the mapping of one segment file.
+
+        Returns:
+            (LogSegment) Segment
+        """
+        segment = self._segments.get(path)
+        if segment is None:
+            segment = self._segments[path] = LogSegment(path)
+        return segment
+
+    def segments(self, start=None, end=None):
+        """Get the segments that may hold records of a time range.
+
+        Only the headers of the candidate segments are read: a segment is
+        skipped when the next one was created before ``start``.
+        """
+        selected = []
+        for i, path in enumerate(self.paths):
+            segment = self.segment(path)
+            if end is not None and segment.created >= end:
+                break
+            if start is not None and i + 1 < len(self.paths) and self.segment(self.paths[i + 1]).created <= start:
+                continue
+            selected.append(segment)
+        return selected
+
+    def between(self, start=None, end=None):
+        """Get the records of a time range, one view per segment.
+
+        Args:
+            start (float): First time included
+            end (float): First time excluded
+
+        Returns:
+            (list) NumPy structured array views, oldest first
+        """
+        views = [segment.between(start, end) for segment in self.segments(start, end)]
+        return [view for view in views if len(view)]
+
+    def columns(self, start=None, end=None):
+        """Get the scaled values of a time range.
+
+        The records of the segments are concatenated (copied) once.
+
+        Returns:
+            (dict) Field name -> NumPy array
+        """
+        if numpy is None:
+            raise ImportError("NumPy is not installed!")
+        segments = self.segments(start, end)
+        if segments:
+            layout = segments[0].layout
+            records = numpy.concatenate([segment.between(start, end) for segment in segments])
+        else:
+            layout = _layout()
+            records = numpy.empty(0, dtype=_dtype(layout))
+        return scale_records(records, layout)
+
+    def close(self):
+        """Unmap all segments."""
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+
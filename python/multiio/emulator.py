@@ -0,0 +1,364 @@
+"""Register-level emulator of the Multi-IO card and an SMBus compatible bus.
+
+The emulator implements the card side of the ``I2C_MEM`` map so the library
+(and the code built on top of it) can run without a Raspberry Pi::
+
+    >>> import multiio
+    >>> from multiio.emulator import EmulatedBus
+    >>> bus = EmulatedBus(stacks=(0, 1), latency=0.0002)
+    >>> mio = multiio.SMmultiio(0, bus=bus)
+    >>> bus.cards[0].set_u_in(1, 4.5)
+    >>> mio.get_u_in(1)
+    4.5
+    >>> bus.transactions
+    3
+"""
+
+import ctypes
+import datetime
+import errno
+import random
+import struct
+import threading
+import time
+
+import multiio.multiio_data as data
+I2C_MEM = data.I2C_MEM
+CHANNEL_NO = data.CHANNEL_NO
+CALIB = data.CALIB
+
+I2C_BLOCK_MAX = 32
+MEM_SIZE = 256
+
+# Bits per byte on the wire (8 data + ACK) and start/stop overhead per message
+_BITS_PER_BYTE = 9
+_FRAME_BITS = 2
+# i2c_msg read flag (I2C_M_RD)
+_I2C_M_RD = 0x0001
+
+
+class CardEmulator:
+    """Emulated Multi-IO card memory with the firmware command semantics.
+
+    Args:
+        hw_version (tuple): Hardware revision (major, minor)
+        fw_version (tuple): Firmware revision (major, minor)
+        wdt_period (int): Watchdog period in seconds
+        wdt_init_period (int): Watchdog initial period in seconds
+    """
+    def __init__(self, hw_version=(1, 0), fw_version=(1, 2),
+                 wdt_period=120, wdt_init_period=270):
+        self.mem = bytearray(MEM_SIZE)
+        self.mem[I2C_MEM.REVISION_HW_MAJOR_ADD] = hw_version[0]
+        self.mem[I2C_MEM.REVISION_HW_MINOR_ADD] = hw_version[1]
+        self.mem[I2C_MEM.REVISION_MAJOR_ADD] = fw_version[0]
+        self.mem[I2C_MEM.REVISION_MINOR_ADD] = fw_version[1]
+        self._pack("<H", I2C_MEM.WDT_INTERVAL_GET_ADD, wdt_period)
+        self._pack("<H", I2C_MEM.WDT_INIT_INTERVAL_GET_ADD, wdt_init_period)
+        self.mem[I2C_MEM.CALIB_STATUS] = CALIB.DONE
+        self.calibrations = []
+        self.wdt_reloads = 0
+        self.wdt_last_reload = time.monotonic()
+        self._rtc_offset = datetime.timedelta(0)
+        # register -> (size, handler); handlers run when a write fully covers
+        # the register, after the payload has been stored.
+        self._handlers = {
+            I2C_MEM.RELAY_SET: (1, self._on_relay_set),
+            I2C_MEM.RELAY_CLR: (1, self._on_relay_clr),
+            I2C_MEM.LED_SET: (1, self._on_led_set),
+            I2C_MEM.LED_CLR: (1, self._on_led_clr),
+            I2C_MEM.OPTO_CNT_RST_ADD: (1, self._on_opto_cnt_rst),
+            I2C_MEM.OPTO_ENC_CNT_RST_ADD: (1, self._on_opto_enc_cnt_rst),
+            I2C_MEM.CALIB_KEY: (1, self._on_calib_key),
+            I2C_MEM.WDT_RESET_ADD: (1, self._on_wdt_reset),
+            I2C_MEM.WDT_INTERVAL_SET_ADD: (2, self._on_wdt_interval_set),
+            I2C_MEM.WDT_INIT_INTERVAL_SET_ADD: (2, self._on_wdt_init_interval_set),
+            I2C_MEM.WDT_CLEAR_RESET_COUNT_ADD: (1, self._on_wdt_clear_reset_count),
+            I2C_MEM.WDT_POWER_OFF_INTERVAL_SET_ADD: (4, self._on_wdt_off_interval_set),
+            I2C_MEM.RTC_CMD_ADD: (1, self._on_rtc_cmd),
+        }
+
+    def _pack(self, fmt, address, *values):
+        struct.pack_into(fmt, self.mem, address, *values)
+
+    def _unpack(self, fmt, address):
+        return struct.unpack_from(fmt, self.mem, address)[0]
+
+    @staticmethod
+    def _bit(value, channel_type):
+        if 0 < value <= CHANNEL_NO[channel_type]:
+            return 1 << (value - 1)
+        return 0
+
+    def read(self, register, length):
+        """Read card memory as the firmware would answer a read request.
+
+        Args:
+            register (int): Start address
+            length (int): Number of bytes
+
+        Returns:
+            (bytes) Register content, zero filled past the end of memory
+        """
+        if register <= I2C_MEM.RTC_SECOND_ADD and register + length > I2C_MEM.RTC_YEAR_ADD:
+            self._update_rtc()
+        out = bytes(self.mem[register:register + length])
+        return out + bytes(length - len(out))
+
+    def write(self, register, payload):
+        """Store a write request and run the firmware side effects.
+
+        Args:
+            register (int): Start address
+            payload (bytes): Written bytes
+        """
+        end = min(register + len(payload), MEM_SIZE)
+        self.mem[register:end] = payload[:end - register]
+        for address in range(register, end):
+            handler = self._handlers.get(address)
+            if handler is not None and address + handler[0] <= end:
+                handler[1]()
+
+    # Firmware command registers
+    def _on_relay_set(self):
+        self.mem[I2C_MEM.RELAYS] |= self._bit(self.mem[I2C_MEM.RELAY_SET], "relay")
+    def _on_relay_clr(self):
+        self.mem[I2C_MEM.RELAYS] &= ~self._bit(self.mem[I2C_MEM.RELAY_CLR], "relay") & 0xff
+    def _on_led_set(self):
+        self.mem[I2C_MEM.LEDS] |= self._bit(self.mem[I2C_MEM.LED_SET], "led")
+    def _on_led_clr(self):
+        self.mem[I2C_MEM.LEDS] &= ~self._bit(self.mem[I2C_MEM.LED_CLR], "led") & 0xff
+    def _on_opto_cnt_rst(self):
+        channel = self.mem[I2C_MEM.OPTO_CNT_RST_ADD]
+        if self._bit(channel, "opto"):
+            self._pack("<I", I2C_MEM.OPTO_EDGE_COUNT_ADD + (channel - 1) * 4, 0)
+    def _on_opto_enc_cnt_rst(self):
+        channel = self.mem[I2C_MEM.OPTO_ENC_CNT_RST_ADD]
+        if self._bit(channel, "opto_enc"):
+            self._pack("<i", I2C_MEM.OPTO_ENC_COUNT_ADD + (channel - 1) * 4, 0)
+    def _on_calib_key(self):
+        key = self.mem[I2C_MEM.CALIB_KEY]
+        channel = self.mem[I2C_MEM.CALIB_CHANNEL]
+        if key not in (data.CALIBRATION_KEY, data.RESET_CALIBRATION_KEY):
+            return
+        if not (0 < channel <= CALIB.LAST_CH):
+            self.mem[I2C_MEM.CALIB_STATUS] = CALIB.ERROR
+            return
+        if key == data.CALIBRATION_KEY:
+            self.calibrations.append((channel, self._unpack("<f", I2C_MEM.CALIB_VALUE)))
+        else:
+            self.calibrations = [c for c in self.calibrations if c[0] != channel]
+        self.mem[I2C_MEM.CALIB_STATUS] = CALIB.DONE
+    def _on_wdt_reset(self):
+        if self.mem[I2C_MEM.WDT_RESET_ADD] == data.WDT_RESET_SIGNATURE:
+            self.wdt_reloads += 1
+            self.wdt_last_reload = time.monotonic()
+    def _on_wdt_interval_set(self):
+        self.mem[I2C_MEM.WDT_INTERVAL_GET_ADD:I2C_MEM.WDT_INTERVAL_GET_ADD + 2] = \
+            self.mem[I2C_MEM.WDT_INTERVAL_SET_ADD:I2C_MEM.WDT_INTERVAL_SET_ADD + 2]
+    def _on_wdt_init_interval_set(self):
+        self.mem[I2C_MEM.WDT_INIT_INTERVAL_GET_ADD:I2C_MEM.WDT_INIT_INTERVAL_GET_ADD + 2] = \
+            self.mem[I2C_MEM.WDT_INIT_INTERVAL_SET_ADD:I2C_MEM.WDT_INIT_INTERVAL_SET_ADD + 2]
+    def _on_wdt_clear_reset_count(self):
+        if self.mem[I2C_MEM.WDT_CLEAR_RESET_COUNT_ADD] == data.WDT_RESET_COUNT_SIGNATURE:
+            self._pack("<H", I2C_MEM.WDT_RESET_COUNT_ADD, 0)
+    def _on_wdt_off_interval_set(self):
+        value = self._unpack("<i", I2C_MEM.WDT_POWER_OFF_INTERVAL_SET_ADD)
+        self._pack("<i", I2C_MEM.WDT_POWER_OFF_INTERVAL_GET_ADD, value)
+    def _on_rtc_cmd(self):
+        if self.mem[I2C_MEM.RTC_CMD_ADD] != data.CALIBRATION_KEY:
+            return
+        year, month, day, hour, minute, second = \
+            self.mem[I2C_MEM.RTC_SET_YEAR_ADD:I2C_MEM.RTC_SET_SECOND_ADD + 1]
+        card_time = datetime.datetime(2000 + year, month, day, hour, minute, second)
+        self._rtc_offset = card_time - datetime.datetime.now()
+        self.mem[I2C_MEM.RTC_CMD_ADD] = 0
+    def _update_rtc(self):
+        now = datetime.datetime.now() + self._rtc_offset
+        self.mem[I2C_MEM.RTC_YEAR_ADD:I2C_MEM.RTC_SECOND_ADD + 1] = bytes([
+            now.year - 2000, now.month, now.day, now.hour, now.minute, now.second])
+
+    # Field side of the card
+    def set_u_in(self, channel, value):
+        """Set the voltage seen on a 0-10V input channel (volts)."""
+        self._pack("<H", I2C_MEM.U_IN + (channel - 1) * 2, int(round(value * data.VOLT_TO_MILIVOLT)))
+    def set_i_in(self, channel, value):
+        """Set the current seen on a 4-20mA input channel (mA)."""
+        self._pack("<H", I2C_MEM.I_IN + (channel - 1) * 2, int(round(value * data.VOLT_TO_MILIVOLT)))
+    def set_rtd(self, channel, temperature, resistance=None):
+        """Set RTD channel temperature (Celsius) and resistance (ohm).
+
+        The resistance defaults to the PT100 value for the temperature.
+        """
+        if resistance is None:
+            resistance = 100.0 * (1 + 3.9083e-3 * temperature)
+        self._pack("<f", I2C_MEM.RTD_VAL1_ADD + (channel - 1) * 4, temperature)
+        self._pack("<f", I2C_MEM.RTD_RES1_ADD + (channel - 1) * 4, resistance)
+    def set_opto(self, mask):
+        """Set optocoupled inputs state as bitmask."""
+        self.mem[I2C_MEM.OPTO] = mask & 0xff
+    def count_opto_edges(self, channel, edges=1):
+        """Advance an optocoupled edge counter (wraps at 32 bits)."""
+        address = I2C_MEM.OPTO_EDGE_COUNT_ADD + (channel - 1) * 4
+        self._pack("<I", address, (self._unpack("<I", address) + edges) & 0xffffffff)
+    def move_encoder(self, channel, steps):
+        """Advance a quadrature encoder counter (wraps at 32 bits)."""
+        address = I2C_MEM.OPTO_ENC_COUNT_ADD + (channel - 1) * 4
+        value = (self._unpack("<i", address) + steps + 0x80000000) & 0xffffffff
+        self._pack("<i", address, value - 0x80000000)
+    def set_opto_frequency(self, channel, frequency, fill=0.0, pps=None):
+        """Set measured frequency (Hz), PWM fill (%) and pulses per second."""
+        if pps is None:
+            pps = frequency
+        self._pack("<H", I2C_MEM.PPS + (channel - 1) * 2, int(pps))
+        self._pack("<H", I2C_MEM.IN_FREQUENCY + (channel - 1) * 2, int(frequency))
+        self._pack("<H", I2C_MEM.PWM_IN_FILL + (channel - 1) * 2,
+                   int(round(fill * data.OPTO_FILL_FACTOR_SCALE)))
+    def set_diagnostics(self, temperature, v3v3):
+        """Set board temperature (Celsius) and 3.3V rail (mV)."""
+        self.mem[I2C_MEM.DIAG_TEMPERATURE_ADD] = int(temperature) & 0xff
+        self._pack("<H", I2C_MEM.DIAG_3V3_MV_ADD, int(v3v3))
+    def press_button(self):
+        """Press the card button; sets the state and the latch bit."""
+        self.mem[I2C_MEM.BUTTON] |= 3
+    def release_button(self):
+        """Release the card button; the latch bit stays set until read."""
+        self.mem[I2C_MEM.BUTTON] &= ~1 & 0xff
+    def wdt_expired(self):
+        """Check if the watchdog period elapsed since the last reload.
+
+        Returns:
+            (bool) True if the real card would have power-cycled the Pi
+        """
+        period = self._unpack("<H", I2C_MEM.WDT_INTERVAL_GET_ADD)
+        return time.monotonic() - self.wdt_last_reload > period
+
+
+class EmulatedBus:
+    """In-memory replacement for ``smbus2.SMBus`` serving emulated cards.
+
+    Every call is one transaction. Transactions to a stack level without a
+    card fail with ``OSError(EREMOTEIO)`` like a real bus. ``write_block_data``
+    is treated like ``write_i2c_block_data``.
+
+    Args:
+        stacks (iterable): Stack levels populated with a :class:`CardEmulator`
+        latency (float): Fixed time per transaction in seconds
+        jitter (float): Max extra random time per transaction in seconds
+        speed (int): Bus clock in Hz used to add wire time per byte, None to disable
+        seed (int): Seed of the jitter generator
+    """
+    def __init__(self, stacks=(0,), latency=0.0, jitter=0.0, speed=None, seed=None):
+        self.cards = {}
+        for stack in stacks:
+            self.add_card(stack)
+        self.latency = latency
+        self.jitter = jitter
+        self.speed = speed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_counters()
+
+    def add_card(self, stack, card=None):
+        """Populate a stack level.
+
+        Args:
+            stack (int): Stack level
+            card (CardEmulator): Card to attach, a new one if None
+
+        Returns:
+            (CardEmulator) Attached card
+        """
+        if card is None:
+            card = CardEmulator()
+        self.cards[stack] = card
+        return card
+
+    def remove_card(self, stack):
+        """Remove the card from a stack level."""
+        del self.cards[stack]
+
+    def reset_counters(self):
+        """Reset transaction and byte counters."""
+        self.transactions = 0
+        self.bytes_on_wire = 0
+
+    def _card(self, i2c_addr):
+        card = self.cards.get(i2c_addr - data.SLAVE_OWN_ADDRESS_BASE)
+        if card is None:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        return card
+
+    def _transaction(self, i2c_addr, wire_bytes):
+        self.transactions += 1
+        self.bytes_on_wire += wire_bytes
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if self.speed:
+            delay += (wire_bytes * _BITS_PER_BYTE + _FRAME_BITS) / float(self.speed)
+        if delay > 0:
+            time.sleep(delay)
+        return self._card(i2c_addr)
+
+    def _read(self, i2c_addr, register, length):
+        with self._lock:
+            # address(W), register, address(R), data
+            return self._transaction(i2c_addr, 3 + length).read(register, length)
+
+    def _write(self, i2c_addr, register, payload):
+        with self._lock:
+            # address(W), register, data
+            self._transaction(i2c_addr, 2 + len(payload)).write(register, bytes(payload))
+
+    def read_byte(self, i2c_addr, force=None):
+        with self._lock:
+            return self._transaction(i2c_addr, 2).read(0, 1)[0]
+    def write_quick(self, i2c_addr, force=None):
+        with self._lock:
+            self._transaction(i2c_addr, 1)
+    def read_byte_data(self, i2c_addr, register, force=None):
+        return self._read(i2c_addr, register, 1)[0]
+    def read_word_data(self, i2c_addr, register, force=None):
+        return struct.unpack("<H", self._read(i2c_addr, register, 2))[0]
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        if length > I2C_BLOCK_MAX:
+            raise ValueError("Desired block length over %d bytes" % I2C_BLOCK_MAX)
+        return list(self._read(i2c_addr, register, length))
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        self._write(i2c_addr, register, [value & 0xff])
+    def write_word_data(self, i2c_addr, register, value, force=None):
+        self._write(i2c_addr, register, struct.pack("<H", value & 0xffff))
+    def write_block_data(self, i2c_addr, register, data, force=None):
+        self.write_i2c_block_data(i2c_addr, register, data)
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        if len(data) > I2C_BLOCK_MAX:
+            raise ValueError("Data length cannot exceed %d bytes" % I2C_BLOCK_MAX)
+        self._write(i2c_addr, register, data)
+
+    def i2c_rdwr(self, *i2c_msgs):
+        """Combined transfer of ``smbus2.i2c_msg`` messages, one transaction.
+
+        A write message sets the register pointer (its first byte) and
+        writes the remaining bytes; a read message reads from the pointer.
+        """
+        with self._lock:
+            card = self._transaction(i2c_msgs[0].addr, sum(1 + msg.len for msg in i2c_msgs))
+            register = 0
+            for msg in i2c_msgs:
+                card = self._card(msg.addr)
+                if msg.flags & _I2C_M_RD:
+                    ctypes.memmove(msg.buf, card.read(register, msg.len), msg.len)
+                    register += msg.len
+                elif msg.len:
+                    payload = msg.buf[:msg.len]
+                    register = payload[0]
+                    if len(payload) > 1:
+                        card.write(register, payload[1:])
+
+    def close(self):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,320 @@
+"""Change notifications computed from consecutive card snapshots.
+
+Every dispatch cycle reads one :meth:`SMmultiio.read_snapshot` per card
+(plus the button register for cards with button subscriptions) and compares
+it to the previous one, however many subscriptions there are::
+
+    >>> events = EventDispatcher()
+    >>> events.subscribe_opto(card, 1, on_edge, edge="rising")
+    >>> events.subscribe_threshold(card, "rtd_temp", 1, on_hot, high=80, low=75)
+    >>> events.start(period=0.05)
+"""
+
+import collections
+import itertools
+import logging
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Snapshot fields usable with subscribe_threshold: field -> channel type
+THRESHOLD_KINDS = {
+    "u_in": "u_in",
+    "i_in": "i_in",
+    "u_out": "u_out",
+    "i_out": "i_out",
+    "servo": "servo",
+    "rtd_temp": "rtd",
+    "rtd_res": "rtd",
+}
+
+_EDGES = {"rising": 1, "falling": 2, "both": 3}
+
+_log = logging.getLogger(__name__)
+
+Event = collections.namedtuple("Event", ["card", "kind", "channel", "value", "timestamp"])
+Event.__doc__ = """Notification passed to subscription callbacks.
+
+kind is "opto", "relay", "button" or a threshold kind; value is the new
+state (bool) or, for thresholds, the analog value that crossed the limit;
+timestamp is the monotonic time of the snapshot.
+"""
+
+
+class EventDispatcher:
+    """Evaluate subscriptions against bulk snapshots of one or more cards.
+
+    Callbacks run in the dispatch thread (or the caller of :meth:`poll`) and
+    receive one :class:`Event`. A failed card read skips that card for the
+    cycle and is counted in ``errors``. An exception raised by a callback is
+    logged and counted in ``callback_errors``; the other events of the cycle
+    are still delivered.
+
+    Args:
+        use_numpy (bool): Evaluate thresholds with NumPy, by default if installed
+    """
+    def __init__(self, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        self.errors = 0
+        self.callback_errors = 0
+        self._numpy = use_numpy
+        self._ids = itertools.count(1)
+        self._subs = {}
+        self._cards = {}
+        self._previous = {}
+        self._buttons = {}
+        self._thresholds = None
+        self._thresholds_changed = True
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _add(self, card, kind, channel, callback, extra):
+        with self._lock:
+            handle = next(self._ids)
+            self._subs[handle] = (card, kind, channel, callback, extra)
+            self._cards[id(card)] = card
+            self._thresholds_changed = True
+            return handle
+
+    def subscribe_opto(self, card, channel, callback, edge="both"):
+        """Notify optocoupled input changes.
+
+        Args:
+            card (SMmultiio): Card
+            channel (int): Opto channel number
+            callback (callable): Receives an Event, value is the new state
+            edge (str): "rising", "falling" or "both"
+
+        Returns:
+            (int) Subscription handle
+        """
+        card._check_channel("opto", channel)
+        if edge not in _EDGES:
+            raise ValueError("Invalid edge! Must be rising, falling or both")
+        return self._add(card, "opto", channel, callback, _EDGES[edge])
+
+    def subscribe_relay(self, card, relay, callback):
+        """Notify relay state changes.
+
+        Args:
+            card (SMmultiio): Card
+            relay (int): Relay number
+            callback (callable): Receives an Event, value is the new state
+
+        Returns:
+            (int) Subscription handle
+        """
+        card._check_channel("relay", relay)
+        return self._add(card, "relay", relay, callback, 3)
+
+    def subscribe_button(self, card, callback, latch=True):
+        """Notify button presses.
+
+        Args:
+            card (SMmultiio): Card
+            callback (callable): Receives an Event with value True on press
+            latch (bool): Use the button latch, so presses shorter than the
+                dispatch period are not lost (the latch is cleared on read);
+                otherwise a press is the button read as pressed after a
+                cycle it was not
+
+        Returns:
+            (int) Subscription handle
+        """
+        return self._add(card, "button", 1, callback, latch)
+
+    def subscribe_threshold(self, card, kind, channel, callback, high, low=None):
+        """Notify an analog value crossing a limit, with hysteresis.
+
+        The callback runs when the value rises to ``high`` or above and again
+        when it falls back to ``low`` or below. A first value already at or
+        above ``high`` is notified as a rise.
+
+        Args:
+            card (SMmultiio): Card
+            kind (str): One of ``THRESHOLD_KINDS``
+            channel (int): Channel number
+            callback (callable): Receives an Event, value is the analog value
+            high (float): Upper limit
+            low (float): Lower limit, high if None
+
+        Returns:
+            (int) Subscription handle
+        """
+        if kind not in THRESHOLD_KINDS:
+            raise ValueError("Invalid threshold kind {}!".format(kind))
+        card._check_channel(THRESHOLD_KINDS[kind], channel)
+        if low is None:
+            low = high
+        if low > high:
+            raise ValueError("Invalid hysteresis! low must be <= high")
+        return self._add(card, kind, channel, callback, (high, low))
+
+    def unsubscribe(self, handle):
+        """Remove a subscription.
+
+        Args:
+            handle (int): Value returned by a subscribe method
+        """
+        with self._lock:
+            sub = self._subs.pop(handle, None)
+            self._thresholds_changed = True
+            if sub is not None and not any(s[0] is sub[0] for s in self._subs.values()):
+                del self._cards[id(sub[0])]
+                self._previous.pop(id(sub[0]), None)
+                self._buttons.pop(id(sub[0]), None)
+
+    def _build_thresholds(self, previous):
+        # Subscriptions that already existed keep their hysteresis state
+        kept = {}
+        if previous is not None:
+            kept = {handle: int(state) for (handle, _), state in zip(previous[0], previous[3])}
+        subs = [(handle, sub) for handle, sub in self._subs.items() if sub[1] in THRESHOLD_KINDS]
+        high = [sub[4][0] for _, sub in subs]
+        low = [sub[4][1] for _, sub in subs]
+        # state: 0 unknown, 1 below, 2 above
+        state = [kept.get(handle, 0) for handle, _ in subs]
+        if self._numpy:
+            high, low = numpy.array(high, dtype=float), numpy.array(low, dtype=float)
+            state = numpy.array(state, dtype=numpy.int8)
+        return [subs, high, low, state]
+
+    def poll(self):
+        """Run one dispatch cycle: read every card and fire callbacks."""
+        with self._lock:
+            if self._thresholds_changed:
+                self._thresholds = self._build_thresholds(self._thresholds)
+                self._thresholds_changed = False
+            thresholds = self._thresholds
+            subs = list(self._subs.values())
+            cards = list(self._cards.items())
+        timestamp = time.monotonic()
+        snapshots = {}
+        buttons = {}
+        for key, card in cards:
+            try:
+                snapshots[key] = card.read_snapshot()
+                if any(s[0] is card and s[1] == "button" for s in subs):
+                    buttons[key] = self._read_button(card, subs)
+            except (OSError, IOError):
+                self.errors += 1
+        events = []
+        for card, kind, channel, callback, extra in subs:
+            key = id(card)
+            if key not in snapshots:
+                continue
+            if kind == "button":
+                # A latch reads set once per press, the plain state for every
+                # cycle the button is held: report its edges only
+                if buttons.get(key) and (extra or not self._buttons.get(key)):
+                    events.append((callback, Event(card, kind, channel, True, timestamp)))
+                continue
+            if kind not in ("opto", "relay"):
+                continue
+            previous = self._previous.get(key)
+            if previous is None:
+                continue
+            mask = snapshots[key].opto if kind == "opto" else snapshots[key].relays
+            old_mask = previous.opto if kind == "opto" else previous.relays
+            bit = 1 << (channel - 1)
+            if (mask ^ old_mask) & bit:
+                state = bool(mask & bit)
+                if extra & (1 if state else 2):
+                    events.append((callback, Event(card, kind, channel, state, timestamp)))
+        self._evaluate_thresholds(thresholds, snapshots, timestamp, events)
+        self._previous.update(snapshots)
+        self._buttons.update(buttons)
+        for callback, event in events:
+            try:
+                callback(event)
+            except Exception:
+                self.callback_errors += 1
+                _log.exception("Event callback %r failed on %s", callback, event.kind)
+        return len(events)
+
+    @staticmethod
+    def _read_button(card, subs):
+        latch = any(s[0] is card and s[1] == "button" and s[4] for s in subs)
+        return card.get_button_latch() if latch else card.get_button()
+
+    def _evaluate_thresholds(self, thresholds, snapshots, timestamp, events):
+        subs, high, low, state = thresholds
+        if not subs:
+            return
+        nan = float("nan")
+        values = [getattr(snapshots[id(sub[0])], sub[1])[sub[2] - 1] if id(sub[0]) in snapshots else nan
+                  for _, sub in subs]
+        if self._numpy:
+            values = numpy.array(values, dtype=float)
+            valid = ~numpy.isnan(values)
+            above = valid & (values >= high)
+            below = valid & (values <= low)
+            rising = above & (state != 2)
+            # With low == high a value on the limit is above, as in the
+            # if/elif of the pure Python path
+            below &= ~above
+            falling = below & (state == 2)
+            first = valid & (state == 0)
+            state[above] = 2
+            state[below] = 1
+            state[first & ~above & ~below] = 1
+            fired = numpy.nonzero(rising | falling)[0].tolist()
+        else:
+            fired = []
+            for i, value in enumerate(values):
+                if value != value:
+                    continue
+                if value >= high[i]:
+                    if state[i] != 2:
+                        fired.append(i)
+                    state[i] = 2
+                elif value <= low[i]:
+                    if state[i] == 2:
+                        fired.append(i)
+                    state[i] = 1
+                elif not state[i]:
+                    state[i] = 1
+        for i in fired:
+            card, kind, channel, callback, _ = subs[i][1]
+            events.append((callback, Event(card, kind, channel, float(values[i]), timestamp)))
+
+    def run(self, period):
+        """Dispatch at a fixed period until :meth:`stop` is called.
+
+        Args:
+            period (float): Cycle period in seconds
+        """
+        self._stop.clear()
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            self.poll()
+            next_time += period
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            self._stop.wait(next_time - now)
+
+    def start(self, period):
+        """Run the dispatch loop in a background thread.
+
+        Args:
+            period (float): Cycle period in seconds
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, args=(period,),
+                                        name="multiio-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the dispatch loop."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
@@ -0,0 +1,327 @@
+"""Modbus TCP gateway serving every card of a stack from one snapshot cache.
+
+Reads of all clients are answered from the latest snapshot of each card,
+refreshed at a fixed period (and on demand when older than ``max_age``).
+Writes are queued and applied per card in one :meth:`SMmultiio.batch`, so
+the bus load does not grow with the number of clients::
+
+    >>> gateway = ModbusTcpGateway(port=5020, period=0.1)
+    >>> asyncio.run(gateway.serve_forever())
+
+The register map is the one of ``MODBUS.md`` (see :mod:`multiio.modbus`);
+each card answers to the unit identifier ``stack + offset``.
+"""
+
+import asyncio
+import struct
+import time
+
+import multiio.multiio_data as data
+from multiio import discover
+from multiio.aio import get_executor
+from multiio.modbus import ModbusSlave, COILS, DEFAULT_OFFSET, READ_INPUT_REGISTERS
+from multiio.modbus import ILLEGAL_DATA_VALUE, SLAVE_DEVICE_FAILURE
+
+# Exception codes of gateways
+GATEWAY_PATH_UNAVAILABLE = 0x0a
+GATEWAY_TARGET_FAILED = 0x0b
+
+_MBAP = struct.Struct(">HHHB")
+
+
+class SnapshotCache:
+    """Latest snapshot of each card, shared by all readers.
+
+    Concurrent requests for a stale card wait for the same read.
+
+    Args:
+        cards (list): SMmultiio cards
+        max_age (float): Oldest snapshot served in seconds
+
+    Attributes:
+        reads (int): Snapshots read from the cards
+        errors (int): Failed snapshot reads
+    """
+    def __init__(self, cards, max_age=0.2):
+        self.cards = list(cards)
+        self.max_age = max_age
+        self.reads = 0
+        self.errors = 0
+        self._entries = {id(card): (None, float("-inf")) for card in self.cards}
+        self._inflight = {}
+
+    def peek(self, card):
+        """Get the cached snapshot of a card without refreshing it.
+
+        Returns:
+            (Snapshot) Latest snapshot, None before the first read
+        """
+        return self._entries[id(card)][0]
+
+    def age(self, card):
+        """Get the seconds since the cached snapshot of a card was read."""
+        return time.monotonic() - self._entries[id(card)][1]
+
+    def invalidate(self, card):
+        """Make the next :meth:`get` of a card read it again."""
+        snapshot, _ = self._entries[id(card)]
+        self._entries[id(card)] = (snapshot, float("-inf"))
+
+    async def get(self, card):
+        """Get the snapshot of a card, read again if older than ``max_age``.
+
+        Returns:
+            (Snapshot) Card snapshot
+        """
+        if self.age(card) > self.max_age:
+            await self.refresh(card)
+        return self.peek(card)
+
+    async def refresh(self, card):
+        """Read the snapshot of a card now, or join a read in progress.
+
+        Returns:
+            (Snapshot) Card snapshot
+        """
+        key = id(card)
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(get_executor(card._i2c_bus_no), card.read_snapshot)
+            self._inflight[key] = future
+            try:
+                snapshot = await future
+            except (OSError, IOError):
+                self.errors += 1
+                raise
+            finally:
+                del self._inflight[key]
+            self.reads += 1
+            self._entries[key] = (snapshot, time.monotonic())
+            return snapshot
+        return await asyncio.shield(future)
+
+
+class _GatewaySlave(ModbusSlave):
+    # Queue writes in the gateway instead of calling the card
+    def __init__(self, gateway, card):
+        super().__init__(card, snapshot=lambda: gateway.cache.peek(card))
+        self._gateway = gateway
+        self.queued = []
+
+    def write_coils(self, address, states):
+        for i, state in enumerate(states):
+            self.queued.append(self._gateway._queue(self.card, "coil", address + i, 1 if state else 0))
+
+    def write_registers(self, address, values):
+        for i, value in enumerate(values):
+            self.queued.append(self._gateway._queue(self.card, "holding", address + i, value))
+
+
+class ModbusTcpGateway:
+    """Modbus TCP server for the cards of a stack.
+
+    Args:
+        cards (list): SMmultiio cards, every card found with
+            :func:`multiio.discover` if None
+        host (str): Listen address
+        port (int): Listen port
+        offset (int): Unit identifier offset added to the stack level
+        period (float): Snapshot refresh period in seconds
+        max_age (float): Oldest snapshot answered, 2 periods if None
+        write_delay (float): Seconds writes wait for more writes to merge with
+        i2c (int): i2c bus number used when cards is None
+        bus: SMBus compatible backend used when cards is None
+
+    Attributes:
+        cache (SnapshotCache): Snapshot cache
+        requests (int): Requests answered
+        writes (int): Register and coil writes received
+        batches (int): Write batches applied to the cards
+        clients (int): Connected clients
+    """
+    def __init__(self, cards=None, host="0.0.0.0", port=502, offset=DEFAULT_OFFSET,
+                 period=0.1, max_age=None, write_delay=0.0, i2c=1, bus=None):
+        if cards is None:
+            cards = [found.card for found in discover(i2c, bus)]
+        self.cache = SnapshotCache(cards, period * 2 if max_age is None else max_age)
+        self.host = host
+        self.port = port
+        self.period = period
+        self.write_delay = write_delay
+        self.requests = 0
+        self.writes = 0
+        self.batches = 0
+        self.clients = 0
+        self._slaves = {card._hw_address_ - data.SLAVE_OWN_ADDRESS_BASE + offset: _GatewaySlave(self, card)
+                        for card in cards}
+        self._by_card = {id(slave.card): slave for slave in self._slaves.values()}
+        self._pending = {}
+        self._flushes = {}
+        self._server = None
+        self._refresher = None
+        self._handlers = {}
+
+    async def start(self):
+        """Start listening and refreshing the snapshots."""
+        self._server = await asyncio.start_server(self._serve_client, self.host, self.port)
+        self._refresher = asyncio.ensure_future(self._refresh_loop())
+        return self._server
+
+    async def serve_forever(self):
+        """Serve until cancelled."""
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stop serving; queued writes are still applied."""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._handlers):
+                writer.close()
+            await asyncio.gather(*self._handlers.values(), return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        for flush in list(self._flushes.values()):
+            await asyncio.gather(flush, return_exceptions=True)
+
+    async def _refresh_loop(self):
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        while True:
+            for card in self.cache.cards:
+                if self.cache.age(card) >= self.period / 2:
+                    try:
+                        await self.cache.refresh(card)
+                    except (OSError, IOError):
+                        pass
+            next_time += self.period
+            now = loop.time()
+            if next_time < now:
+                next_time = now
+            await asyncio.sleep(next_time - now)
+
+    async def _serve_client(self, reader, writer):
+        self.clients += 1
+        self._handlers[writer] = asyncio.current_task()
+        try:
+            while True:
+                header = await reader.readexactly(_MBAP.size)
+                transaction, protocol, length, unit = _MBAP.unpack(header)
+                if length < 2:
+                    break
+                pdu = await reader.readexactly(length - 1)
+                if protocol != 0:
+                    continue
+                response = await self.execute(unit, pdu)
+                writer.write(_MBAP.pack(transaction, 0, len(response) + 1, unit) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients -= 1
+            self._handlers.pop(writer, None)
+            writer.close()
+
+    async def execute(self, unit, pdu):
+        """Answer one request PDU addressed to a unit.
+
+        Args:
+            unit (int): Unit identifier
+            pdu (bytes): Request function code and data
+
+        Returns:
+            (bytes) Response PDU
+        """
+        self.requests += 1
+        function = pdu[0]
+        slave = self._slaves.get(unit)
+        if slave is None:
+            return bytes([function | 0x80, GATEWAY_PATH_UNAVAILABLE])
+        if function <= READ_INPUT_REGISTERS:
+            try:
+                await self.cache.get(slave.card)
+            except (OSError, IOError):
+                return bytes([function | 0x80, GATEWAY_TARGET_FAILED])
+            return slave.handle(pdu)
+        slave.queued = []
+        response = slave.handle(pdu)
+        queued, slave.queued = slave.queued, []
+        for result in await asyncio.gather(*queued, return_exceptions=True):
+            if isinstance(result, ValueError):
+                return bytes([function | 0x80, ILLEGAL_DATA_VALUE])
+            if isinstance(result, Exception):
+                return bytes([function | 0x80, SLAVE_DEVICE_FAILURE])
+        return response
+
+    def _queue(self, card, table, address, value):
+        # Last value wins for writes to the same object before the flush
+        self.writes += 1
+        pending = self._pending.setdefault(id(card), {})
+        key = (table, address)
+        future = asyncio.get_running_loop().create_future()
+        previous = pending.get(key)
+        pending[key] = (value, (previous[1] if previous else []) + [future])
+        if id(card) not in self._flushes:
+            self._flushes[id(card)] = asyncio.ensure_future(self._flush(card))
+        return future
+
+    async def _flush(self, card):
+        key = id(card)
+        try:
+            if self.write_delay:
+                await asyncio.sleep(self.write_delay)
+            pending = self._pending.pop(key, {})
+        finally:
+            del self._flushes[key]
+        if not pending:
+            return
+        loop = asyncio.get_running_loop()
+        setters = self._by_card[key]._setters
+        try:
+            errors = await loop.run_in_executor(get_executor(card._i2c_bus_no), _apply, card, setters, pending)
+        except Exception as e:
+            errors = {item: e for item in pending}
+        self.batches += 1
+        self.cache.invalidate(card)
+        for item, (_, futures) in pending.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if item in errors:
+                    future.set_exception(errors[item])
+                else:
+                    future.set_result(None)
+
+def _apply(card, setters, pending):
+    # Runs on the bus thread: one batch for the holding registers, one
+    # relay write for the coils when they are all written
+    errors = {}
+    with card.batch():
+        for (table, address), (value, _) in pending.items():
+            if table == "holding":
+                try:
+                    setters[address](value)
+                except (ValueError, struct.error) as e:
+                    errors[(table, address)] = e
+    coils = {address: value for (table, address), (value, _) in pending.items() if table == "coil"}
+    if len(coils) == COILS:
+        relays = sum(value << address for address, value in coils.items())
+        try:
+            card.set_all_relays(relays)
+        except (OSError, IOError) as e:
+            errors.update({("coil", address): e for address in coils})
+    else:
+        for address, value in coils.items():
+            try:
+                card.set_relay(address + 1, value)
+            except (OSError, IOError) as e:
+                errors[("coil", address)] = e
+    return errors
@@ -0,0 +1,292 @@
+"""I2C transaction statistics: counts, bytes, latency histograms and errors.
+
+Statistics are collected by wrapping a card bus with :class:`InstrumentedBus`,
+usually through :meth:`multiio.SMmultiio.instrument`. Cards without
+instrumentation talk to their bus directly and pay nothing::
+
+    >>> metrics = Metrics()
+    >>> card.instrument(metrics)
+    >>> card.read_snapshot()
+    >>> print(metrics.prometheus())
+"""
+
+import bisect
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+OPERATIONS = (
+    "read_byte", "write_byte", "write_quick",
+    "read_byte_data", "write_byte_data",
+    "read_word_data", "write_word_data",
+    "read_i2c_block_data", "write_i2c_block_data",
+    "write_block_data", "i2c_rdwr",
+)
+_OP_INDEX = {name: index for index, name in enumerate(OPERATIONS)}
+
+REGISTERS = 256
+
+_clock = time.perf_counter
+
+
+class Metrics:
+    """Transaction statistics by operation and by register.
+
+    All counters are preallocated lists, so recording a transaction does not
+    allocate. Updates are locked, so one instance can count the transactions
+    of several threads.
+
+    Args:
+        buckets (tuple): Ascending latency bucket upper bounds in seconds
+
+    Attributes:
+        transactions (list): Transactions by operation index (see ``OPERATIONS``)
+        bytes (list): Payload bytes moved by operation index
+        errors (list): Failed transactions by operation index
+        latency_sum (list): Total seconds by operation index
+        latency_buckets (list): Per operation list of histogram counts, the
+            last one counting transactions slower than every bucket
+        register_transactions (list): Transactions by start register
+        register_bytes (list): Payload bytes by start register
+        register_errors (list): Failed transactions by start register
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.hooks = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero all statistics."""
+        ops = len(OPERATIONS)
+        with self._lock:
+            self.transactions = [0] * ops
+            self.bytes = [0] * ops
+            self.errors = [0] * ops
+            self.latency_sum = [0.0] * ops
+            self.latency_buckets = [[0] * (len(self.buckets) + 1) for _ in range(ops)]
+            self.register_transactions = [0] * REGISTERS
+            self.register_bytes = [0] * REGISTERS
+            self.register_errors = [0] * REGISTERS
+
+    def add_hook(self, hook):
+        """Call ``hook(operation, register, nbytes, seconds, error)`` after
+        every transaction. register is -1 for transfers without one.
+
+        Args:
+            hook (callable): Hook function
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """Stop calling a hook added with :meth:`add_hook`."""
+        self.hooks.remove(hook)
+
+    def record(self, operation, register, nbytes, seconds, error=False):
+        """Account one transaction.
+
+        Args:
+            operation (str): SMBus method name
+            register (int): Start register, -1 if none
+            nbytes (int): Payload bytes
+            seconds (float): Duration
+            error (bool): True if the transaction failed
+        """
+        op = _OP_INDEX[operation]
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.transactions[op] += 1
+            self.latency_sum[op] += seconds
+            self.latency_buckets[op][bucket] += 1
+            if error:
+                self.errors[op] += 1
+            else:
+                self.bytes[op] += nbytes
+            if 0 <= register < REGISTERS:
+                self.register_transactions[register] += 1
+                if error:
+                    self.register_errors[register] += 1
+                else:
+                    self.register_bytes[register] += nbytes
+        for hook in self.hooks:
+            hook(operation, register, nbytes, seconds, error)
+
+    def prometheus(self, prefix="multiio", labels=None):
+        """Format the statistics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Metric name prefix
+            labels (dict): Extra labels added to every sample (e.g. stack)
+
+        Returns:
+            (str) Exposition text
+        """
+        extra = "".join(',{}="{}"'.format(k, v) for k, v in sorted((labels or {}).items()))
+        lines = []
+
+        def family(name, kind, text):
+            lines.append("# HELP {}_{} {}".format(prefix, name, text))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+
+        def per_op(name, values):
+            for op, value in enumerate(values):
+                if self.transactions[op]:
+                    lines.append('{}_{}{{op="{}"{}}} {}'.format(prefix, name, OPERATIONS[op], extra, value))
+
+        family("transactions_total", "counter", "I2C transactions by operation.")
+        per_op("transactions_total", self.transactions)
+        family("bytes_total", "counter", "I2C payload bytes by operation.")
+        per_op("bytes_total", self.bytes)
+        family("errors_total", "counter", "Failed I2C transactions by operation.")
+        per_op("errors_total", self.errors)
+        family("transaction_seconds", "histogram", "I2C transaction latency.")
+        for op, counts in enumerate(self.latency_buckets):
+            if not self.transactions[op]:
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('{}_transaction_seconds_bucket{{op="{}"{},le="{}"}} {}'.format(
+                    prefix, OPERATIONS[op], extra, le, cumulative))
+            lines.append('{}_transaction_seconds_sum{{op="{}"{}}} {!r}'.format(
+                prefix, OPERATIONS[op], extra, self.latency_sum[op]))
+            lines.append('{}_transaction_seconds_count{{op="{}"{}}} {}'.format(
+                prefix, OPERATIONS[op], extra, self.transactions[op]))
+        for name, values, text in (
+                ("register_transactions_total", self.register_transactions, "I2C transactions by start register."),
+                ("register_bytes_total", self.register_bytes, "I2C payload bytes by start register."),
+                ("register_errors_total", self.register_errors, "Failed I2C transactions by start register.")):
+            family(name, "counter", text)
+            for register, value in enumerate(values):
+                if value:
+                    lines.append('{}_{}{{register="{}"{}}} {}'.format(prefix, name, register, extra, value))
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedBus:
+    """SMBus wrapper recording every transaction into a :class:`Metrics`.
+
+    Args:
+        bus: SMBus compatible object to wrap
+        metrics (Metrics): Statistics receiver
+    """
+    def __init__(self, bus, metrics):
+        self.bus = bus
+        self.metrics = metrics
+
+    def _failed(self, operation, register, nbytes, start):
+        self.metrics.record(operation, register, nbytes, _clock() - start, True)
+
+    # One method per call signature: forwarding through *args would build
+    # an argument tuple on every transaction
+    def read_byte(self, i2c_addr, force=None):
+        start = _clock()
+        try:
+            result = self.bus.read_byte(i2c_addr, force)
+        except Exception:
+            self._failed("read_byte", -1, 1, start)
+            raise
+        self.metrics.record("read_byte", -1, 1, _clock() - start)
+        return result
+    def write_byte(self, i2c_addr, value, force=None):
+        start = _clock()
+        try:
+            result = self.bus.write_byte(i2c_addr, value, force)
+        except Exception:
+            self._failed("write_byte", -1, 1, start)
+            raise
+        self.metrics.record("write_byte", -1, 1, _clock() - start)
+        return result
+    def write_quick(self, i2c_addr, force=None):
+        start = _clock()
+        try:
+            result = self.bus.write_quick(i2c_addr, force)
+        except Exception:
+            self._failed("write_quick", -1, 0, start)
+            raise
+        self.metrics.record("write_quick", -1, 0, _clock() - start)
+        return result
+    def read_byte_data(self, i2c_addr, register, force=None):
+        start = _clock()
+        try:
+            result = self.bus.read_byte_data(i2c_addr, register, force)
+        except Exception:
+            self._failed("read_byte_data", register, 1, start)
+            raise
+        self.metrics.record("read_byte_data", register, 1, _clock() - start)
+        return result
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        start = _clock()
+        try:
+            result = self.bus.write_byte_data(i2c_addr, register, value, force)
+        except Exception:
+            self._failed("write_byte_data", register, 1, start)
+            raise
+        self.metrics.record("write_byte_data", register, 1, _clock() - start)
+        return result
+    def read_word_data(self, i2c_addr, register, force=None):
+        start = _clock()
+        try:
+            result = self.bus.read_word_data(i2c_addr, register, force)
+        except Exception:
+            self._failed("read_word_data", register, 2, start)
+            raise
+        self.metrics.record("read_word_data", register, 2, _clock() - start)
+        return result
+    def write_word_data(self, i2c_addr, register, value, force=None):
+        start = _clock()
+        try:
+            result = self.bus.write_word_data(i2c_addr, register, value, force)
+        except Exception:
+            self._failed("write_word_data", register, 2, start)
+            raise
+        self.metrics.record("write_word_data", register, 2, _clock() - start)
+        return result
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        start = _clock()
+        try:
+            result = self.bus.read_i2c_block_data(i2c_addr, register, length, force)
+        except Exception:
+            self._failed("read_i2c_block_data", register, length, start)
+            raise
+        self.metrics.record("read_i2c_block_data", register, length, _clock() - start)
+        return result
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        nbytes = len(data)
+        start = _clock()
+        try:
+            result = self.bus.write_i2c_block_data(i2c_addr, register, data, force)
+        except Exception:
+            self._failed("write_i2c_block_data", register, nbytes, start)
+            raise
+        self.metrics.record("write_i2c_block_data", register, nbytes, _clock() - start)
+        return result
+    def write_block_data(self, i2c_addr, register, data, force=None):
+        nbytes = len(data)
+        start = _clock()
+        try:
+            result = self.bus.write_block_data(i2c_addr, register, data, force)
+        except Exception:
+            self._failed("write_block_data", register, nbytes, start)
+            raise
+        self.metrics.record("write_block_data", register, nbytes, _clock() - start)
+        return result
+    def i2c_rdwr(self, *i2c_msgs):
+        register = -1
+        if i2c_msgs and not i2c_msgs[0].flags & 1 and i2c_msgs[0].len:
+            register = i2c_msgs[0].buf[0][0]
+        nbytes = sum(msg.len for msg in i2c_msgs)
+        start = _clock()
+        try:
+            result = self.bus.i2c_rdwr(*i2c_msgs)
+        except Exception:
+            self._failed("i2c_rdwr", register, nbytes, start)
+            raise
+        self.metrics.record("i2c_rdwr", register, nbytes, _clock() - start)
+        return result
+
+    def close(self):
+        self.bus.close()
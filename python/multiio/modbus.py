@@ -0,0 +1,959 @@
+"""Modbus RTU access to cards through their RS-485 port.
+
+The card firmware exposes its I/O as Modbus objects (see ``MODBUS.md``).
+:class:`SMmultiioModbus` offers the matching subset of the
+:class:`multiio.SMmultiio` methods over that map, reading a whole object
+table per request::
+
+    >>> client = RtuClient("/dev/ttyUSB0", baudrate=9600)
+    >>> card = SMmultiioModbus(0, client=client)
+    >>> card.read_snapshot()
+    >>> with card.batch():
+    ...     card.set_u_out(1, 2.5)
+    ...     card.set_i_out(1, 12)
+
+:class:`RtuSlave` serves :class:`multiio.SMmultiio` cards (or cards on a
+``multiio.emulator.EmulatedBus``) with the same map, e.g. on the master side
+of a pseudo terminal from :func:`open_pty` for testing without RS-485
+hardware.
+"""
+
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+try:
+    import termios
+    import tty
+except ImportError:
+    termios = None
+
+import multiio.multiio_data as data
+from multiio import SMmultiio, _Batch
+from multiio.snapshot import Snapshot
+CHANNEL_NO = data.CHANNEL_NO
+
+# Function codes
+READ_COILS = 0x01
+READ_DISCRETE_INPUTS = 0x02
+READ_HOLDING_REGISTERS = 0x03
+READ_INPUT_REGISTERS = 0x04
+WRITE_SINGLE_COIL = 0x05
+WRITE_SINGLE_REGISTER = 0x06
+WRITE_MULTIPLE_COILS = 0x0f
+WRITE_MULTIPLE_REGISTERS = 0x10
+
+# Exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+SLAVE_DEVICE_FAILURE = 0x04
+
+# Object map of MODBUS.md, protocol addresses from 0
+COILS = CHANNEL_NO["relay"]
+DISCRETE_INPUTS = CHANNEL_NO["opto"]
+INPUT_RTD_TEMP = 0
+INPUT_U_IN = INPUT_RTD_TEMP + CHANNEL_NO["rtd"]
+INPUT_I_IN = INPUT_U_IN + CHANNEL_NO["u_in"]
+INPUT_REGISTERS = INPUT_I_IN + CHANNEL_NO["i_in"]
+HOLDING_U_OUT = 0
+HOLDING_I_OUT = HOLDING_U_OUT + CHANNEL_NO["u_out"]
+HOLDING_SERVO = HOLDING_I_OUT + CHANNEL_NO["i_out"]
+HOLDING_MOTOR = HOLDING_SERVO + CHANNEL_NO["servo"]
+HOLDING_REGISTERS = HOLDING_MOTOR + CHANNEL_NO["motor"]
+
+# Slave address = stack level + offset (cfg485wr default)
+DEFAULT_OFFSET = 1
+# Largest counts of one request (Modbus application protocol 6.1-6.12)
+MAX_READ_BITS = 2000
+MAX_READ_REGISTERS = 125
+MAX_WRITE_BITS = 1968
+MAX_WRITE_REGISTERS = 123
+# Largest RTU frame
+MAX_ADU = 256
+
+_PARITY = {"N": 0, "E": 1, "O": 1}
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xa001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(frame):
+    """Compute the Modbus RTU CRC of a frame.
+
+    Args:
+        frame (bytes): Slave address and PDU
+
+    Returns:
+        (int) CRC, sent low byte first
+    """
+    crc = 0xffff
+    for byte in frame:
+        crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ byte) & 0xff]
+    return crc
+
+
+class ModbusError(IOError):
+    """Exception response of a slave.
+
+    Attributes:
+        code (int): Modbus exception code
+        function (int): Function code of the request
+    """
+    def __init__(self, function, code):
+        super().__init__(errno.EREMOTEIO, "Modbus exception {} on function {:#04x}".format(code, function))
+        self.function = function
+        self.code = code
+
+
+def pack_bits(states):
+    """Pack bit values LSB first, as in coil and discrete input PDUs.
+
+    Args:
+        states (list): Bit values
+
+    Returns:
+        (bytes) Packed bits
+    """
+    packed = bytearray((len(states) + 7) // 8)
+    for i, state in enumerate(states):
+        if state:
+            packed[i >> 3] |= 1 << (i & 7)
+    return bytes(packed)
+
+
+def unpack_bits(buf, count):
+    """Unpack ``count`` bits packed by :func:`pack_bits`.
+
+    Returns:
+        (list) Bit values as 0/1
+    """
+    return [(buf[i >> 3] >> (i & 7)) & 1 for i in range(count)]
+
+
+def _u16(value):
+    return int(round(value)) & 0xffff
+
+
+def _i16(raw):
+    return raw - 0x10000 if raw & 0x8000 else raw
+
+
+def snapshot_tables(snapshot):
+    """Get the Modbus object tables of a card snapshot.
+
+    Args:
+        snapshot (Snapshot): Card state
+
+    Returns:
+        (tuple) (coils, discrete_inputs, input_registers, holding_registers)
+            lists, registers as unsigned 16 bit values in MODBUS.md units
+    """
+    scale = data.VOLT_TO_MILIVOLT
+    coils = [(snapshot.relays >> i) & 1 for i in range(COILS)]
+    discrete = [(snapshot.opto >> i) & 1 for i in range(DISCRETE_INPUTS)]
+    inputs = ([_u16(t * 10) for t in snapshot.rtd_temp]
+              + [_u16(v * scale) for v in snapshot.u_in]
+              + [_u16(v * scale) for v in snapshot.i_in])
+    holding = ([_u16(v * scale) for v in snapshot.u_out]
+               + [_u16(v * scale) for v in snapshot.i_out]
+               + [_u16(v * 10) for v in snapshot.servo]
+               + [_u16(snapshot.motor * 10)])
+    return coils, discrete, inputs, holding
+
+
+def tables_snapshot(coils, discrete, inputs, holding):
+    """Build a snapshot from the Modbus object tables of a card.
+
+    Values not exposed over Modbus (leds, analog_type, rtd_res) are None.
+
+    Returns:
+        (Snapshot) Card state
+    """
+    scale = data.VOLT_TO_MILIVOLT
+    relays = sum(bit << i for i, bit in enumerate(coils))
+    opto = sum(bit << i for i, bit in enumerate(discrete))
+
+    def channels(table, start, kind, convert):
+        return tuple(convert(raw) for raw in table[start:start + CHANNEL_NO[kind]])
+
+    return Snapshot(
+        relays, None, opto, None,
+        channels(inputs, INPUT_U_IN, "u_in", lambda raw: raw / scale),
+        channels(inputs, INPUT_I_IN, "i_in", lambda raw: raw / scale),
+        channels(holding, HOLDING_U_OUT, "u_out", lambda raw: raw / scale),
+        channels(holding, HOLDING_I_OUT, "i_out", lambda raw: raw / scale),
+        _i16(holding[HOLDING_MOTOR]) / 10,
+        channels(holding, HOLDING_SERVO, "servo", lambda raw: _i16(raw) / 10),
+        channels(inputs, INPUT_RTD_TEMP, "rtd", lambda raw: _i16(raw) / 10),
+        None)
+
+
+def holding_setters(card):
+    """Map holding registers to the card setters taking the register value.
+
+    Args:
+        card: SMmultiio compatible card
+
+    Returns:
+        (list) Callable per holding register address
+    """
+    scale = data.VOLT_TO_MILIVOLT
+    setters = []
+    for channel in range(1, CHANNEL_NO["u_out"] + 1):
+        setters.append(lambda raw, ch=channel: card.set_u_out(ch, raw / scale))
+    for channel in range(1, CHANNEL_NO["i_out"] + 1):
+        setters.append(lambda raw, ch=channel: card.set_i_out(ch, raw / scale))
+    for channel in range(1, CHANNEL_NO["servo"] + 1):
+        setters.append(lambda raw, ch=channel: card.set_servo(ch, _i16(raw) / 10))
+    setters.append(lambda raw: card.set_motor(_i16(raw) / 10))
+    return setters
+
+
+def _open_serial(port, baudrate, parity, stopbits):
+    if termios is None:
+        raise OSError(errno.ENOSYS, "Serial ports need termios")
+    speed = getattr(termios, "B{}".format(baudrate), None)
+    if speed is None:
+        raise ValueError("Invalid baudrate!")
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        attrs[2] &= ~(termios.PARENB | termios.PARODD | termios.CSTOPB | termios.CRTSCTS)
+        attrs[2] |= termios.CLOCAL | termios.CREAD
+        if parity != "N":
+            attrs[2] |= termios.PARENB | (termios.PARODD if parity == "O" else 0)
+        if stopbits == 2:
+            attrs[2] |= termios.CSTOPB
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        termios.tcflush(fd, termios.TCIOFLUSH)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+class PtyPair:
+    """Raw pseudo terminal pair opened by :func:`open_pty`.
+
+    The slave end stays open until :meth:`close`, so the master does not
+    see a hang up between client connections.
+
+    Attributes:
+        master (int): Master file descriptor, for :class:`RtuSlave`
+        slave (int): Slave file descriptor
+        path (str): Slave device path, for :class:`RtuClient`
+    """
+    def __init__(self):
+        self.master, self.slave = os.openpty()
+        if termios is not None:
+            tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+
+    def close(self):
+        """Close both ends."""
+        for name in ("master", "slave"):
+            fd = getattr(self, name)
+            if fd is not None:
+                setattr(self, name, None)
+                os.close(fd)
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_pty():
+    """Open a raw pseudo terminal pair.
+
+    Serve cards on the master with :class:`RtuSlave` and point
+    :class:`RtuClient` at the slave path; close the pair when done::
+
+        >>> with open_pty() as pty:
+        ...     slave = RtuSlave(pty.master, cards)
+        ...     client = RtuClient(pty.path)
+
+    Returns:
+        (PtyPair) Pseudo terminal pair
+    """
+    return PtyPair()
+
+
+def _request_length(frame):
+    # Expected RTU request size from its first bytes, None if unknown yet
+    if len(frame) < 2:
+        return None
+    function = frame[1]
+    if function in (WRITE_MULTIPLE_COILS, WRITE_MULTIPLE_REGISTERS):
+        return 9 + frame[6] if len(frame) >= 7 else None
+    if READ_COILS <= function <= WRITE_SINGLE_REGISTER:
+        return 8
+    return 0
+
+
+def _response_length(frame):
+    # Expected RTU response size from its first bytes, None if unknown yet
+    if len(frame) < 3:
+        return None
+    function = frame[1]
+    if function & 0x80:
+        return 5
+    if READ_COILS <= function <= READ_INPUT_REGISTERS:
+        return 5 + frame[2]
+    return 8
+
+
+class _RtuPort:
+    # Framing shared by client and slave: CRC, inter-frame gap and frame
+    # reception by expected length
+    def __init__(self, port, baudrate, parity, stopbits, frame_gap):
+        if parity not in _PARITY:
+            raise ValueError("Invalid parity! Must be N, E or O")
+        if stopbits not in (1, 2):
+            raise ValueError("Invalid stop bits! Must be 1 or 2")
+        if isinstance(port, int):
+            self.fd = port
+            self._owned = False
+        else:
+            self.fd = _open_serial(port, baudrate, parity, stopbits)
+            self._owned = True
+        self.char_time = (1 + 8 + _PARITY[parity] + stopbits) / baudrate
+        if frame_gap is None:
+            # 3.5 character times, fixed at 1.75 ms above 19200 baud
+            frame_gap = 3.5 * self.char_time if baudrate <= 19200 else 0.00175
+        self.frame_gap = frame_gap
+        self._idle_at = 0.0
+
+    def close(self):
+        if self._owned and self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+
+    def send(self, frame):
+        delay = self._idle_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        adu = frame + struct.pack("<H", crc16(frame))
+        os.write(self.fd, adu)
+        self._idle_at = time.monotonic() + len(adu) * self.char_time + self.frame_gap
+        return len(adu)
+
+    def receive(self, expected_length, timeout):
+        """Read one frame; a gap of silence ends frames of unknown length.
+
+        Returns:
+            (bytes) Frame without CRC, None on timeout or CRC error
+        """
+        frame = bytearray()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        length = None
+        while True:
+            if frame:
+                wait = max(self.frame_gap, 0.05)
+            elif deadline is None:
+                wait = None
+            else:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    return None
+            ready, _, _ = select.select([self.fd], [], [], wait)
+            if not ready:
+                if not frame:
+                    continue
+                break
+            chunk = os.read(self.fd, MAX_ADU - len(frame))
+            if not chunk:
+                raise OSError(errno.EPIPE, "Serial port closed")
+            frame += chunk
+            if length is None:
+                length = expected_length(frame)
+            if length and len(frame) >= length or len(frame) >= MAX_ADU:
+                break
+        self._idle_at = time.monotonic() + self.frame_gap
+        if length:
+            del frame[length:]
+        if len(frame) < 4 or crc16(frame[:-2]) != struct.unpack_from("<H", frame, len(frame) - 2)[0]:
+            return None
+        return bytes(frame[:-2])
+
+
+class RtuClient:
+    """Modbus RTU master on a serial port.
+
+    Requests from several threads and cards sharing the client are
+    serialized.
+
+    Args:
+        port: Serial device path, or an open file descriptor (e.g. a pty)
+        baudrate (int): Line speed
+        parity (str): "N", "E" or "O"
+        stopbits (int): 1 or 2
+        timeout (float): Seconds to wait for a response
+        frame_gap (float): Silent interval before each request, 3.5
+            character times (1.75 ms above 19200 baud) if None
+
+    Attributes:
+        requests (int): Requests sent
+        bytes_on_wire (int): Request and response bytes
+        errors (int): Requests without a valid response
+    """
+    def __init__(self, port, baudrate=9600, parity="N", stopbits=1, timeout=0.5, frame_gap=None):
+        self._port = _RtuPort(port, baudrate, parity, stopbits, frame_gap)
+        self.timeout = timeout
+        self.requests = 0
+        self.bytes_on_wire = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def frame_gap(self):
+        """Silent interval between frames in seconds."""
+        return self._port.frame_gap
+    @frame_gap.setter
+    def frame_gap(self, value):
+        self._port.frame_gap = value
+
+    def close(self):
+        """Close the serial port if it was opened by the client."""
+        self._port.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def request(self, slave, pdu):
+        """Send one request and wait for the response.
+
+        Args:
+            slave (int): Slave address, 0 to broadcast (no response)
+            pdu (bytes): Function code and data
+
+        Returns:
+            (bytes) Response PDU, None for broadcasts
+        """
+        with self._lock:
+            port = self._port
+            if termios is not None:
+                # Drop late answers to a timed out request
+                termios.tcflush(port.fd, termios.TCIFLUSH)
+            self.requests += 1
+            self.bytes_on_wire += port.send(bytes([slave]) + pdu)
+            if slave == 0:
+                return None
+            frame = port.receive(_response_length, self.timeout)
+            if frame is None or frame[0] != slave or frame[1] & 0x7f != pdu[0]:
+                self.errors += 1
+                raise OSError(errno.ETIMEDOUT, "No valid response from slave {}".format(slave))
+            self.bytes_on_wire += len(frame) + 2
+        if frame[1] & 0x80:
+            self.errors += 1
+            raise ModbusError(pdu[0], frame[2])
+        return frame[1:]
+
+    def _read(self, slave, function, address, count):
+        return self.request(slave, struct.pack(">BHH", function, address, count))[2:]
+
+    def read_coils(self, slave, address, count):
+        """Read coils (FC01).
+
+        Returns:
+            (list) Coil states as 0/1
+        """
+        return unpack_bits(self._read(slave, READ_COILS, address, count), count)
+    def read_discrete_inputs(self, slave, address, count):
+        """Read discrete inputs (FC02).
+
+        Returns:
+            (list) Input states as 0/1
+        """
+        return unpack_bits(self._read(slave, READ_DISCRETE_INPUTS, address, count), count)
+    def read_holding_registers(self, slave, address, count):
+        """Read holding registers (FC03).
+
+        Returns:
+            (tuple) Unsigned 16 bit register values
+        """
+        return struct.unpack(">{}H".format(count), self._read(slave, READ_HOLDING_REGISTERS, address, count))
+    def read_input_registers(self, slave, address, count):
+        """Read input registers (FC04).
+
+        Returns:
+            (tuple) Unsigned 16 bit register values
+        """
+        return struct.unpack(">{}H".format(count), self._read(slave, READ_INPUT_REGISTERS, address, count))
+    def write_coil(self, slave, address, state):
+        """Write one coil (FC05)."""
+        self.request(slave, struct.pack(">BHH", WRITE_SINGLE_COIL, address, 0xff00 if state else 0))
+    def write_register(self, slave, address, value):
+        """Write one holding register (FC06)."""
+        self.request(slave, struct.pack(">BHH", WRITE_SINGLE_REGISTER, address, value & 0xffff))
+    def write_coils(self, slave, address, states):
+        """Write consecutive coils in one request (FC15)."""
+        bits = pack_bits(states)
+        self.request(slave, struct.pack(">BHHB", WRITE_MULTIPLE_COILS, address, len(states), len(bits)) + bits)
+    def write_registers(self, slave, address, values):
+        """Write consecutive holding registers in one request (FC16)."""
+        self.request(slave, struct.pack(">BHHB{}H".format(len(values)), WRITE_MULTIPLE_REGISTERS,
+                                        address, len(values), len(values) * 2,
+                                        *[v & 0xffff for v in values]))
+
+
+class SMmultiioModbus:
+    """Multi-IO card accessed over Modbus RTU, with the SMmultiio method names.
+
+    Only the values of the Modbus map are available: relays, opto inputs,
+    RTD temperatures, 0-10V and 4-20mA inputs and outputs, servos and motor.
+    Values have the units and validation of :class:`multiio.SMmultiio`;
+    analog values are transferred with the map resolution (mV, uA, 0.1).
+
+    Args:
+        stack (int): Stack level/device number
+        port: Serial device path or file descriptor, when client is None
+        client (RtuClient): Client shared by the cards on one RS-485 line
+        offset (int): Slave address offset set with ``cfg485wr``
+        **kwargs: RtuClient options (baudrate, parity, ...) when client is None
+    """
+    def __init__(self, stack=0, port=None, client=None, offset=DEFAULT_OFFSET, **kwargs):
+        if stack < 0 or stack > data.STACK_LEVEL_MAX:
+            raise ValueError("Invalid stack level!")
+        self._owned = client is None
+        if client is None:
+            client = RtuClient(port, **kwargs)
+        self.client = client
+        self.slave = stack + offset
+        self._batch_depth = 0
+        self._batch_pending = {}
+
+    def close(self):
+        """Close the client if it was created by the card."""
+        if self._owned:
+            self._owned = False
+            self.client.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    _check_channel = staticmethod(SMmultiio._check_channel)
+
+    def _get_input(self, address):
+        return self.client.read_input_registers(self.slave, address, 1)[0]
+    def _get_holding(self, address):
+        return self.client.read_holding_registers(self.slave, address, 1)[0]
+    def _set_holding(self, address, value):
+        value = int(value) & 0xffff
+        if self._batch_depth:
+            self._batch_pending[address] = value
+            return
+        self.client.write_register(self.slave, address, value)
+
+    def _batch_begin(self):
+        self._batch_depth += 1
+    def _batch_end(self, commit=True):
+        self._batch_depth -= 1
+        if self._batch_depth:
+            return
+        if commit:
+            self.flush()
+        else:
+            self._batch_pending.clear()
+
+    def batch(self):
+        """Buffer output writes and send them merged on exit.
+
+        Inside the context ``set_u_out``, ``set_i_out``, ``set_servo`` and
+        ``set_motor`` are only stored; on exit each contiguous register range
+        is sent with one Write Multiple Registers request, so a full output
+        update is one request. See :meth:`multiio.SMmultiio.batch`.
+
+        Returns:
+            Context manager
+        """
+        return _Batch(self)
+
+    def flush(self):
+        """Send the output writes buffered by :meth:`batch` now."""
+        pending = self._batch_pending
+        if not pending:
+            return
+        addresses = sorted(pending)
+        start = prev = addresses[0]
+        for address in addresses[1:] + [None]:
+            if address != prev + 1:
+                values = [pending[a] for a in range(start, prev + 1)]
+                if len(values) == 1:
+                    self.client.write_register(self.slave, start, values[0])
+                else:
+                    self.client.write_registers(self.slave, start, values)
+                start = address
+            prev = address
+        pending.clear()
+
+    def read_snapshot(self):
+        """Read relays, opto, analog inputs/outputs, motor, servo and RTD
+        temperatures with one request per object table (4 requests).
+
+        Returns:
+            (Snapshot) Card state, leds, analog_type and rtd_res are None
+        """
+        client, slave = self.client, self.slave
+        return tables_snapshot(
+            client.read_coils(slave, 0, COILS),
+            client.read_discrete_inputs(slave, 0, DISCRETE_INPUTS),
+            client.read_input_registers(slave, 0, INPUT_REGISTERS),
+            client.read_holding_registers(slave, 0, HOLDING_REGISTERS))
+
+    def get_relay(self, relay):
+        """Get relay state.
+
+        Args:
+            relay (int): Relay number
+
+        Returns:
+            (int) Relay state
+        """
+        self._check_channel("relay", relay)
+        return self.client.read_coils(self.slave, relay - 1, 1)[0]
+    def get_all_relays(self):
+        """Get all relays state as bitmask.
+
+        Returns:
+            (int) Relays state bitmask
+        """
+        coils = self.client.read_coils(self.slave, 0, COILS)
+        return sum(bit << i for i, bit in enumerate(coils))
+    def set_relay(self, relay, val):
+        """Set relay state.
+
+        Args:
+            relay (int): Relay number
+            val: 0(OFF) or 1(ON)
+        """
+        self._check_channel("relay", relay)
+        if val not in (0, 1):
+            raise ValueError("Invalid relay value[0-1]")
+        self.client.write_coil(self.slave, relay - 1, val)
+    def set_all_relays(self, val):
+        """Set all relays states as bitmask.
+
+        Args:
+            val (int): Relay bitmask
+        """
+        if(not (0 <= val and val <= (1 << COILS) - 1)):
+            raise ValueError("Invalid relay mask!")
+        self.client.write_coils(self.slave, 0, [(val >> i) & 1 for i in range(COILS)])
+
+    def get_opto(self, channel):
+        """Get optocoupled input status.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (bool) Channel status
+        """
+        self._check_channel("opto", channel)
+        return bool(self.client.read_discrete_inputs(self.slave, channel - 1, 1)[0])
+    def get_all_opto(self):
+        """Get all optocoupled input status as a bitmask.
+
+        Returns:
+            (int) Optocoupled bitmask
+        """
+        inputs = self.client.read_discrete_inputs(self.slave, 0, DISCRETE_INPUTS)
+        return sum(bit << i for i, bit in enumerate(inputs))
+
+    def get_rtd_temp(self, channel):
+        """Get RTD temperature in Celsius.
+
+        Args:
+            channel (int): RTD channel number
+
+        Returns:
+            (float) RTD Celsius value
+        """
+        self._check_channel("rtd", channel)
+        return _i16(self._get_input(INPUT_RTD_TEMP + channel - 1)) / 10
+    def get_u_in(self, channel):
+        """Get 0-10V input channel value in volts.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (float) Input value in volts
+        """
+        self._check_channel("u_in", channel)
+        return self._get_input(INPUT_U_IN + channel - 1) / data.VOLT_TO_MILIVOLT
+    def get_i_in(self, channel):
+        """Get 4-20mA input channel value in mA.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (float) 4-20mA input channel value in mA
+        """
+        self._check_channel("i_in", channel)
+        return self._get_input(INPUT_I_IN + channel - 1) / data.VOLT_TO_MILIVOLT
+
+    def get_u_out(self, channel):
+        """Get 0-10V output channel value in volts.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (float) 0-10V output value
+        """
+        self._check_channel("u_out", channel)
+        return self._get_holding(HOLDING_U_OUT + channel - 1) / data.VOLT_TO_MILIVOLT
+    def set_u_out(self, channel, value):
+        """Set 0-10V output channel value in volts.
+
+        Args:
+            channel (int): Channel number
+            value (float): Voltage value
+        """
+        self._check_channel("u_out", channel)
+        self._set_holding(HOLDING_U_OUT + channel - 1, value * data.VOLT_TO_MILIVOLT)
+    def get_i_out(self, channel):
+        """Get 4-20mA output channel value in mA.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (float) 4-20mA output value in mA
+        """
+        self._check_channel("i_out", channel)
+        return self._get_holding(HOLDING_I_OUT + channel - 1) / data.VOLT_TO_MILIVOLT
+    def set_i_out(self, channel, value):
+        """Set 4-20mA output channel value in mA.
+
+        Args:
+            channel (int): Channel number
+            value (float): Amperage value in mA
+        """
+        self._check_channel("i_out", channel)
+        self._set_holding(HOLDING_I_OUT + channel - 1, value * data.VOLT_TO_MILIVOLT)
+
+    def get_servo(self, channel):
+        """Get servo position value in %.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (float) Servo position value in % for specified channel.
+        """
+        self._check_channel("servo", channel)
+        return _i16(self._get_holding(HOLDING_SERVO + channel - 1)) / 10
+    def set_servo(self, channel, value):
+        """Set servo position value in %.
+
+        Args:
+            channel (int): Channel number
+            value (float): Servo position value in %
+        """
+        self._check_channel("servo", channel)
+        if(not(-140 <= value and value <= 140)):
+            raise ValueError("Servo value out of range! Must be [-140..140]")
+        self._set_holding(HOLDING_SERVO + channel - 1, value * 10)
+
+    def get_motor(self):
+        """Get motor speed value in %.
+
+        Returns:
+            (float) Motor speed value in %
+        """
+        return _i16(self._get_holding(HOLDING_MOTOR)) / 10
+    def set_motor(self, value):
+        """Set motor speed value in %.
+
+        Args:
+            value (float): Speed value in %
+        """
+        if(not(-100 <= value and value <= 100)):
+            raise ValueError("Motor value out of range! Must be [-100..100]")
+        self._set_holding(HOLDING_MOTOR, value * 10)
+
+
+class ModbusSlave:
+    """Modbus object map of one card, answering request PDUs.
+
+    Reads are served from one snapshot per request; register writes of a
+    request are applied inside one :meth:`SMmultiio.batch`, so a Write
+    Multiple Registers request becomes one i2c block write.
+
+    Args:
+        card: SMmultiio compatible card
+        snapshot (callable): Returns the Snapshot serving reads,
+            ``card.read_snapshot`` if None
+    """
+    def __init__(self, card, snapshot=None):
+        self.card = card
+        self.snapshot = snapshot if snapshot is not None else card.read_snapshot
+        self._setters = holding_setters(card)
+
+    def write_coils(self, address, states):
+        """Set relays from coil values."""
+        if address == 0 and len(states) == COILS:
+            self.card.set_all_relays(sum(bool(s) << i for i, s in enumerate(states)))
+            return
+        for i, state in enumerate(states):
+            self.card.set_relay(address + i + 1, 1 if state else 0)
+
+    def write_registers(self, address, values):
+        """Set outputs from holding register values."""
+        with self.card.batch():
+            for i, value in enumerate(values):
+                self._setters[address + i](value)
+
+    def handle(self, pdu):
+        """Execute one request.
+
+        Args:
+            pdu (bytes): Request function code and data
+
+        Returns:
+            (bytes) Response PDU, an exception response on errors
+        """
+        function = pdu[0]
+        try:
+            return self._handle(function, pdu)
+        except ModbusError as e:
+            return bytes([function | 0x80, e.code])
+        except (ValueError, struct.error):
+            return bytes([function | 0x80, ILLEGAL_DATA_VALUE])
+        except (OSError, IOError):
+            return bytes([function | 0x80, SLAVE_DEVICE_FAILURE])
+
+    def _handle(self, function, pdu):
+        if function in (READ_COILS, READ_DISCRETE_INPUTS, READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS):
+            address, count = struct.unpack_from(">HH", pdu, 1)
+            bits = function <= READ_DISCRETE_INPUTS
+            size = (COILS, DISCRETE_INPUTS, HOLDING_REGISTERS, INPUT_REGISTERS)[function - 1]
+            _check_range(function, address, count, size, MAX_READ_BITS if bits else MAX_READ_REGISTERS)
+            coils, discrete, inputs, holding = snapshot_tables(self.snapshot())
+            table = (coils, discrete, holding, inputs)[function - 1][address:address + count]
+            if bits:
+                payload = pack_bits(table)
+            else:
+                payload = struct.pack(">{}H".format(count), *table)
+            return bytes([function, len(payload)]) + payload
+        if function == WRITE_SINGLE_COIL:
+            address, value = struct.unpack_from(">HH", pdu, 1)
+            _check_range(function, address, 1, COILS, 1)
+            if value not in (0, 0xff00):
+                raise ModbusError(function, ILLEGAL_DATA_VALUE)
+            self.write_coils(address, [value != 0])
+            return pdu[:5]
+        if function == WRITE_SINGLE_REGISTER:
+            address, value = struct.unpack_from(">HH", pdu, 1)
+            _check_range(function, address, 1, HOLDING_REGISTERS, 1)
+            self.write_registers(address, [value])
+            return pdu[:5]
+        if function == WRITE_MULTIPLE_COILS:
+            address, count, nbytes = struct.unpack_from(">HHB", pdu, 1)
+            _check_range(function, address, count, COILS, MAX_WRITE_BITS)
+            if nbytes != (count + 7) // 8 or len(pdu) < 6 + nbytes:
+                raise ModbusError(function, ILLEGAL_DATA_VALUE)
+            self.write_coils(address, unpack_bits(pdu[6:], count))
+            return pdu[:5]
+        if function == WRITE_MULTIPLE_REGISTERS:
+            address, count, nbytes = struct.unpack_from(">HHB", pdu, 1)
+            _check_range(function, address, count, HOLDING_REGISTERS, MAX_WRITE_REGISTERS)
+            if nbytes != count * 2 or len(pdu) < 6 + nbytes:
+                raise ModbusError(function, ILLEGAL_DATA_VALUE)
+            self.write_registers(address, struct.unpack_from(">{}H".format(count), pdu, 6))
+            return pdu[:5]
+        raise ModbusError(function, ILLEGAL_FUNCTION)
+
+
+def _check_range(function, address, count, size, max_count):
+    if not (1 <= count <= max_count):
+        raise ModbusError(0, ILLEGAL_DATA_VALUE)
+    if address + count > size:
+        raise ModbusError(0, ILLEGAL_DATA_ADDRESS)
+
+
+class RtuSlave:
+    """Serve cards as Modbus RTU slaves on a serial port.
+
+    Each card answers at its stack level + offset, like the card firmware.
+
+    Args:
+        port: Serial device path or file descriptor (e.g. from :func:`open_pty`)
+        cards (list): SMmultiio compatible cards
+        offset (int): Slave address offset
+        baudrate (int): Line speed
+        parity (str): "N", "E" or "O"
+        stopbits (int): 1 or 2
+        frame_gap (float): Silent interval between frames, see :class:`RtuClient`
+
+    Attributes:
+        requests (int): Requests answered
+    """
+    def __init__(self, port, cards, offset=DEFAULT_OFFSET, baudrate=9600, parity="N", stopbits=1, frame_gap=None):
+        self._port = _RtuPort(port, baudrate, parity, stopbits, frame_gap)
+        self.slaves = {card._hw_address_ - data.SLAVE_OWN_ADDRESS_BASE + offset: ModbusSlave(card)
+                       for card in cards}
+        self.requests = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def serve_one(self, timeout=None):
+        """Answer one request.
+
+        Returns:
+            (bool) False if no frame arrived before the timeout
+        """
+        frame = self._port.receive(_request_length, timeout)
+        if frame is None:
+            return False
+        address = frame[0]
+        targets = list(self.slaves.values()) if address == 0 else [self.slaves.get(address)]
+        for slave in targets:
+            if slave is None:
+                continue
+            response = slave.handle(frame[1:])
+            self.requests += 1
+            if address:
+                self._port.send(bytes([address]) + response)
+        return True
+
+    def serve_forever(self):
+        """Answer requests until :meth:`stop` is called."""
+        self._stop.clear()
+        while not self._stop.is_set():
+            self.serve_one(0.1)
+
+    def start(self):
+        """Serve in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.serve_forever, name="multiio-rtu-slave", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop serving and close the port if it was opened by the slave."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._port.close()
@@ -0,0 +1,111 @@
+"""Process-wide pool of SMBus handles shared by all cards on the same bus."""
+
+import threading
+
+from smbus2 import SMBus
+
+# SMBus methods forwarded by SharedBus
+_BUS_METHODS = (
+    "read_byte", "write_byte", "write_quick",
+    "read_byte_data", "write_byte_data",
+    "read_word_data", "write_word_data",
+    "read_i2c_block_data", "write_i2c_block_data",
+    "read_block_data", "write_block_data",
+    "i2c_rdwr",
+)
+
+
+class SharedBus:
+    """SMBus handle shared between threads and card instances.
+
+    smbus2 selects the slave address and runs the transfer in two system
+    calls, so each forwarded call holds a lock to keep transactions to
+    different cards from interleaving.
+
+    Args:
+        bus: SMBus compatible object to share
+    """
+    def __init__(self, bus):
+        self.bus = bus
+        self.lock = threading.RLock()
+
+    def close(self):
+        self.bus.close()
+
+
+def _forward(name):
+    def method(self, *args, **kwargs):
+        with self.lock:
+            return getattr(self.bus, name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+for _name in _BUS_METHODS:
+    setattr(SharedBus, _name, _forward(_name))
+del _name
+
+
+class BusPool:
+    """Reference counted SMBus handles keyed by i2c bus number.
+
+    Args:
+        factory (callable): Opens a bus from its number, ``SMBus`` by default
+    """
+    def __init__(self, factory=SMBus):
+        self.factory = factory
+        self._buses = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, i2c):
+        """Get the shared handle of a bus, opening it on first use.
+
+        Args:
+            i2c (int): i2c bus number
+
+        Returns:
+            (SharedBus) Bus handle
+        """
+        with self._lock:
+            entry = self._buses.get(i2c)
+            if entry is None:
+                entry = [SharedBus(self.factory(i2c)), 0]
+                self._buses[i2c] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, i2c):
+        """Drop one reference to a bus; the last one closes it.
+
+        Args:
+            i2c (int): i2c bus number
+        """
+        with self._lock:
+            entry = self._buses.get(i2c)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._buses[i2c]
+                entry[0].close()
+
+    def close(self):
+        """Close all buses regardless of references."""
+        with self._lock:
+            buses = [entry[0] for entry in self._buses.values()]
+            self._buses.clear()
+        for bus in buses:
+            bus.close()
+
+    def __len__(self):
+        return len(self._buses)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# Default pool used by SMmultiio when no bus is given
+pool = BusPool()
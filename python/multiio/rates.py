@@ -0,0 +1,75 @@
+"""Counter rates from consecutive :meth:`SMmultiio.read_counters` reads."""
+
+import time
+
+from multiio.snapshot import Counters
+
+_U32 = 1 << 32
+_I32_HALF = 1 << 31
+
+
+def u32_delta(new, old):
+    """Difference of two unsigned 32 bit counters across a wrap-around."""
+    return (new - old) % _U32
+
+
+def i32_delta(new, old):
+    """Difference of two signed 32 bit counters across a wrap-around."""
+    return (new - old + _I32_HALF) % _U32 - _I32_HALF
+
+
+class CounterRates:
+    """Turn consecutive counter reads into per-channel rates.
+
+    Opto edge counters wrap as unsigned and encoder counters as signed
+    32 bit values, so a wrap between two reads gives the right delta as
+    long as fewer than 2^31 counts happen in between.
+
+    Example:
+        >>> rates = CounterRates()
+        >>> while True:
+        ...     r = rates.update(card.read_counters())
+        ...     if r is not None:
+        ...         print(r.opto[0], "edges/s", r.encoder[0], "steps/s")
+
+    Attributes:
+        totals (Counters): Counts accumulated since the first read, without wrap
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the previous read and the totals."""
+        self._last = None
+        self._last_time = None
+        self.totals = Counters((0,) * 4, (0,) * 2)
+
+    def update(self, counters, timestamp=None):
+        """Add a read.
+
+        Args:
+            counters (Counters): Counter read
+            timestamp (float): Monotonic time of the read, now if None
+
+        Returns:
+            (Counters) Edges per second for ``opto`` and steps per second for
+                ``encoder`` since the previous read; None for the first read
+                or if no time elapsed
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        last, last_time = self._last, self._last_time
+        self._last, self._last_time = counters, timestamp
+        if last is None:
+            return None
+        opto = tuple(u32_delta(n, o) for n, o in zip(counters.opto, last.opto))
+        encoder = tuple(i32_delta(n, o) for n, o in zip(counters.encoder, last.encoder))
+        self.totals = Counters(
+            tuple(t + d for t, d in zip(self.totals.opto, opto)),
+            tuple(t + d for t, d in zip(self.totals.encoder, encoder)))
+        elapsed = timestamp - last_time
+        if elapsed <= 0:
+            return None
+        return Counters(
+            tuple(d / elapsed for d in opto),
+            tuple(d / elapsed for d in encoder))
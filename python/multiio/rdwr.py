@@ -0,0 +1,66 @@
+"""Register reads of any length with I2C_RDWR combined transfers.
+
+The SMBus block calls are limited to 32 bytes. A combined transfer (write
+the start register, repeated start, read N bytes) has no such limit, so the
+whole card memory can be read at once, like ``i2cMem8Read`` in the C tool.
+"""
+
+import ctypes
+
+from smbus2 import i2c_msg
+from smbus2.smbus2 import I2C_M_RD
+
+
+class RdwrReader:
+    """Combined-transfer reads from one device.
+
+    Messages and receive buffers are built once per (register, length) and
+    reused, so repeated reads of the same range do not allocate.
+
+    Args:
+        i2c_addr (int): Device address
+    """
+    def __init__(self, i2c_addr):
+        self.i2c_addr = i2c_addr
+        self._transfers = {}
+
+    def _transfer(self, register, length):
+        transfer = self._transfers.get((register, length))
+        if transfer is None:
+            buf = (ctypes.c_char * length)()
+            transfer = (
+                i2c_msg.write(self.i2c_addr, [register]),
+                i2c_msg(addr=self.i2c_addr, flags=I2C_M_RD, len=length, buf=buf),
+                memoryview(buf).cast("B"),
+                buf)
+            self._transfers[(register, length)] = transfer
+        return transfer
+
+    def read(self, bus, register, length):
+        """Read a register range.
+
+        Args:
+            bus: SMBus compatible object implementing ``i2c_rdwr``
+            register (int): Start address
+            length (int): Number of bytes
+
+        Returns:
+            (memoryview) Bytes read, valid until the next read of the same range
+        """
+        write, read, view, _ = self._transfer(register, length)
+        bus.i2c_rdwr(write, read)
+        return view
+
+    def read_into(self, bus, register, buf):
+        """Read a register range into a writable buffer.
+
+        Args:
+            bus: SMBus compatible object implementing ``i2c_rdwr``
+            register (int): Start address
+            buf: Writable buffer, its length is the number of bytes read
+
+        Returns:
+            buf
+        """
+        buf[:] = self.read(bus, register, len(buf))
+        return buf
@@ -0,0 +1,172 @@
+"""Declarative table of the card value registers with precompiled codecs.
+
+Each :class:`Register` describes an array of channel values in the
+``I2C_MEM`` map: address, struct type, channel count, scale and access. Its
+``struct.Struct`` codecs and channel addresses are computed once, so single
+channel accessors and bulk reads (``unpack_from`` on the reused read
+buffers) decode without parsing formats or formatting messages per call::
+
+    >>> REGISTERS["u_in"].decode(buf, REGISTERS["u_in"].offset(2))
+    4.5
+    >>> REGISTERS["rtd_temp"].decode_all(card.read_registers(I2C_MEM.RTD_VAL1_ADD, 8))
+    (21.5, 22.0)
+"""
+
+import struct
+
+import multiio.multiio_data as data
+I2C_MEM = data.I2C_MEM
+CHANNEL_NO = data.CHANNEL_NO
+
+READ = "r"
+READ_WRITE = "rw"
+
+
+class Register:
+    """Array of channel values in the card memory.
+
+    Raw values are divided by ``scale`` when decoded and multiplied by it
+    when encoded; with scale 1 the raw value is returned unchanged (so
+    counters stay integers).
+
+    Args:
+        name (str): Value name
+        address (int): Address of channel 1
+        fmt (str): struct type of one value, little endian
+        channel_type (str): CHANNEL_NO key giving the channel count
+        scale (int): Raw units per value unit
+        access (str): READ or READ_WRITE
+
+    Attributes:
+        item (struct.Struct): Codec of one value
+        block (struct.Struct): Codec of all channels
+        size (int): Bytes per value
+        count (int): Number of channels
+        addresses (dict): Address of each channel number
+        error (str): Message of invalid channel numbers
+    """
+    __slots__ = ("name", "address", "fmt", "channel_type", "scale", "access",
+                 "item", "block", "size", "count", "addresses", "unpack", "scaled", "error")
+
+    def __init__(self, name, address, fmt, channel_type, scale=1, access=READ):
+        self.name = name
+        self.address = address
+        self.fmt = fmt
+        self.channel_type = channel_type
+        self.scale = scale
+        self.access = access
+        self.count = CHANNEL_NO[channel_type]
+        self.item = struct.Struct("<" + fmt)
+        self.block = struct.Struct("<{}{}".format(self.count, fmt))
+        self.size = self.item.size
+        # Hot path helpers: channel -> address, bound decoder
+        self.addresses = {channel: address + (channel - 1) * self.size
+                          for channel in range(1, self.count + 1)}
+        self.unpack = self.item.unpack
+        self.scaled = scale != 1
+        self.error = "Invalid {} channel number. Must be [1..{}]!".format(channel_type, self.count)
+
+    def __repr__(self):
+        return "Register({!r}, {}, {!r}, {!r}, scale={}, access={!r})".format(
+                self.name, self.address, self.fmt, self.channel_type, self.scale, self.access)
+
+    def check(self, channel):
+        """Validate a channel number.
+
+        Returns:
+            (int) Address of the channel value
+        """
+        address = self.addresses.get(channel)
+        if address is None:
+            raise ValueError(self.error)
+        return address
+
+    def offset(self, channel):
+        """Get the offset of a channel value from the first channel."""
+        return (channel - 1) * self.size
+
+    def decode(self, buf, offset=0):
+        """Decode one value from raw bytes.
+
+        Args:
+            buf: Buffer holding the value
+            offset (int): Offset of the value inside buf
+
+        Returns:
+            Scaled value
+        """
+        raw = self.item.unpack_from(buf, offset)[0]
+        return raw / self.scale if self.scaled else raw
+
+    def decode_all(self, buf, offset=0):
+        """Decode all channels from raw bytes.
+
+        Args:
+            buf: Buffer holding the values of every channel
+            offset (int): Offset of channel 1 inside buf
+
+        Returns:
+            (tuple) Scaled values indexed by ``channel - 1``
+        """
+        raws = self.block.unpack_from(buf, offset)
+        if not self.scaled:
+            return raws
+        scale = self.scale
+        return tuple(raw / scale for raw in raws)
+
+    def from_raw(self, raw):
+        """Scale a raw integer value."""
+        return raw / self.scale if self.scaled else raw
+
+    def to_raw(self, value):
+        """Convert a value to the raw register value."""
+        return value * self.scale
+
+
+def _registers(*registers):
+    return {register.name: register for register in registers}
+
+
+# Value registers by name
+REGISTERS = _registers(
+    Register("u_in", I2C_MEM.U_IN, "H", "u_in", data.VOLT_TO_MILIVOLT),
+    Register("i_in", I2C_MEM.I_IN, "H", "i_in", data.VOLT_TO_MILIVOLT),
+    Register("u_out", I2C_MEM.U_OUT, "H", "u_out", data.VOLT_TO_MILIVOLT, READ_WRITE),
+    Register("i_out", I2C_MEM.I_OUT, "H", "i_out", data.VOLT_TO_MILIVOLT, READ_WRITE),
+    Register("motor", I2C_MEM.MOT_VAL, "h", "motor", 10, READ_WRITE),
+    Register("servo", I2C_MEM.SERVO_VAL1, "h", "servo", 10, READ_WRITE),
+    Register("rtd_temp", I2C_MEM.RTD_VAL1_ADD, "f", "rtd"),
+    Register("rtd_res", I2C_MEM.RTD_RES1_ADD, "f", "rtd"),
+    Register("opto_counter", I2C_MEM.OPTO_EDGE_COUNT_ADD, "I", "opto"),
+    Register("encoder_counter", I2C_MEM.OPTO_ENC_COUNT_ADD, "i", "opto_enc"),
+    Register("opto_pps", I2C_MEM.PPS, "H", "opto"),
+    Register("opto_frequency", I2C_MEM.IN_FREQUENCY, "H", "opto"),
+    Register("opto_pwm_fill", I2C_MEM.PWM_IN_FILL, "H", "opto", data.OPTO_FILL_FACTOR_SCALE),
+)
+U_IN = REGISTERS["u_in"]
+I_IN = REGISTERS["i_in"]
+U_OUT = REGISTERS["u_out"]
+I_OUT = REGISTERS["i_out"]
+MOTOR = REGISTERS["motor"]
+SERVO = REGISTERS["servo"]
+RTD_TEMP = REGISTERS["rtd_temp"]
+RTD_RES = REGISTERS["rtd_res"]
+OPTO_COUNTER = REGISTERS["opto_counter"]
+ENCODER_COUNTER = REGISTERS["encoder_counter"]
+OPTO_PPS = REGISTERS["opto_pps"]
+OPTO_FREQUENCY = REGISTERS["opto_frequency"]
+OPTO_PWM_FILL = REGISTERS["opto_pwm_fill"]
+
+# Scalar codecs of the single value helpers
+U8 = struct.Struct("<B")
+U16 = struct.Struct("<H")
+I16 = struct.Struct("<h")
+U32 = struct.Struct("<I")
+I32 = struct.Struct("<i")
+FLOAT = struct.Struct("<f")
+
+# Channel number checks by channel type: (valid channels, error message)
+CHANNEL_CHECKS = {
+    kind: (frozenset(range(1, count + 1)), "Invalid {} channel number. Must be [1..{}]!".format(kind, count))
+    for kind, count in CHANNEL_NO.items()
+}
@@ -0,0 +1,257 @@
+"""Fixed-rate background acquisition into a preallocated ring buffer.
+
+    >>> from multiio.sampler import Sampler
+    >>> sampler = Sampler([(card, "u_in", 1), (card, "rtd_temp", 2),
+    ...                    (card, "opto_counter", 1)], period=0.01)
+    >>> with sampler:
+    ...     for timestamp, values in sampler.ring.samples(timeout=1):
+    ...         print(timestamp, values)
+"""
+
+import array
+import math
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Channel kinds served from SMmultiio.read_snapshot(): Snapshot field -> channel type
+SNAPSHOT_KINDS = {
+    "u_in": "u_in",
+    "i_in": "i_in",
+    "u_out": "u_out",
+    "i_out": "i_out",
+    "servo": "servo",
+    "rtd_temp": "rtd",
+    "rtd_res": "rtd",
+}
+# Channel kinds served from SMmultiio.read_counters(): kind -> (Counters field, channel type)
+COUNTER_KINDS = {
+    "opto_counter": ("opto", "opto"),
+    "opto_encoder_counter": ("encoder", "opto_enc"),
+}
+# Channel kinds served from SMmultiio.read_pulses(): kind -> (Pulses field, channel type)
+PULSE_KINDS = {
+    "opto_pps": ("pps", "opto"),
+    "opto_frequency": ("frequency", "opto"),
+    "opto_pwm_fill": ("pwm_fill", "opto"),
+}
+
+
+class RingBuffer:
+    """Preallocated ring of timestamped rows of float values.
+
+    Every row is stored twice, ``capacity`` rows apart, so the latest N rows
+    are always contiguous and :meth:`latest` returns views without copying.
+
+    Args:
+        columns (int): Values per row
+        capacity (int): Number of rows kept
+        use_numpy (bool): Store in NumPy arrays, by default if NumPy is installed
+    """
+    def __init__(self, columns, capacity, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        self.columns = columns
+        self.capacity = capacity
+        self.count = 0
+        if use_numpy:
+            self._times = numpy.zeros(2 * capacity)
+            self._values = numpy.zeros((2 * capacity, columns))
+        else:
+            self._times = array.array("d", bytes(16 * capacity))
+            self._values = array.array("d", bytes(16 * capacity * columns))
+        self._numpy = use_numpy
+        self._cond = threading.Condition()
+
+    def append(self, timestamp, row):
+        """Store one row.
+
+        Args:
+            timestamp (float): Monotonic timestamp
+            row: ``array('d')`` (or NumPy array) of ``columns`` values
+        """
+        with self._cond:
+            index = self.count % self.capacity
+            mirror = index + self.capacity
+            self._times[index] = self._times[mirror] = timestamp
+            if self._numpy:
+                self._values[index] = self._values[mirror] = row
+            else:
+                cols = self.columns
+                self._values[index * cols:(index + 1) * cols] = row
+                self._values[mirror * cols:(mirror + 1) * cols] = row
+            self.count += 1
+            self._cond.notify_all()
+
+    def latest(self, n=None):
+        """Get the latest rows without copying.
+
+        The views stay valid until ``capacity - n`` more rows are appended.
+
+        Args:
+            n (int): Number of rows, all stored rows if None
+
+        Returns:
+            (tuple) (timestamps, values): 1-D view of n timestamps and a
+                (n, columns) view of the values, oldest first; without
+                NumPy and with no rows the values view is empty and 1-D
+        """
+        with self._cond:
+            stored = min(self.count, self.capacity)
+            n = stored if n is None else max(0, min(n, stored))
+            end = self.count % self.capacity + self.capacity
+        start = end - n
+        if self._numpy:
+            return self._times[start:end], self._values[start:end]
+        cols = self.columns
+        if n == 0:
+            # memoryview cannot cast to a shape with a zero dimension
+            return memoryview(self._times)[start:end], memoryview(self._values)[0:0]
+        values = memoryview(self._values)[start * cols:end * cols]
+        return (memoryview(self._times)[start:end],
+                values.cast("B").cast("d", (n, cols)))
+
+    def samples(self, timeout=None):
+        """Iterate over rows as they are appended, starting with the next one.
+
+        Rows overwritten before being read are skipped.
+
+        Args:
+            timeout (float): Stop when no row arrives within timeout seconds
+
+        Yields:
+            (tuple) (timestamp, values tuple)
+        """
+        with self._cond:
+            seen = self.count
+        while True:
+            with self._cond:
+                if seen == self.count and not self._cond.wait_for(
+                        lambda: seen != self.count, timeout):
+                    return
+                seen = max(seen, self.count - self.capacity + 1)
+                index = seen % self.capacity
+                timestamp = self._times[index]
+                if self._numpy:
+                    values = tuple(self._values[index].tolist())
+                else:
+                    values = tuple(self._values[index * self.columns:(index + 1) * self.columns])
+                seen += 1
+            yield timestamp, values
+
+
+class Sampler:
+    """Poll card channels at a fixed period from a background thread.
+
+    Reads are scheduled on an absolute monotonic timeline, so sleep and read
+    time do not accumulate as drift; periods that are completely missed are
+    skipped and counted in ``missed``. All snapshot kinds of one card are
+    served by a single :meth:`multiio.SMmultiio.read_snapshot`, all
+    counter kinds by a single :meth:`multiio.SMmultiio.read_counters` and
+    all pulse kinds by a single :meth:`multiio.SMmultiio.read_pulses`.
+    Failed reads store NaN and are counted in ``errors``.
+
+    Args:
+        channels (list): (card, kind, channel) tuples, one column each.
+            kind is one of ``SNAPSHOT_KINDS``, ``COUNTER_KINDS`` or
+            ``PULSE_KINDS``
+        period (float): Sampling period in seconds
+        capacity (int): Ring buffer rows
+        use_numpy (bool): Passed to :class:`RingBuffer`
+    """
+    def __init__(self, channels, period, capacity=4096, use_numpy=None):
+        if period <= 0:
+            raise ValueError("Invalid sampling period!")
+        self.period = period
+        self.channels = list(channels)
+        self.ring = RingBuffer(len(self.channels), capacity, use_numpy)
+        self.missed = 0
+        self.errors = 0
+        self._row = array.array("d", bytes(8 * len(self.channels)))
+        self._plan = self._make_plan(self.channels)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _make_plan(channels):
+        plan = {}
+        for column, (card, kind, channel) in enumerate(channels):
+            if kind in SNAPSHOT_KINDS:
+                card._check_channel(SNAPSHOT_KINDS[kind], channel)
+                field = (card.read_snapshot, kind, channel - 1)
+            elif kind in COUNTER_KINDS:
+                name, channel_type = COUNTER_KINDS[kind]
+                card._check_channel(channel_type, channel)
+                field = (card.read_counters, name, channel - 1)
+            elif kind in PULSE_KINDS:
+                name, channel_type = PULSE_KINDS[kind]
+                card._check_channel(channel_type, channel)
+                field = (card.read_pulses, name, channel - 1)
+            else:
+                raise ValueError("Invalid channel kind {}!".format(kind))
+            plan.setdefault(id(card), (card, []))[1].append((column,) + field)
+        return list(plan.values())
+
+    def sample_once(self):
+        """Read all channels once into the ring buffer.
+
+        Returns:
+            (float) Monotonic timestamp of the sample
+        """
+        timestamp = time.monotonic()
+        row = self._row
+        for card, fields in self._plan:
+            try:
+                reads = {}
+                for column, reader, name, channel in fields:
+                    record = reads.get(reader)
+                    if record is None:
+                        record = reads[reader] = reader()
+                    row[column] = getattr(record, name)[channel]
+            except (OSError, IOError):
+                self.errors += 1
+                for field in fields:
+                    row[field[0]] = math.nan
+        self.ring.append(timestamp, row)
+        return timestamp
+
+    def _run(self):
+        period = self.period
+        start = time.monotonic()
+        tick = 0
+        while not self._stop.is_set():
+            self.sample_once()
+            tick += 1
+            now = time.monotonic()
+            late = int((now - start) / period) - tick
+            if late > 0:
+                self.missed += late
+                tick += late
+            self._stop.wait(start + tick * period - now)
+
+    def start(self):
+        """Start the sampling thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="multiio-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the sampling thread and wait for it to exit."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,283 @@
+"""Priority and deadline scheduling of bus transactions across threads.
+
+All transactions routed through a :class:`BusScheduler` run one at a time on
+its worker thread, most urgent first, so a time-critical write never waits
+behind a queue of bulk reads::
+
+    >>> scheduler = get_scheduler(1, lock_path="/dev/i2c-1")
+    >>> card.schedule(scheduler)
+    >>> with scheduler.priority(URGENT, deadline=0.002):
+    ...     card.set_u_out(1, 5)
+
+Card operations made of several transactions (read-modify-write setters,
+multi-block reads, batch flushes) hold the bus for their whole duration with
+:meth:`BusScheduler.exclusive`, so no other thread's transaction can run in
+between.
+"""
+
+import concurrent.futures
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import multiio.multiio_data as data
+I2C_MEM = data.I2C_MEM
+
+# Priorities, lower runs first
+URGENT = 0
+HIGH = 1
+NORMAL = 2
+LOW = 3
+
+_READ_OPS = ("read_byte", "read_byte_data", "read_word_data", "read_i2c_block_data", "i2c_rdwr")
+_WRITE_OPS = ("write_byte", "write_quick", "write_byte_data", "write_word_data",
+              "write_i2c_block_data", "write_block_data")
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(i2c=1, lock_path=None):
+    """Get the scheduler shared by all cards on an i2c bus.
+
+    Args:
+        i2c (int): i2c bus number
+        lock_path (str): Used when the scheduler is created, see :class:`BusScheduler`
+
+    Returns:
+        (BusScheduler) Bus scheduler
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(i2c)
+        if scheduler is None or scheduler._closed:
+            scheduler = BusScheduler(lock_path, name="multiio-sched-{}".format(i2c))
+            _schedulers[i2c] = scheduler
+        return scheduler
+
+
+class BusScheduler:
+    """Run bus transactions from any thread on one worker, by priority.
+
+    Queued requests run in (priority, deadline, arrival) order. A request
+    whose deadline passed before it completed is still run, but counted in
+    ``missed_deadlines`` and reported to the ``on_deadline_miss`` callbacks.
+    A thread holding the bus with :meth:`exclusive` runs its transactions
+    directly while the worker waits.
+
+    Args:
+        lock_path (str): File locked with ``flock`` around every transaction
+            to serialize with other processes (e.g. ``"/dev/i2c-1"``), None
+            to lock only within this process
+        name (str): Worker thread name
+
+    Attributes:
+        missed_deadlines (int): Requests completed after their deadline
+        on_deadline_miss (list): Callables receiving (priority, lateness seconds)
+        callback_errors (int): Exceptions raised by on_deadline_miss callbacks,
+            counted and ignored so the worker keeps running
+    """
+    def __init__(self, lock_path=None, name="multiio-sched"):
+        self.missed_deadlines = 0
+        self.completed = 0
+        self.callback_errors = 0
+        self.on_deadline_miss = []
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._closed = False
+        self._lock_file = None
+        if lock_path is not None and fcntl is not None:
+            self._lock_file = open(lock_path, "rb")
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @contextlib.contextmanager
+    def priority(self, priority, deadline=None):
+        """Set priority and deadline of the requests made by this thread.
+
+        Args:
+            priority (int): URGENT, HIGH, NORMAL or LOW
+            deadline (float): Seconds each request may take from submission
+        """
+        previous = getattr(self._local, "context", None)
+        self._local.context = (priority, deadline)
+        try:
+            yield
+        finally:
+            self._local.context = previous
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Hold the bus for several transactions of the calling thread.
+
+        The hold is queued like one request, at the priority and deadline set
+        by :meth:`priority` (NORMAL by default), and its deadline covers the
+        whole block. Once it is granted the worker waits, keeping the file
+        lock, while the calling thread runs its transactions directly. Nested
+        holds of the same thread are free.
+        """
+        if getattr(self._local, "held", False) or threading.current_thread() is self._thread:
+            yield
+            return
+        granted = threading.Event()
+        released = threading.Event()
+
+        def hold():
+            granted.set()
+            released.wait()
+        priority, deadline = self.context()
+        future = self.submit(hold, priority=priority, deadline=deadline)
+        # Also wakes up if the hold failed before running (file lock error)
+        future.add_done_callback(lambda future: granted.set())
+        granted.wait()
+        if future.done():
+            future.result()
+        self._local.held = True
+        try:
+            yield
+        finally:
+            self._local.held = False
+            released.set()
+            future.result()
+
+    def context(self, default_priority=NORMAL):
+        """Get the priority and deadline set for the calling thread.
+
+        Returns:
+            (tuple) (priority, deadline)
+        """
+        context = getattr(self._local, "context", None)
+        if context is None:
+            return default_priority, None
+        return context
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue a call.
+
+        Args:
+            fn (callable): Function doing the transaction
+            *args: Its arguments
+            priority (int): Keyword only, NORMAL by default
+            deadline (float): Keyword only, seconds from now, None for none
+
+        Returns:
+            (concurrent.futures.Future) Result of the call
+        """
+        priority = kwargs.pop("priority", NORMAL)
+        deadline = kwargs.pop("deadline", None)
+        future = concurrent.futures.Future()
+        due = float("inf") if deadline is None else time.monotonic() + deadline
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler closed!")
+            heapq.heappush(self._queue, (priority, due, next(self._seq), fn, args, future))
+            self._cond.notify()
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """Run a call through the queue and wait for its result.
+
+        Calls made from the worker thread itself, or from a thread holding
+        the bus with :meth:`exclusive`, run immediately.
+
+        Args:
+            See :meth:`submit`
+
+        Returns:
+            Result of fn
+        """
+        if getattr(self._local, "held", False) or threading.current_thread() is self._thread:
+            return fn(*args)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                priority, due, _, fn, args, future = heapq.heappop(self._queue)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+                try:
+                    result = fn(*args)
+                finally:
+                    if self._lock_file is not None:
+                        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+            self.completed += 1
+            late = time.monotonic() - due
+            if late > 0:
+                self.missed_deadlines += 1
+                for callback in self.on_deadline_miss:
+                    try:
+                        callback(priority, late)
+                    except Exception:
+                        self.callback_errors += 1
+
+    def close(self):
+        """Run the queued requests and stop the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class ScheduledBus:
+    """SMBus wrapper running every transaction through a :class:`BusScheduler`.
+
+    Without a priority set by :meth:`BusScheduler.priority`, reads run at
+    NORMAL, writes at HIGH and watchdog reloads at URGENT priority.
+
+    Args:
+        bus: SMBus compatible object doing the transfers
+        scheduler (BusScheduler): Scheduler of the bus
+    """
+    def __init__(self, bus, scheduler):
+        self.bus = bus
+        self.scheduler = scheduler
+
+    def _schedule(self, name, default_priority, args):
+        priority, deadline = self.scheduler.context(default_priority)
+        return self.scheduler.call(getattr(self.bus, name), *args, priority=priority, deadline=deadline)
+
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        default = URGENT if register == I2C_MEM.WDT_RESET_ADD else HIGH
+        return self._schedule("write_byte_data", default, (i2c_addr, register, value, force))
+
+    def close(self):
+        self.bus.close()
+
+
+def _forward(name, default_priority):
+    def method(self, *args):
+        return self._schedule(name, default_priority, args)
+    method.__name__ = name
+    return method
+
+
+for _name in _READ_OPS:
+    setattr(ScheduledBus, _name, _forward(_name, NORMAL))
+for _name in _WRITE_OPS:
+    if not hasattr(ScheduledBus, _name):
+        setattr(ScheduledBus, _name, _forward(_name, HIGH))
+del _name
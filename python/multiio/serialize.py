@@ -0,0 +1,25 @@
+"""Conversion of card results to JSON types.
+
+Shared by the command line interface and the bus owner daemon, which both
+send :class:`multiio.SMmultiio` results as JSON: records (``Snapshot``,
+``Counters``, ...) become objects, tuples become arrays and register bytes
+(``read_registers``) become hex strings.
+"""
+
+
+def to_json(value):
+    """Convert an SMmultiio result to a value ``json.dumps`` accepts.
+
+    Args:
+        value: Method result
+
+    Returns:
+        (dict, list, str, int, float, bool or None) Converted value
+    """
+    if hasattr(value, "_asdict"):
+        return {k: to_json(v) for k, v in value._asdict().items()}
+    if isinstance(value, (tuple, list)):
+        return [to_json(v) for v in value]
+    if isinstance(value, memoryview):
+        return value.hex()
+    return value
@@ -0,0 +1,182 @@
+"""Decoded full-card snapshot read in as few block transfers as possible."""
+
+import collections
+import struct
+
+import multiio.multiio_data as data
+from multiio.registers import U_IN, I_IN, U_OUT, I_OUT, MOTOR, SERVO, OPTO_PWM_FILL
+I2C_MEM = data.I2C_MEM
+
+# Registers 0..45: RELAYS, RELAY_SET/CLR (skipped), LEDS, LED_SET/CLR
+# (skipped), OPTO, ANALOG_TYPE, U_IN, I_IN, U_OUT, I_OUT, MOT_VAL,
+# SERVO_VAL1/2, RTD_VAL and RTD_RES.
+SNAPSHOT_ADDRESS = I2C_MEM.RELAYS
+SNAPSHOT_STRUCT = struct.Struct("<B2xB2xBB2H2H2H2Hh2h2f2f")
+SNAPSHOT_SIZE = SNAPSHOT_STRUCT.size
+assert SNAPSHOT_ADDRESS + SNAPSHOT_SIZE == I2C_MEM.DIAG_TEMPERATURE_ADD
+
+
+class Snapshot(collections.namedtuple("Snapshot", [
+        "relays", "leds", "opto", "analog_type",
+        "u_in", "i_in", "u_out", "i_out",
+        "motor", "servo", "rtd_temp", "rtd_res"])):
+    """Immutable state of one card read by :meth:`SMmultiio.read_snapshot`.
+
+    Values use the same units as the single-channel getters: bitmasks for
+    relays/leds/opto, volts, mA, % and Celsius/ohm. Multi-channel values
+    are tuples indexed by ``channel - 1``.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_buffer(cls, buf, offset=0):
+        """Decode a snapshot from raw register bytes.
+
+        Args:
+            buf: Buffer holding registers RELAYS..RTD_RES2 (46 bytes)
+            offset (int): Offset of the RELAYS register inside buf
+
+        Returns:
+            (Snapshot) Decoded snapshot
+        """
+        (relays, leds, opto, analog_type,
+         u_in1, u_in2, i_in1, i_in2, u_out1, u_out2, i_out1, i_out2,
+         motor, servo1, servo2,
+         rtd_temp1, rtd_temp2, rtd_res1, rtd_res2) = SNAPSHOT_STRUCT.unpack_from(buf, offset)
+        return cls(
+            relays, leds, opto, analog_type,
+            (u_in1 / U_IN.scale, u_in2 / U_IN.scale),
+            (i_in1 / I_IN.scale, i_in2 / I_IN.scale),
+            (u_out1 / U_OUT.scale, u_out2 / U_OUT.scale),
+            (i_out1 / I_OUT.scale, i_out2 / I_OUT.scale),
+            motor / MOTOR.scale,
+            (servo1 / SERVO.scale, servo2 / SERVO.scale),
+            (rtd_temp1, rtd_temp2),
+            (rtd_res1, rtd_res2))
+
+    def get_relay(self, relay):
+        """Get relay state from the snapshot.
+
+        Args:
+            relay (int): Relay number
+
+        Returns:
+            (int) Relay state
+        """
+        return (self.relays >> (relay - 1)) & 1
+
+    def get_led(self, led):
+        """Get led state from the snapshot.
+
+        Args:
+            led (int): Led number
+
+        Returns:
+            0(OFF) or 1(ON)
+        """
+        return (self.leds >> (led - 1)) & 1
+
+    def get_opto(self, channel):
+        """Get optocoupled input status from the snapshot.
+
+        Args:
+            channel (int): Channel number
+
+        Returns:
+            (bool) Channel status
+        """
+        return bool(self.opto & (1 << (channel - 1)))
+
+
+# Registers 54..77: OPTO_EDGE_COUNT (4 x u32) and OPTO_ENC_COUNT (2 x i32)
+COUNTERS_ADDRESS = I2C_MEM.OPTO_EDGE_COUNT_ADD
+COUNTERS_STRUCT = struct.Struct("<4I2i")
+COUNTERS_SIZE = COUNTERS_STRUCT.size
+assert COUNTERS_ADDRESS + COUNTERS_SIZE == I2C_MEM.CALIB_VALUE
+
+
+class Counters(collections.namedtuple("Counters", ["opto", "encoder"])):
+    """Opto edge counters and encoder positions read by
+    :meth:`SMmultiio.read_counters`.
+
+    ``opto`` holds the 4 unsigned edge counters and ``encoder`` the 2 signed
+    encoder counters, indexed by ``channel - 1``.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_buffer(cls, buf, offset=0):
+        """Decode counters from raw register bytes.
+
+        Args:
+            buf: Buffer holding registers OPTO_EDGE_COUNT..OPTO_ENC_COUNT (24 bytes)
+            offset (int): Offset of OPTO_EDGE_COUNT_ADD inside buf
+
+        Returns:
+            (Counters) Decoded counters
+        """
+        values = COUNTERS_STRUCT.unpack_from(buf, offset)
+        return cls(values[:4], values[4:])
+
+
+# Registers 130..153: PPS, IN_FREQUENCY and PWM_IN_FILL (4 x u16 each)
+PULSES_ADDRESS = I2C_MEM.PPS
+PULSES_STRUCT = struct.Struct("<4H4H4H")
+PULSES_SIZE = PULSES_STRUCT.size
+assert PULSES_ADDRESS + 2 * PULSES_SIZE // 3 == OPTO_PWM_FILL.address
+
+
+class Pulses(collections.namedtuple("Pulses", ["pps", "frequency", "pwm_fill"])):
+    """Pulse measurements of the optocoupled inputs read by
+    :meth:`SMmultiio.read_pulses`.
+
+    ``pps`` holds the pulses per second, ``frequency`` the frequency in Hz
+    and ``pwm_fill`` the PWM fill in % of the 4 channels, indexed by
+    ``channel - 1``.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_buffer(cls, buf, offset=0):
+        """Decode pulse measurements from raw register bytes.
+
+        Args:
+            buf: Buffer holding registers PPS..PWM_IN_FILL (24 bytes)
+            offset (int): Offset of the PPS register inside buf
+
+        Returns:
+            (Pulses) Decoded measurements
+        """
+        values = PULSES_STRUCT.unpack_from(buf, offset)
+        scale = OPTO_PWM_FILL.scale
+        return cls(values[:4], values[4:8], tuple(value / scale for value in values[8:]))
+
+
+# Registers 46..48: DIAG_TEMPERATURE (u8, as read by the C tool) and DIAG_3V3_MV (u16)
+DIAGNOSTICS_ADDRESS = I2C_MEM.DIAG_TEMPERATURE_ADD
+DIAGNOSTICS_STRUCT = struct.Struct("<BH")
+DIAGNOSTICS_SIZE = DIAGNOSTICS_STRUCT.size
+assert DIAGNOSTICS_ADDRESS + DIAGNOSTICS_SIZE == I2C_MEM.OPTO_IT_RISING_ADD
+
+
+class Diagnostics(collections.namedtuple("Diagnostics", ["temperature", "v3v3"])):
+    """Board diagnostics read by :meth:`SMmultiio.read_diagnostics`.
+
+    ``temperature`` is the board temperature in Celsius and ``v3v3`` the
+    3.3V rail in volts.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_buffer(cls, buf, offset=0):
+        """Decode diagnostics from raw register bytes.
+
+        Args:
+            buf: Buffer holding registers DIAG_TEMPERATURE..DIAG_3V3_MV (3 bytes)
+            offset (int): Offset of DIAG_TEMPERATURE_ADD inside buf
+
+        Returns:
+            (Diagnostics) Decoded diagnostics
+        """
+        temperature, v3v3 = DIAGNOSTICS_STRUCT.unpack_from(buf, offset)
+        return cls(temperature, v3v3 / data.VOLT_TO_MILIVOLT)
@@ -0,0 +1,335 @@
+"""Card RTC time for samples without reading the RTC per sample.
+
+The card RTC only has one second resolution. :class:`CardClock` finds the
+instants its seconds register changes, on the host monotonic clock, and fits
+offset and drift over the last edges. Card time is then interpolated from
+``time.monotonic()`` without bus traffic, so every bulk read can carry
+host and card timestamps::
+
+    >>> timebase = TimeBase(cards)
+    >>> timebase.start(period=600)          # re-correlate every 10 minutes
+    >>> snapshot, stamp = timebase.read(card, card.read_snapshot)
+    >>> stamp.card_time, stamp.host_time
+
+Card times are seconds since the epoch of the RTC fields read as UTC.
+:func:`sync_rtc` sets all cards of a stack to the host time at a second
+boundary.
+"""
+
+import calendar
+import collections
+import errno
+import threading
+import time
+
+Stamp = collections.namedtuple("Stamp", ["monotonic", "host_time", "card_time"])
+Stamp.__doc__ = """Time of a read: host monotonic and wall clock, interpolated card time."""
+
+Correlation = collections.namedtuple("Correlation", ["monotonic", "card_time", "uncertainty"])
+Correlation.__doc__ = """Monotonic time at which the card RTC reached card_time (whole
+second), within +/- uncertainty seconds."""
+
+
+def rtc_seconds(rtc):
+    """Convert a :meth:`SMmultiio.get_rtc` tuple to seconds since the epoch (UTC)."""
+    return calendar.timegm(tuple(rtc) + (0, 0, 0))
+
+
+class CardClock:
+    """Offset and drift of one card RTC against the host monotonic clock.
+
+    Args:
+        card (SMmultiio): Card to follow
+        history (int): Correlations kept for the drift fit
+        resolution (float): RTC poll interval while waiting for a second edge
+        window (float): Polling starts this long before a predicted edge
+
+    Attributes:
+        correlations (deque): Latest Correlation records
+        polls (int): RTC reads made so far
+    """
+    def __init__(self, card, history=8, resolution=0.002, window=0.02):
+        self.card = card
+        self.resolution = resolution
+        self.window = window
+        self.correlations = collections.deque(maxlen=history)
+        self.polls = 0
+        self._model = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget the correlations, e.g. after the RTC was set."""
+        with self._lock:
+            self.correlations.clear()
+            self._model = None
+
+    @property
+    def synchronized(self):
+        """True once at least one edge was found."""
+        return self._model is not None
+
+    @property
+    def drift(self):
+        """Card clock rate error against the host clock (0 before two edges)."""
+        return 0.0 if self._model is None else self._model[2] - 1.0
+
+    @property
+    def offset(self):
+        """Card time minus monotonic time, now."""
+        return self.card_time() - time.monotonic()
+
+    def _poll(self):
+        before = time.monotonic()
+        seconds = rtc_seconds(self.card.get_rtc())
+        self.polls += 1
+        return seconds, (before + time.monotonic()) / 2
+
+    def correlate(self, max_wait=2.0):
+        """Find the next change of the RTC seconds and update the model.
+
+        The RTC is polled every ``resolution`` seconds; once the model is
+        known polling starts ``window`` before the predicted edge, so a
+        correlation takes a few transactions.
+
+        Args:
+            max_wait (float): Seconds to wait for an edge
+
+        Returns:
+            (Correlation) The edge found
+        """
+        return correlate([self], max_wait)[0]
+
+    def _add(self, correlation):
+        with self._lock:
+            self.correlations.append(correlation)
+            self._fit()
+        return correlation
+
+    def _fit(self):
+        # Least squares card_time = card0 + rate * (monotonic - mono0)
+        points = self.correlations
+        mono0, card0 = points[0].monotonic, points[0].card_time
+        if len(points) < 2:
+            self._model = (mono0, card0, 1.0)
+            return
+        xs = [p.monotonic - mono0 for p in points]
+        ys = [p.card_time - card0 for p in points]
+        n = len(points)
+        mean_x, mean_y = sum(xs) / n, sum(ys) / n
+        sxx = sum((x - mean_x) ** 2 for x in xs)
+        if sxx <= 0:
+            rate = 1.0
+        else:
+            rate = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sxx
+        self._model = (mono0 + mean_x, card0 + mean_y, rate)
+
+    def card_time(self, monotonic=None):
+        """Interpolate the card time.
+
+        Args:
+            monotonic (float): Host ``time.monotonic()``, now if None
+
+        Returns:
+            (float) Card time in seconds since the epoch
+        """
+        model = self._model
+        if model is None:
+            raise ValueError("Card clock not correlated yet!")
+        if monotonic is None:
+            monotonic = time.monotonic()
+        mono0, card0, rate = model
+        return card0 + (monotonic - mono0) * rate
+
+    def monotonic_at(self, card_time):
+        """Get the host monotonic time of a card time."""
+        mono0, card0, rate = self._model
+        return mono0 + (card_time - card0) / rate
+
+    def stamp(self, monotonic=None):
+        """Timestamp an instant, without bus traffic.
+
+        Args:
+            monotonic (float): Host ``time.monotonic()`` of the instant, now if None
+
+        Returns:
+            (Stamp) Host and card times of the instant
+        """
+        now = time.monotonic()
+        host_time = time.time()
+        if monotonic is None:
+            monotonic = now
+        else:
+            host_time -= now - monotonic
+        return Stamp(monotonic, host_time, self.card_time(monotonic))
+
+    def read(self, method, *args):
+        """Call a card method and stamp it at the middle of the call.
+
+        Args:
+            method (callable): Bound method of the card, e.g. ``card.read_snapshot``
+            args: Method arguments
+
+        Returns:
+            (tuple) (method result, Stamp)
+        """
+        before = time.monotonic()
+        result = method(*args)
+        return result, self.stamp((before + time.monotonic()) / 2)
+
+
+class TimeBase:
+    """Card clocks of a stack, correlated periodically in the background.
+
+    Args:
+        cards (list): SMmultiio cards
+        **kwargs: :class:`CardClock` arguments
+
+    Attributes:
+        clocks (dict): id(card) -> CardClock
+        errors (int): Failed background correlations
+    """
+    def __init__(self, cards, **kwargs):
+        self.cards = list(cards)
+        self.clocks = {id(card): CardClock(card, **kwargs) for card in self.cards}
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def clock(self, card):
+        """Get the CardClock of a card."""
+        return self.clocks[id(card)]
+
+    def correlate(self, max_wait=2.0):
+        """Correlate every card once, polling the cards in turn.
+
+        Returns:
+            (list) Correlation of each card, in card order
+        """
+        return correlate([self.clock(card) for card in self.cards], max_wait)
+
+    def stamp(self, card, monotonic=None):
+        """Timestamp an instant for one card (see :meth:`CardClock.stamp`)."""
+        return self.clock(card).stamp(monotonic)
+
+    def read(self, card, method, *args):
+        """Call a card method and stamp it (see :meth:`CardClock.read`)."""
+        return self.clock(card).read(method, *args)
+
+    def skew(self, monotonic=None):
+        """Get the card times of all cards at one instant, relative to the first.
+
+        Returns:
+            (list) Card time differences in seconds, in card order
+        """
+        if monotonic is None:
+            monotonic = time.monotonic()
+        times = [self.clock(card).card_time(monotonic) for card in self.cards]
+        return [t - times[0] for t in times]
+
+    def _run(self, period):
+        while not self._stop.is_set():
+            try:
+                self.correlate()
+            except (OSError, IOError):
+                self.errors += 1
+            self._stop.wait(period)
+
+    def start(self, period=600.0):
+        """Correlate all cards now and then every period seconds in a thread."""
+        if self._thread is not None:
+            return
+        self.correlate()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(period,), name="multiio-timebase", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background correlation."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def sync_rtc(self):
+        """Set every card RTC to the host time (see :func:`sync_rtc`) and
+        correlate again.
+
+        Returns:
+            (list) Seconds after the second boundary each card was set at
+        """
+        delays = sync_rtc(self.cards)
+        for card in self.cards:
+            self.clock(card).reset()
+        self.correlate()
+        return delays
+
+
+def sync_rtc(cards):
+    """Set the RTC of several cards to the host UTC time.
+
+    Waits for the next whole second of ``time.time()`` and writes it to all
+    cards back to back, one transaction each.
+
+    Args:
+        cards (list): SMmultiio cards
+
+    Returns:
+        (list) Seconds after the second boundary each card was set at, in
+            card order
+    """
+    now = time.time()
+    second = int(now) + 1
+    time.sleep(second - now)
+    while time.time() < second:
+        pass
+    fields = time.gmtime(second)[:6]
+    delays = []
+    for card in cards:
+        card.set_rtc(*fields)
+        delays.append(time.time() - second)
+    return delays
+
+
+def correlate(clocks, max_wait=2.0):
+    """Find the next RTC second edge of several card clocks.
+
+    The cards are polled in turn, each from ``window`` before its predicted
+    edge (at once for clocks without a model), so cards with edges close
+    together are correlated in the same second.
+
+    Args:
+        clocks (list): CardClock objects
+        max_wait (float): Seconds to wait for the edge of each card
+
+    Returns:
+        (list) Correlation of each clock, in order
+    """
+    now = time.monotonic()
+    starts = {}
+    for clock in clocks:
+        starts[clock] = now
+        if clock.synchronized:
+            starts[clock] = max(now, clock.monotonic_at(int(clock.card_time(now)) + 1) - clock.window)
+    resolution = min(clock.resolution for clock in clocks)
+    last = {}
+    results = {}
+    while len(results) < len(clocks):
+        now = time.monotonic()
+        waiting = [clock for clock in clocks if clock not in results]
+        due = [clock for clock in waiting if starts[clock] <= now]
+        if not due:
+            time.sleep(min(starts[clock] for clock in waiting) - now)
+            continue
+        for clock in due:
+            seconds, when = clock._poll()
+            previous = last.get(clock)
+            if previous is not None and seconds != previous[0]:
+                results[clock] = clock._add(Correlation(
+                        (previous[1] + when) / 2, seconds, (when - previous[1]) / 2))
+            elif when > starts[clock] + max_wait:
+                raise OSError(errno.ETIMEDOUT, "Card RTC is not running!")
+            else:
+                last[clock] = (seconds, when)
+        time.sleep(resolution)
+    return [results[clock] for clock in clocks]
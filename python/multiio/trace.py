@@ -0,0 +1,476 @@
+"""Bus transaction traces: recording and deterministic replay.
+
+:class:`TraceRecorder` appends every transaction of the cards recording to
+it (see :meth:`multiio.SMmultiio.record`) to a compact binary file: the
+operation, device and register, length, payload, time since the start of
+the trace and duration. :class:`ReplayBus` serves a trace back as an SMBus
+backend, at the original pace, faster, or as fast as possible::
+
+    >>> with TraceRecorder("field.trace") as recorder:
+    ...     card.record(recorder)
+    ...     run_application(card)
+
+    >>> bus = ReplayBus("field.trace", speed=10)
+    >>> card = SMmultiio(0, bus=bus)
+    >>> run_application(card)
+    >>> bus.transactions, bus.unmatched
+
+A strict replay must see the same calls from the start, including the
+revision reads of the card constructor; record those by passing
+``RecordingBus(bus, recorder)`` as the bus of the card.
+
+File layout: a header (magic, version, wall clock time of the start)
+followed by entries of a fixed 20 byte header and the payload. Read
+payloads are the bytes received, write payloads the bytes sent; for
+``i2c_rdwr`` the payload is each message as device address (u8), flags
+(u8), length (u16) and data.
+"""
+
+import collections
+import ctypes
+import errno
+import os
+import struct
+import threading
+import time
+
+from multiio.instrument import OPERATIONS
+
+_MAGIC = b"MIOT"
+_VERSION = 2
+# magic, version, reserved, start time (time.time())
+_HEADER = struct.Struct("<4sHHd")
+# time since start, duration, operation, i2c address, register, flags, length, errno
+_ENTRY = struct.Struct("<dfBBBBHH")
+_MSG = struct.Struct("<BBH")
+_OP_INDEX = {name: index for index, name in enumerate(OPERATIONS)}
+_I2C_M_RD = 0x0001
+
+# Entry flags
+ERROR = 1
+NO_REGISTER = 2
+
+
+TraceEntry = collections.namedtuple("TraceEntry", [
+    "timestamp", "duration", "operation", "i2c_addr", "register", "length", "payload", "error"])
+TraceEntry.__doc__ = """One recorded transaction.
+
+timestamp is the start in seconds since the trace start and duration the
+time the bus call took. register is None for transfers without one, length
+the requested bytes and payload the bytes moved. error is the errno of a
+failed transaction, else 0.
+"""
+
+
+class TraceRecorder:
+    """Append-only trace file writer, shared by any number of cards.
+
+    Entries reach the file when the buffer fills and at least every
+    ``flush_interval`` seconds while transactions are recorded. An existing
+    file is appended to after its last complete entry, dropping an entry
+    torn by a crash.
+
+    Args:
+        path (str): Trace file; created, or appended to if it exists
+        buffering (int): File buffer size in bytes
+        flush_interval (float): Longest time entries stay buffered, seconds
+
+    Attributes:
+        entries (int): Transactions recorded by this recorder
+    """
+    def __init__(self, path, buffering=65536, flush_interval=1.0):
+        self.path = path
+        self.entries = 0
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._file = open(path, "a+b", buffering=buffering)
+        try:
+            self._file.seek(0)
+            if len(self._file.read(_HEADER.size)) < _HEADER.size:
+                # New file, or one torn before its header was complete
+                self._file.truncate(0)
+                self.start = time.time()
+                self._file.write(_HEADER.pack(_MAGIC, _VERSION, 0, self.start))
+            else:
+                self._file.seek(0)
+                self.start = _read_header(self._file)
+                end = _HEADER.size
+                for end, _ in _read_entries(self._file):
+                    pass
+                self._file.truncate(end)
+        except Exception:
+            self._file.close()
+            raise
+        self._origin = time.monotonic() - (time.time() - self.start)
+        self._flushed = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, operation, i2c_addr, register, length, payload, start, duration, error=0):
+        """Append one transaction.
+
+        Args:
+            operation (str): SMBus method name
+            i2c_addr (int): Device address
+            register (int): Start register, None if none
+            length (int): Requested bytes
+            payload (bytes): Bytes moved
+            start (float): ``time.monotonic()`` at the start
+            duration (float): Seconds taken
+            error (int): errno of a failure, 0 if none
+        """
+        flags = (ERROR if error else 0) | (NO_REGISTER if register is None else 0)
+        entry = _ENTRY.pack(start - self._origin, duration, _OP_INDEX[operation], i2c_addr,
+                            register or 0, flags, length, error) + payload
+        with self._lock:
+            self._file.write(entry)
+            self.entries += 1
+            end = start + duration
+            if end - self._flushed >= self.flush_interval:
+                self._file.flush()
+                self._flushed = end
+
+    def flush(self):
+        """Write buffered entries to the file."""
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        """Flush and close the trace file."""
+        with self._lock:
+            self._file.close()
+
+
+def _read_header(f):
+    header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise ValueError("Invalid trace file!")
+    magic, version, _, start = _HEADER.unpack(header)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Invalid trace file!")
+    return start
+
+
+def read_trace(path):
+    """Iterate over the entries of a trace file.
+
+    Args:
+        path (str): Trace file
+
+    Yields:
+        (TraceEntry) Recorded transactions in order
+    """
+    with open(path, "rb") as f:
+        _read_header(f)
+        for _, entry in _read_entries(f):
+            yield entry
+
+
+def _read_entries(f):
+    # (end offset, TraceEntry) of each complete entry, up to a torn one
+    while True:
+        header = f.read(_ENTRY.size)
+        if len(header) < _ENTRY.size:
+            return
+        timestamp, duration, op, i2c_addr, register, flags, length, error = _ENTRY.unpack(header)
+        size = 0 if flags & ERROR else length
+        if op >= len(OPERATIONS):
+            return
+        payload = f.read(size)
+        if len(payload) < size:
+            return
+        yield f.tell(), TraceEntry(timestamp, duration, OPERATIONS[op], i2c_addr,
+                                   None if flags & NO_REGISTER else register, length, payload, error)
+
+
+def trace_start(path):
+    """Get the wall clock time a trace file was started."""
+    with open(path, "rb") as f:
+        return _read_header(f)
+
+
+def _rdwr_payload(i2c_msgs):
+    parts = []
+    for msg in i2c_msgs:
+        parts.append(_MSG.pack(msg.addr, msg.flags & 0xff, msg.len))
+        parts.append(bytes(msg.buf[:msg.len]) if msg.len else b"")
+    return b"".join(parts)
+
+
+def _rdwr_messages(payload):
+    # (address, flags, data) of each recorded i2c_rdwr message
+    messages = []
+    offset = 0
+    while offset < len(payload):
+        addr, flags, length = _MSG.unpack_from(payload, offset)
+        offset += _MSG.size
+        messages.append((addr, flags, payload[offset:offset + length]))
+        offset += length
+    return messages
+
+
+def _rdwr_layout(payload):
+    # (address, flags, length) of each recorded i2c_rdwr message
+    return [(addr, flags, len(chunk)) for addr, flags, chunk in _rdwr_messages(payload)]
+
+
+class RecordingBus:
+    """SMBus wrapper writing every transaction to a :class:`TraceRecorder`.
+
+    Args:
+        bus: SMBus compatible object to wrap
+        recorder (TraceRecorder): Trace writer
+    """
+    def __init__(self, bus, recorder):
+        self.bus = bus
+        self.recorder = recorder
+
+    def _call(self, operation, i2c_addr, register, length, sent, method, *args):
+        start = time.monotonic()
+        try:
+            result = method(*args)
+        except OSError as e:
+            self.recorder.write(operation, i2c_addr, register, length, b"",
+                                start, time.monotonic() - start, e.errno or errno.EIO)
+            raise
+        duration = time.monotonic() - start
+        if sent is not None:
+            payload = sent
+        elif operation == "read_word_data":
+            payload = struct.pack("<H", result)
+        elif operation in ("read_byte", "read_byte_data"):
+            payload = bytes([result])
+        else:
+            payload = bytes(result)
+        self.recorder.write(operation, i2c_addr, register, length, payload, start, duration)
+        return result
+
+    def read_byte(self, i2c_addr, force=None):
+        return self._call("read_byte", i2c_addr, None, 1, None, self.bus.read_byte, i2c_addr, force)
+    def write_byte(self, i2c_addr, value, force=None):
+        return self._call("write_byte", i2c_addr, None, 1, bytes([value & 0xff]),
+                          self.bus.write_byte, i2c_addr, value, force)
+    def write_quick(self, i2c_addr, force=None):
+        return self._call("write_quick", i2c_addr, None, 0, b"", self.bus.write_quick, i2c_addr, force)
+    def read_byte_data(self, i2c_addr, register, force=None):
+        return self._call("read_byte_data", i2c_addr, register, 1, None,
+                          self.bus.read_byte_data, i2c_addr, register, force)
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        return self._call("write_byte_data", i2c_addr, register, 1, bytes([value & 0xff]),
+                          self.bus.write_byte_data, i2c_addr, register, value, force)
+    def read_word_data(self, i2c_addr, register, force=None):
+        return self._call("read_word_data", i2c_addr, register, 2, None,
+                          self.bus.read_word_data, i2c_addr, register, force)
+    def write_word_data(self, i2c_addr, register, value, force=None):
+        return self._call("write_word_data", i2c_addr, register, 2, struct.pack("<H", value & 0xffff),
+                          self.bus.write_word_data, i2c_addr, register, value, force)
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        return self._call("read_i2c_block_data", i2c_addr, register, length, None,
+                          self.bus.read_i2c_block_data, i2c_addr, register, length, force)
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        return self._call("write_i2c_block_data", i2c_addr, register, len(data), bytes(data),
+                          self.bus.write_i2c_block_data, i2c_addr, register, data, force)
+    def write_block_data(self, i2c_addr, register, data, force=None):
+        return self._call("write_block_data", i2c_addr, register, len(data), bytes(data),
+                          self.bus.write_block_data, i2c_addr, register, data, force)
+    def i2c_rdwr(self, *i2c_msgs):
+        start = time.monotonic()
+        register = None
+        if i2c_msgs and not i2c_msgs[0].flags & _I2C_M_RD and i2c_msgs[0].len:
+            register = i2c_msgs[0].buf[0][0]
+        i2c_addr = i2c_msgs[0].addr if i2c_msgs else 0
+        try:
+            self.bus.i2c_rdwr(*i2c_msgs)
+        except OSError as e:
+            # The messages are kept so a replay can match them
+            payload = _rdwr_payload(i2c_msgs)
+            self.recorder.write("i2c_rdwr", i2c_addr, register, len(payload), payload,
+                                start, time.monotonic() - start, e.errno or errno.EIO)
+            raise
+        duration = time.monotonic() - start
+        payload = _rdwr_payload(i2c_msgs)
+        self.recorder.write("i2c_rdwr", i2c_addr, register, len(payload), payload, start, duration)
+
+    def close(self):
+        self.bus.close()
+
+
+class TraceMismatch(OSError):
+    """A replayed call differs from the recorded transaction."""
+
+
+class ReplayBus:
+    """SMBus backend answering with the transactions of a trace.
+
+    Calls are matched with the recorded transactions in order (operation,
+    device, register and length; for ``i2c_rdwr`` the device, flags and
+    length of every message). Reads return the recorded bytes, failed
+    transactions raise their recorded errno again. With ``strict`` a call
+    that does not match raises :class:`TraceMismatch`; otherwise the next
+    ``lookahead`` entries are searched (entries skipped are counted) and
+    calls without a match are answered from a memory image of each device
+    built from the trace so far.
+
+    Args:
+        trace: Trace file path or iterable of TraceEntry
+        speed (float): Replay pace: 1 for the original timing, 10 for 10
+            times faster, None for no waiting
+        strict (bool): Raise on calls that differ from the trace
+        lookahead (int): Entries searched for a match when not strict
+
+    Attributes:
+        transactions (int): Calls served
+        matched (int): Calls served by their recorded transaction
+        unmatched (int): Calls served from the memory image
+        skipped (int): Recorded transactions the replayed code did not make
+    """
+    def __init__(self, trace, speed=None, strict=False, lookahead=32):
+        if isinstance(trace, (str, bytes, os.PathLike)):
+            trace = read_trace(trace)
+        self.entries = list(trace)
+        self.speed = speed
+        self.strict = strict
+        self.lookahead = lookahead
+        self.position = 0
+        self.transactions = 0
+        self.matched = 0
+        self.unmatched = 0
+        self.skipped = 0
+        self._images = collections.defaultdict(lambda: bytearray(256))
+        self._lock = threading.Lock()
+        self._origin = None
+
+    @property
+    def done(self):
+        """True once every recorded transaction was replayed or skipped."""
+        return self.position >= len(self.entries)
+
+    def _apply(self, entry):
+        # Keep the device image current with a recorded transaction
+        if entry.error or entry.register is None:
+            return
+        image = self._images[entry.i2c_addr]
+        if entry.operation == "i2c_rdwr":
+            register = entry.register
+            for _, flags, chunk in _rdwr_messages(entry.payload):
+                if not flags & _I2C_M_RD:
+                    register = chunk[0]
+                    chunk = chunk[1:]
+                end = min(256, register + len(chunk))
+                image[register:end] = chunk[:end - register]
+                if flags & _I2C_M_RD:
+                    register = end
+            return
+        end = min(256, entry.register + len(entry.payload))
+        image[entry.register:end] = entry.payload[:end - entry.register]
+
+    def _wait(self, entry):
+        if self.speed is None:
+            return
+        now = time.monotonic()
+        if self._origin is None:
+            self._origin = now - entry.timestamp / self.speed
+        target = self._origin + (entry.timestamp + entry.duration) / self.speed
+        if target > now:
+            time.sleep(target - now)
+
+    def _next(self, operation, i2c_addr, register, length, layout=None):
+        # Recorded entry for a call, None to serve it from the image
+        with self._lock:
+            self.transactions += 1
+            entries = self.entries
+            end = min(len(entries), self.position + (1 if self.strict else self.lookahead))
+            for index in range(self.position, end):
+                entry = entries[index]
+                if (entry.operation == operation and entry.i2c_addr == i2c_addr
+                        and entry.register == register and entry.length == length
+                        and (layout is None or _rdwr_layout(entry.payload) == layout)):
+                    for skipped in entries[self.position:index]:
+                        self._apply(skipped)
+                    self.skipped += index - self.position
+                    self.position = index + 1
+                    self._apply(entry)
+                    self.matched += 1
+                    break
+            else:
+                if self.strict:
+                    expected = entries[self.position] if self.position < len(entries) else "end of trace"
+                    raise TraceMismatch(errno.EPROTO, "Call {} {:#x} {} {} does not match {}".format(
+                            operation, i2c_addr, register, length, expected))
+                self.unmatched += 1
+                return None
+        self._wait(entry)
+        if entry.error:
+            raise OSError(entry.error, os.strerror(entry.error))
+        return entry
+
+    def _read(self, operation, i2c_addr, register, length):
+        entry = self._next(operation, i2c_addr, register, length)
+        if entry is not None:
+            return entry.payload
+        start = register or 0
+        return bytes(self._images[i2c_addr][start:start + length])
+
+    def _write(self, operation, i2c_addr, register, payload):
+        entry = self._next(operation, i2c_addr, register, len(payload))
+        if entry is None and register is not None:
+            image = self._images[i2c_addr]
+            end = min(256, register + len(payload))
+            image[register:end] = bytes(payload)[:end - register]
+
+    def read_byte(self, i2c_addr, force=None):
+        return self._read("read_byte", i2c_addr, None, 1)[0]
+    def write_byte(self, i2c_addr, value, force=None):
+        self._write("write_byte", i2c_addr, None, bytes([value & 0xff]))
+    def write_quick(self, i2c_addr, force=None):
+        self._write("write_quick", i2c_addr, None, b"")
+    def read_byte_data(self, i2c_addr, register, force=None):
+        return self._read("read_byte_data", i2c_addr, register, 1)[0]
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        self._write("write_byte_data", i2c_addr, register, bytes([value & 0xff]))
+    def read_word_data(self, i2c_addr, register, force=None):
+        return struct.unpack("<H", self._read("read_word_data", i2c_addr, register, 2))[0]
+    def write_word_data(self, i2c_addr, register, value, force=None):
+        self._write("write_word_data", i2c_addr, register, struct.pack("<H", value & 0xffff))
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        return list(self._read("read_i2c_block_data", i2c_addr, register, length))
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        self._write("write_i2c_block_data", i2c_addr, register, bytes(data))
+    def write_block_data(self, i2c_addr, register, data, force=None):
+        self._write("write_block_data", i2c_addr, register, bytes(data))
+
+    def i2c_rdwr(self, *i2c_msgs):
+        """Combined transfer; read messages are filled from the trace."""
+        register = None
+        if i2c_msgs and not i2c_msgs[0].flags & _I2C_M_RD and i2c_msgs[0].len:
+            register = i2c_msgs[0].buf[0][0]
+        i2c_addr = i2c_msgs[0].addr if i2c_msgs else 0
+        layout = [(msg.addr, msg.flags & 0xff, msg.len) for msg in i2c_msgs]
+        length = sum(_MSG.size + msg.len for msg in i2c_msgs)
+        entry = self._next("i2c_rdwr", i2c_addr, register, length, layout)
+        if entry is not None:
+            for msg, (_, _, chunk) in zip(i2c_msgs, _rdwr_messages(entry.payload)):
+                if msg.flags & _I2C_M_RD:
+                    ctypes.memmove(msg.buf, bytes(chunk), msg.len)
+            return
+        image = self._images[i2c_addr]
+        pointer = register or 0
+        for msg in i2c_msgs:
+            if msg.flags & _I2C_M_RD:
+                ctypes.memmove(msg.buf, bytes(image[pointer:pointer + msg.len]), msg.len)
+                pointer += msg.len
+            elif msg.len:
+                payload = bytes(msg.buf[:msg.len])
+                pointer = payload[0]
+                image[pointer:pointer + len(payload) - 1] = payload[1:]
+
+    def close(self):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,228 @@
+"""Watchdog keeper that rides on the application bus traffic.
+
+A missed reload makes the card power-cycle the Raspberry Pi. The keeper
+reloads the watchdog at a fraction of its period, piggybacking the reload on
+the first transaction the application makes once a reload is due. Only when
+the bus stays idle does a sleeping timer thread send the reload itself, under
+the same lock as the application transactions of the card::
+
+    >>> keeper = WatchdogKeeper(card, health_checks=[control_loop_alive])
+    >>> keeper.start()
+    >>> # ... normal use of card ...
+    >>> keeper.stop()
+"""
+
+import threading
+import time
+
+import multiio.multiio_data as data
+I2C_MEM = data.I2C_MEM
+
+# Seconds before a failed timer reload is retried
+RETRY = 0.1
+
+_BUS_METHODS = (
+    "read_byte", "write_byte", "write_quick",
+    "read_byte_data", "write_byte_data",
+    "read_word_data", "write_word_data",
+    "read_i2c_block_data", "write_i2c_block_data",
+    "write_block_data", "i2c_rdwr",
+)
+
+
+class WatchdogKeeper:
+    """Reload the watchdog of one card at a safe fraction of its period.
+
+    Reloads stop as soon as a health check returns False (or raises), so a
+    hung application still gets the Pi power-cycled.
+
+    Args:
+        card (SMmultiio): Card to keep alive
+        fraction (float): Reload after this fraction of the watchdog period
+        health_checks (list): Callables returning True while healthy
+        period (float): Watchdog period in seconds, read with
+            ``wdt_get_period`` if None
+
+    Attributes:
+        reloads (int): Reloads sent
+        piggybacked (int): Reloads sent after an application transaction
+        timer_reloads (int): Reloads sent by the idle timer
+        last_jitter (float): Last reload interval minus the target interval
+        max_jitter (float): Largest reload interval excess seen
+        min_margin (float): Smallest time left before expiry at a reload
+        healthy (bool): False once a health check failed
+        timer_errors (int): Failed timer reloads, retried after RETRY seconds
+        piggyback_errors (int): Failed reloads after application transactions
+    """
+    def __init__(self, card, fraction=0.5, health_checks=(), period=None):
+        if not (0 < fraction < 1):
+            raise ValueError("Invalid reload fraction! Must be (0..1)")
+        if period is None:
+            period = card.wdt_get_period()
+        if period <= 0:
+            raise ValueError("Invalid watchdog period! The watchdog must be enabled")
+        self.card = card
+        self.period = float(period)
+        self.interval = self.period * fraction
+        self.health_checks = list(health_checks)
+        self.reloads = 0
+        self.piggybacked = 0
+        self.timer_reloads = 0
+        self.last_jitter = 0.0
+        self.max_jitter = 0.0
+        self.min_margin = self.period
+        self.healthy = True
+        self.timer_errors = 0
+        self.piggyback_errors = 0
+        self._last = None
+        self._due = float("inf")
+        self._timer_due = float("inf")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._bus = None
+
+    def add_health_check(self, check):
+        """Add a callable that returns True while the application is healthy."""
+        self.health_checks.append(check)
+
+    def start(self):
+        """Reload now and start following the card traffic."""
+        if self._bus is not None:
+            return
+        self._bus = _KeeperBus(self.card.bus, self)
+        self.card.bus = self._bus
+        with self._bus.lock:
+            self._reload(self._bus.bus, None)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="multiio-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop reloading; the watchdog will expire one period after the last reload."""
+        if self._bus is None:
+            return
+        self.card._unwrap(_KeeperBus)
+        self._bus = None
+        self._due = float("inf")
+        self._timer_due = float("inf")
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def poll(self):
+        """Reload if due. For loops that want to drive the keeper directly."""
+        bus = self._bus
+        if bus is not None and time.monotonic() >= self._due:
+            with bus.lock:
+                self._reload(bus.bus, None)
+
+    def metrics(self):
+        """Get keeper statistics.
+
+        Returns:
+            (dict) reloads, piggybacked, timer_reloads, timer_errors,
+                piggyback_errors, last_jitter, max_jitter, min_margin and
+                healthy
+        """
+        return {
+            "reloads": self.reloads,
+            "piggybacked": self.piggybacked,
+            "timer_reloads": self.timer_reloads,
+            "timer_errors": self.timer_errors,
+            "piggyback_errors": self.piggyback_errors,
+            "last_jitter": self.last_jitter,
+            "max_jitter": self.max_jitter,
+            "min_margin": self.min_margin,
+            "healthy": self.healthy,
+        }
+
+    def _check_health(self):
+        for check in self.health_checks:
+            try:
+                if not check():
+                    return False
+            except Exception:
+                return False
+        return True
+
+    def _reload(self, bus, source):
+        if not self._lock.acquire(False):
+            return
+        try:
+            now = time.monotonic()
+            if source is not None and now < self._due:
+                return
+            if not self.healthy or not self._check_health():
+                self.healthy = False
+                self._due = float("inf")
+                self._timer_due = float("inf")
+                return
+            bus.write_byte_data(self.card._hw_address_, I2C_MEM.WDT_RESET_ADD, data.WDT_RESET_SIGNATURE)
+            if self._last is not None:
+                elapsed = now - self._last
+                self.last_jitter = elapsed - self.interval
+                self.max_jitter = max(self.max_jitter, self.last_jitter)
+                self.min_margin = min(self.min_margin, self.period - elapsed)
+            self._last = now
+            self._due = now + self.interval
+            self.reloads += 1
+            if source == "bus":
+                self.piggybacked += 1
+            elif source == "timer":
+                self.timer_reloads += 1
+            # Leave the application half of the remaining margin to piggyback
+            self._timer_due = now + self.interval + (self.period - self.interval) / 2
+        finally:
+            self._lock.release()
+
+    def _run(self):
+        # Reloads only push the timer deadline later, so the thread sleeps
+        # until the deadline it saw and checks again
+        while not self._stop.is_set():
+            timeout = self._timer_due - time.monotonic()
+            if timeout > 0:
+                self._stop.wait(min(timeout, self.period))
+                continue
+            bus = self._bus
+            if bus is None:
+                return
+            try:
+                with bus.lock:
+                    self._reload(bus.bus, "timer")
+            except (OSError, IOError):
+                self.timer_errors += 1
+                self._stop.wait(RETRY)
+
+
+class _KeeperBus:
+    # Serializes the application transactions with the timer reloads
+    def __init__(self, bus, keeper):
+        self.bus = bus
+        self.keeper = keeper
+        self.lock = threading.RLock()
+
+    def close(self):
+        self.bus.close()
+
+
+def _forward(name):
+    def method(self, *args):
+        with self.lock:
+            result = getattr(self.bus, name)(*args)
+            if time.monotonic() >= self.keeper._due:
+                # The application call succeeded: a failed reload is only
+                # counted, and retried by the next transaction or the timer
+                try:
+                    self.keeper._reload(self.bus, "bus")
+                except (OSError, IOError):
+                    self.keeper.piggyback_errors += 1
+        return result
+    method.__name__ = name
+    return method
+
+
+for _name in _BUS_METHODS:
+    setattr(_KeeperBus, _name, _forward(_name))
+del _name
@@ -0,0 +1,327 @@
+"""Analog output waveforms written on an absolute timeline.
+
+Profiles of the 0-10V and 4-20mA outputs, the motor and the servo channels
+are sampled into a table of raw register bytes before the run starts. Each
+step is then one block write covering every driven channel, sent at
+``start + step / rate`` on the monotonic clock: a coarse sleep followed by
+a short busy wait bounds the jitter, and a late step does not shift the
+following ones::
+
+    >>> generator = WaveformGenerator(card, {
+    ...     ("u_out", 1): Ramp(0, 10, duration=5, shape="s-curve"),
+    ...     ("servo", 2): Periodic("sine", period=2, amplitude=60, duration=5),
+    ... }, rate=100)
+    >>> timing = generator.run()
+    >>> timing.rate, timing.max_error
+    (100.0, 0.00021)
+"""
+
+import array
+import bisect
+import collections
+import math
+import struct
+import threading
+import time
+
+from multiio.registers import REGISTERS, READ_WRITE
+
+# Value limits of the channels checked by the SMmultiio setters
+LIMITS = {
+    "motor": (-100, 100),
+    "servo": (-140, 140),
+}
+
+SHAPES = ("linear", "s-curve")
+PERIODIC_SHAPES = ("sine", "square", "triangle", "sawtooth")
+
+
+class Ramp:
+    """Ramp from one value to another.
+
+    Args:
+        start (float): Initial value
+        end (float): Final value
+        duration (float): Ramp time in seconds
+        shape (str): "linear" or "s-curve" (smoothstep, zero slope at both ends)
+    """
+    def __init__(self, start, end, duration, shape="linear"):
+        if shape not in SHAPES:
+            raise ValueError("Invalid ramp shape {}!".format(shape))
+        if duration < 0:
+            raise ValueError("Invalid ramp duration!")
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.shape = shape
+
+    def __call__(self, t):
+        if t >= self.duration:
+            return self.end
+        x = max(t, 0) / self.duration
+        if self.shape == "s-curve":
+            x = x * x * (3 - 2 * x)
+        return self.start + (self.end - self.start) * x
+
+
+class PiecewiseLinear:
+    """Linear interpolation of a table of points.
+
+    Args:
+        points (list): (time, value) pairs with increasing times; the value
+            holds before the first and after the last point
+    """
+    def __init__(self, points):
+        points = list(points)
+        if not points or any(b[0] <= a[0] for a, b in zip(points, points[1:])):
+            raise ValueError("Invalid points, times must increase!")
+        self.times = [p[0] for p in points]
+        self.values = [p[1] for p in points]
+        self.duration = self.times[-1]
+
+    def __call__(self, t):
+        i = bisect.bisect_right(self.times, t)
+        if i == 0:
+            return self.values[0]
+        if i == len(self.times):
+            return self.values[-1]
+        t0, t1 = self.times[i - 1], self.times[i]
+        v0, v1 = self.values[i - 1], self.values[i]
+        return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+
+
+class Periodic:
+    """Periodic waveform.
+
+    Args:
+        shape (str): "sine", "square", "triangle" or "sawtooth"
+        period (float): Period in seconds
+        amplitude (float): Peak deviation from offset
+        offset (float): Center value
+        duration (float): Run time in seconds, one period if None
+        phase (float): Phase in fractions of a period
+    """
+    def __init__(self, shape, period, amplitude, offset=0.0, duration=None, phase=0.0):
+        if shape not in PERIODIC_SHAPES:
+            raise ValueError("Invalid waveform shape {}!".format(shape))
+        if period <= 0:
+            raise ValueError("Invalid waveform period!")
+        self.shape = shape
+        self.period = period
+        self.amplitude = amplitude
+        self.offset = offset
+        self.duration = period if duration is None else duration
+        self.phase = phase
+
+    def __call__(self, t):
+        x = (t / self.period + self.phase) % 1.0
+        if self.shape == "sine":
+            y = math.sin(2 * math.pi * x)
+        elif self.shape == "square":
+            y = 1.0 if x < 0.5 else -1.0
+        elif self.shape == "triangle":
+            y = 4 * x - 1 if x < 0.5 else 3 - 4 * x
+        else:
+            y = 2 * x - 1
+        return self.offset + self.amplitude * y
+
+
+class Timing(collections.namedtuple("Timing", [
+        "steps", "missed", "errors", "elapsed", "rate", "mean_error", "max_error"])):
+    """Timing report of a waveform run.
+
+    steps are the block writes sent and missed the steps skipped because
+    the timeline was already past them; errors counts failed writes.
+    rate is the achieved writes per second; mean_error and max_error are
+    the send time minus the scheduled time of the steps, in seconds.
+    """
+    __slots__ = ()
+
+
+class WaveformGenerator:
+    """Play precomputed output profiles on one card.
+
+    All driven channels are written together with one block write per step
+    over the register range they span; channels inside that range that are
+    not driven are rewritten with the value they had when the run started.
+
+    Args:
+        card (SMmultiio): Card to drive
+        profiles (dict): (kind, channel) -> profile, a callable of the time
+            in seconds since the start; kind is "u_out", "i_out", "motor"
+            (channel 1) or "servo"
+        rate (float): Steps per second
+        repeat (bool): Loop the table until stopped instead of running once
+        spin (float): Seconds busy waited before each step
+
+    Attributes:
+        duration (float): Longest profile duration
+        step_errors (array): Send time minus scheduled time of each step,
+            NaN for missed steps
+    """
+    def __init__(self, card, profiles, rate, repeat=False, spin=0.001):
+        if rate <= 0 or not profiles:
+            raise ValueError("Invalid waveform rate or profiles!")
+        self.card = card
+        self.rate = rate
+        self.repeat = repeat
+        self.spin = spin
+        self.duration = max(profile.duration for profile in profiles.values())
+        # Looped tables leave out the end point, it is the next start
+        steps = max(1, int(round(self.duration * rate)) + (0 if repeat else 1))
+        channels = []
+        for (kind, channel), profile in sorted(profiles.items()):
+            register = REGISTERS.get(kind)
+            if register is None or register.access != READ_WRITE:
+                raise ValueError("Invalid output kind {}!".format(kind))
+            channels.append((register.check(channel), register, profile))
+        self._start = min(address for address, _, _ in channels)
+        self._end = max(address + register.size for address, register, _ in channels)
+        self._channels = channels
+        self._table = self._make_table(steps)
+        self.step_errors = array.array("d", [math.nan]) * steps
+        self._stop = threading.Event()
+        self._thread = None
+        self.timing = None
+
+    def _make_table(self, steps):
+        # Raw bytes of the driven channels for every step
+        table = []
+        for step in range(steps):
+            t = step / self.rate
+            raw = bytearray(self._end - self._start)
+            for address, register, profile in self._channels:
+                value = profile(t)
+                limits = LIMITS.get(register.name)
+                if limits is not None and not (limits[0] <= value <= limits[1]):
+                    raise ValueError("{} value out of range! Must be [{}..{}]".format(
+                        register.name.capitalize(), limits[0], limits[1]))
+                try:
+                    register.item.pack_into(raw, address - self._start, int(round(value * register.scale)))
+                except struct.error:
+                    raise ValueError("Invalid {} value {}!".format(register.name, value))
+            table.append(raw)
+        return table
+
+    def __len__(self):
+        return len(self._table)
+
+    def values(self, step):
+        """Get the values written at one step.
+
+        Returns:
+            (dict) (kind, channel) -> value, in the units of the setters
+        """
+        raw = self._table[step]
+        return {(register.name, (address - register.address) // register.size + 1):
+                register.decode(raw, address - self._start)
+                for address, register, _ in self._channels}
+
+    def run(self):
+        """Play the table in the calling thread.
+
+        Returns when the table ends, or when stopped from another thread.
+
+        Returns:
+            (Timing) Timing report, also kept in :attr:`timing`
+        """
+        self._stop.clear()
+        return self._run()
+
+    def _run(self):
+        card = self.card
+        # Current values of the channels in the range that are not driven
+        held = bytes(card.read_registers(self._start, self._end - self._start))
+        driven = set()
+        for address, register, _ in self._channels:
+            driven.update(range(address - self._start, address - self._start + register.size))
+        table = self._table
+        for raw in table:
+            for offset in range(len(raw)):
+                if offset not in driven:
+                    raw[offset] = held[offset]
+        payloads = [list(raw) for raw in table]
+        steps = len(payloads)
+        errors = self.step_errors
+        for i in range(steps):
+            errors[i] = math.nan
+        period = 1.0 / self.rate
+        spin = self.spin
+        written = missed = failed = 0
+        total_error = max_error = 0.0
+        start = time.monotonic()
+        tick = 0
+        while not self._stop.is_set():
+            step = tick % steps
+            if tick >= steps and not self.repeat:
+                break
+            target = start + tick * period
+            now = time.monotonic()
+            if now - target >= period:
+                # Past the next step already: skip to the current one, but
+                # never past the last step of a single run, which leaves the
+                # outputs at their final values
+                late = int((now - target) / period)
+                if not self.repeat:
+                    late = min(late, steps - 1 - tick)
+                if late:
+                    missed += late
+                    tick += late
+                    continue
+            if target - now > spin:
+                self._stop.wait(target - now - spin)
+            while time.monotonic() < target:
+                pass
+            sent = time.monotonic()
+            try:
+                card._set_block(self._start, payloads[step])
+            except (OSError, IOError):
+                failed += 1
+            error = sent - target
+            errors[step] = error
+            total_error += error
+            max_error = max(max_error, error)
+            written += 1
+            tick += 1
+        elapsed = time.monotonic() - start
+        self.timing = Timing(written, missed, failed, elapsed,
+                             written / elapsed if elapsed > 0 else 0.0,
+                             total_error / written if written else 0.0, max_error)
+        return self.timing
+
+    def start(self):
+        """Play the table in a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="multiio-waveform", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """Wait for a background run to end.
+
+        Returns:
+            (Timing) Timing report, None if still running
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return None
+            self._thread = None
+        return self.timing
+
+    def stop(self):
+        """Stop the run after the current step.
+
+        Returns:
+            (Timing) Timing report
+        """
+        self._stop.set()
+        return self.wait()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
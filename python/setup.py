@@ -28,6 +28,11 @@ setup(
     install_requires=[
         "smbus2",
         ],
+    entry_points={
+        "console_scripts": [
+            "multiio-py = multiio.cli:main",
+        ],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         # Chose either "3 - Alpha", "4 - Beta" or "5 - Production/Stable" as the current state of your package
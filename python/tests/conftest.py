@@ -0,0 +1,16 @@
+import pytest
+
+from multiio import SMmultiio
+from multiio.emulator import EmulatedBus
+
+
+@pytest.fixture
+def bus():
+    return EmulatedBus(stacks=[0, 1])
+
+
+@pytest.fixture
+def card(bus):
+    card = SMmultiio(0, bus=bus)
+    bus.reset_counters()
+    return card
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+import pytest
+
+from multiio import SMmultiio
+from multiio.aio import AsyncSMmultiio, get_executor
+
+# Bus number of the test executor, so blocking it does not affect other tests
+I2C = 9
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _held(card, calls):
+    # Queue the calls while the bus worker is busy, so they can merge
+    release = threading.Event()
+    blocker = asyncio.wrap_future(get_executor(I2C).submit(release.wait))
+    futures = [asyncio.ensure_future(call) for call in calls(card)]
+    await asyncio.sleep(0.01)
+    release.set()
+    await blocker
+    return await asyncio.gather(*futures)
+
+
+def test_identical_queued_reads_share_a_transaction(bus, card):
+    bus.cards[0].set_u_in(1, 2.5)
+    bus.cards[0].set_u_in(2, 7.5)
+    acard = AsyncSMmultiio(i2c=I2C, card=card)
+    results = run(_held(acard, lambda c: [c.get_u_in(1), c.get_u_in(channel=1),
+                                          c.get_u_in(1), c.get_u_in(2)]))
+    assert results == pytest.approx([2.5, 2.5, 2.5, 7.5], abs=0.01)
+    assert bus.transactions == 2
+
+
+def test_queued_writes_keep_last_value_and_order(bus, card):
+    acard = AsyncSMmultiio(i2c=I2C, card=card)
+    run(_held(acard, lambda c: [c.set_u_out(1, 1), c.set_u_out(1, 2)]))
+    assert bus.transactions == 1
+    assert card.get_u_out(1) == pytest.approx(2, abs=0.01)
+    bus.reset_counters()
+    run(_held(acard, lambda c: [c.set_u_out(1, 1), c.set_u_out(2, 1), c.set_u_out(1, 3)]))
+    assert bus.transactions == 3
+    assert card.get_u_out(1) == pytest.approx(3, abs=0.01)
+
+
+def test_batch_is_one_write(bus, card):
+    acard = AsyncSMmultiio(i2c=I2C, card=card)
+
+    async def session():
+        async with acard.batch():
+            await acard.set_u_out(1, 2.5)
+            await acard.set_u_out(2, 5)
+    run(session())
+    assert bus.transactions == 1
+    assert card.get_u_out(2) == pytest.approx(5, abs=0.01)
+
+
+def test_register_reads_are_copies(card):
+    acard = AsyncSMmultiio(i2c=I2C, card=card)
+
+    async def session():
+        first = await acard.read_registers(0, 8)
+        await acard.set_relay(1, 1)
+        return first, await acard.read_registers(0, 8)
+    first, second = run(session())
+    assert isinstance(first, bytes)
+    assert first != second
+
+
+def test_open_on_the_executor(bus):
+    async def session():
+        async with await AsyncSMmultiio.open(stack=1, i2c=I2C, bus=bus) as acard:
+            return await acard.get_version()
+    assert run(session()) == SMmultiio(1, bus=bus).get_version()
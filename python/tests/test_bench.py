@@ -0,0 +1,40 @@
+import copy
+import json
+
+from multiio import bench
+
+
+def test_every_public_method_has_arguments():
+    assert [name for name in bench.public_methods() if name not in bench.METHOD_ARGS] == []
+
+
+def test_measure_counts_exact_bus_cost():
+    snapshot = bench.measure(bench.SCENARIOS["scan_snapshot"][0], iterations=1)
+    assert snapshot["transactions"] == 3
+    batch = bench.measure(bench.SCENARIOS["outputs_batch"][0], iterations=1)
+    single = bench.measure(bench.SCENARIOS["outputs"][0], iterations=1)
+    assert batch["transactions"] < single["transactions"]
+    assert set(snapshot) >= {"cpu_us", "wall_us_100k", "wall_us_400k"}
+
+
+def test_compare_flags_regressions():
+    current = bench.run(iterations=1, select="scan_snapshot")
+    assert bench.compare(current, current) == []
+    baseline = copy.deepcopy(current)
+    baseline["results"]["scan_snapshot"]["transactions"] -= 1
+    baseline["results"]["scan_snapshot_rdwr"]["cpu_us"] = current["results"]["scan_snapshot_rdwr"]["cpu_us"] / 10
+    baseline["results"]["gone"] = baseline["results"]["scan_snapshot"]
+    regressions = bench.compare(baseline, current)
+    assert any(r.startswith("scan_snapshot: transactions") for r in regressions)
+    assert any(r.startswith("scan_snapshot_rdwr: cpu_us") for r in regressions)
+    assert "gone: not measured" in regressions
+
+
+def test_main_saves_and_compares(tmp_path, capsys):
+    path = str(tmp_path / "baseline.json")
+    assert bench.main(["--iterations", "1", "--select", "get_u_in", "--output", path]) == 0
+    with open(path) as f:
+        assert list(json.load(f)["results"]) == ["get_u_in"]
+    assert bench.main(["--iterations", "1", "--select", "get_u_in", "--compare", path,
+                       "--tolerance", "1000"]) == 0
+    assert "get_u_in" in capsys.readouterr().out
@@ -0,0 +1,58 @@
+import time
+
+import multiio.multiio_data as data
+from multiio.cache import DEFAULT_POLICIES, ttl
+
+I2C_MEM = data.I2C_MEM
+
+
+def test_configuration_reads_served_from_copy(bus, card):
+    card.enable_cache()
+    card.set_opto_edge(1, 3)
+    assert bus.transactions == 2
+    bus.reset_counters()
+    # The write kept the copy current: no read before the write
+    card.set_opto_edge(2, 1)
+    assert bus.transactions == 1
+    assert card.get_opto_edge(1) == 3
+    assert card.get_opto_edge(2) == 1
+    card.get_version()
+    bus.reset_counters()
+    card.get_version()
+    assert bus.transactions == 0
+    assert bus.cards[0].mem[I2C_MEM.OPTO_IT_RISING_ADD] == 0b11
+
+
+def test_watchdog_period_reread_after_write(bus, card):
+    card.enable_cache()
+    card.wdt_set_period(30)
+    bus.reset_counters()
+    assert card.wdt_get_period() == 30
+    assert bus.transactions == 1
+    card.wdt_get_period()
+    assert bus.transactions == 1
+
+
+def test_ttl_policy_expires(bus, card):
+    policies = dict(DEFAULT_POLICIES)
+    policies[I2C_MEM.REVISION_MAJOR_ADD] = (1, ttl(0.01))
+    card.enable_cache(policies)
+    card.get_version()
+    bus.reset_counters()
+    card.get_version()
+    assert bus.transactions == 0
+    time.sleep(0.02)
+    card.get_version()
+    assert bus.transactions == 1
+
+
+def test_refresh_and_disable(bus, card):
+    card.enable_cache()
+    card.get_opto_edge(1)
+    bus.cards[0].mem[I2C_MEM.OPTO_IT_RISING_ADD] = 1
+    assert card.get_opto_edge(1) == 0
+    card.refresh()
+    assert card.get_opto_edge(1) == 1
+    bus.cards[0].mem[I2C_MEM.OPTO_IT_FALLING_ADD] = 1
+    card.disable_cache()
+    assert card.get_opto_edge(1) == 3
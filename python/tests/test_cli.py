@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+
+import pytest
+
+from multiio import cli
+
+
+def test_parse_script():
+    operations = cli.parse_script([
+        "# comment",
+        "1 set_relay 2 1",
+        "",
+        "sleep 0.5",
+        "get_u_in 1",
+    ], stack=3)
+    assert operations == [
+        (2, 1, "set_relay", [2, 1]),
+        (4, 3, "sleep", [0.5]),
+        (5, 3, "get_u_in", [1]),
+    ]
+
+
+@pytest.mark.parametrize("line", ["close", "_set_byte 1 2", "record x", "no_such_method"])
+def test_parse_script_rejects_methods(line):
+    with pytest.raises(ValueError):
+        cli.parse_script([line])
+
+
+def test_run_script_json(bus):
+    bus.cards[1].set_u_in(2, 4.5)
+    out = io.StringIO()
+    cards = cli._Cards(1, bus)
+    operations = cli.parse_script(["1 get_u_in 2", "set_u_out 1 2.5", "get_u_out 1", "read_counters"])
+    assert cli.run_script(operations, cards, out) == 0
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [record["result"] for record in records[:3]] == [4.5, None, 2.5]
+    assert records[3]["result"] == {"opto": [0, 0, 0, 0], "encoder": [0, 0]}
+
+
+def test_run_script_stops_on_error(bus):
+    out = io.StringIO()
+    operations = cli.parse_script(["3 get_u_in 1", "get_u_in 1"])
+    assert cli.run_script(operations, cli._Cards(1, bus), out, fmt="csv") == 1
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert len(rows) == 2
+    assert "not detected" in rows[1][-1]
+
+
+def test_watch_reports_missing_card_on_stderr(bus, capsys):
+    out = io.StringIO()
+    cli.watch(cli._Cards(1, bus), [0, 3], rate=1000, out=out, fmt="csv", counters=True, count=2)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert [row["stack"] for row in rows] == ["0", "0"]
+    assert "encoder2" in rows[0]
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err.count("Stack 3:") == 2
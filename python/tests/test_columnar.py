@@ -0,0 +1,49 @@
+import pytest
+
+from multiio.columnar import ColumnTable
+from multiio.snapshot import COUNTERS_SIZE, SNAPSHOT_SIZE
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_columns_match_snapshots(bus, card, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    emulator = bus.cards[0]
+    table = ColumnTable(capacity=4, counters=True, use_numpy=use_numpy)
+    expected = []
+    for i in range(3):
+        emulator.set_u_in(1, 1.5 + i)
+        emulator.set_rtd(2, 20 + i)
+        emulator.count_opto_edges(3, 2)
+        table.read(card, timestamp=100.0 + i)
+        expected.append((card.read_snapshot(), card.read_counters()))
+    columns = table.columns()
+    assert list(columns["timestamp"]) == [100.0, 101.0, 102.0]
+    assert list(columns["stack"]) == [0, 0, 0]
+    assert list(columns["u_in1"]) == pytest.approx([s.u_in[0] for s, _ in expected])
+    assert list(columns["rtd_temp2"]) == pytest.approx([s.rtd_temp[1] for s, _ in expected])
+    assert list(columns["opto_count3"]) == [c.opto[2] for _, c in expected]
+
+
+def test_numpy_exports(bus, card):
+    pytest.importorskip("numpy")
+    table = ColumnTable(capacity=2)
+    bus.cards[0].set_u_in(2, 7.25)
+    table.read(card)
+    records = table.to_numpy()
+    assert records["u_in2"][0] == pytest.approx(7.25)
+    snapshots, counters = table.raw()
+    assert len(snapshots) == 1 and counters is None
+
+
+def test_capacity_and_raw_blocks(card):
+    table = ColumnTable(capacity=1, counters=True, use_numpy=False)
+    with pytest.raises(ValueError):
+        table.append(0, 1.0, bytes(SNAPSHOT_SIZE))
+    table.append(2, 1.0, bytes(SNAPSHOT_SIZE), bytes(COUNTERS_SIZE))
+    with pytest.raises(IndexError):
+        table.read(card)
+    table.clear()
+    assert len(table) == 0
+    table.read(card)
+    assert len(table) == 1
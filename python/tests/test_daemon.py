@@ -0,0 +1,69 @@
+import errno
+import os
+import stat
+
+import pytest
+
+from multiio import SMmultiio
+from multiio import daemon as daemon_module
+from multiio.daemon import MultiioClient, MultiioDaemon, SnapshotSegment, _SEQ, _HEADER
+
+
+@pytest.fixture
+def served(tmp_path, bus):
+    bus.cards[0].set_u_in(2, 3.25)
+    bus.cards[0].count_opto_edges(1, 5)
+    paths = {"segment_path": str(tmp_path / "segment"), "socket_path": str(tmp_path / "socket")}
+    daemon = MultiioDaemon([SMmultiio(0, bus=bus)], period=0.01, **paths)
+    daemon.start()
+    client = MultiioClient(0, **paths)
+    yield daemon, client
+    client.close()
+    daemon.stop()
+
+
+def test_client_reads_segment_and_calls_daemon(bus, served):
+    daemon, client = served
+    assert client.get_u_in(2) == pytest.approx(3.25, abs=0.01)
+    assert client.get_opto_counter(1) == 5
+    calls = daemon.calls
+    with client.batch():
+        client.set_u_out(1, 2.5)
+        client.set_relay(1, 1)
+    assert daemon.calls == calls + 2
+    assert client.get_u_out(1) == pytest.approx(2.5, abs=0.01)
+    assert client.get_relay(1) == 1
+    assert client.read_registers(0, 4) == bytes(bus.cards[0].mem[0:4])
+    with pytest.raises(ValueError):
+        client._request([("_set_block", [0, [0]])])
+
+
+def test_unknown_card_raises(served):
+    daemon, _ = served
+    other = MultiioClient(1, segment_path=daemon.segment_path, socket_path=daemon.socket_path)
+    with pytest.raises(OSError) as info:
+        other.get_u_in(1)
+    assert info.value.errno == errno.ENODEV
+    with pytest.raises(OSError):
+        other.set_relay(1, 1)
+    other.close()
+
+
+def test_socket_and_segment_owner_only(served):
+    daemon, _ = served
+    assert stat.S_IMODE(os.stat(daemon.socket_path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(daemon.segment_path).st_mode) == 0o600
+
+
+def test_read_of_abandoned_slot_gives_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon_module, "READ_RETRIES", 10)
+    path = str(tmp_path / "segment")
+    writer = SnapshotSegment(path, create=True)
+    # A writer that died between the two sequence increments
+    _SEQ.pack_into(writer._mm, _HEADER.size, 1)
+    reader = SnapshotSegment(path)
+    with pytest.raises(OSError) as info:
+        reader.read(0)
+    assert info.value.errno == errno.EBUSY
+    reader.close()
+    writer.close()
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from multiio.datalog import DataLogger, LogReader, LogSegment
+from multiio.snapshot import COUNTERS_SIZE, SNAPSHOT_SIZE
+
+
+def test_records_round_trip(tmp_path, bus, card):
+    bus.cards[0].set_u_in(1, 3.5)
+    bus.cards[0].count_opto_edges(2, 4)
+    with DataLogger(str(tmp_path)) as logger:
+        logger.log(card, timestamp=1000.0)
+        path = logger.segments[0]
+        with LogSegment(path) as segment:
+            assert len(segment) == 1
+            timestamp, stack, snapshot, counters = segment.record(0)
+    assert (timestamp, stack) == (1000.0, 0)
+    assert snapshot == card.read_snapshot()
+    assert counters.opto[1] == 4
+
+
+def test_rotation_and_time_ranges(tmp_path, card):
+    pytest.importorskip("numpy")
+    with DataLogger(str(tmp_path), segment_records=4, rotate_seconds=100) as logger:
+        for i in range(10):
+            logger.log(card, timestamp=1000.0 + i)
+        logger.log(card, timestamp=1200.0)
+        assert len(logger.segments) == 4
+    with LogReader(str(tmp_path)) as reader:
+        views = reader.between(1002.0, 1007.0)
+        assert [list(view["timestamp"]) for view in views] == [[1002.0, 1003.0], [1004.0, 1005.0, 1006.0]]
+        assert len(reader.segments(1009.0, 1010.0)) == 1
+        columns = reader.columns()
+        assert len(columns["u_in1"]) == 11
+        assert columns["u_in1"].dtype.kind == "f"
+
+
+def test_new_logger_continues_numbering_of_its_prefix(tmp_path):
+    directory = str(tmp_path)
+    for prefix in ("multiio", "multiio-other"):
+        with DataLogger(directory, prefix=prefix) as logger:
+            logger.append(0, 1.0, bytes(SNAPSHOT_SIZE), bytes(COUNTERS_SIZE))
+    with DataLogger(directory) as logger:
+        logger.append(0, 2.0, bytes(SNAPSHOT_SIZE), bytes(COUNTERS_SIZE))
+        assert os.path.basename(logger.segments[0]) == "multiio-000001.mlog"
+    with pytest.raises(ValueError):
+        DataLogger(directory).append(0, 3.0, bytes(1), bytes(COUNTERS_SIZE))
+
+
+def test_failed_read_leaves_no_record(tmp_path, bus, card):
+    with DataLogger(str(tmp_path)) as logger:
+        bus.remove_card(0)
+        with pytest.raises(OSError):
+            logger.log(card, timestamp=1.0)
+        assert logger.errors == 1
+        with LogSegment(logger.segments[0]) as segment:
+            assert len(segment) == 0
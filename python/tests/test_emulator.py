@@ -0,0 +1,86 @@
+import errno
+
+import pytest
+
+from multiio import SMmultiio, I2C_BLOCK_MAX, MEM_END
+from multiio.snapshot import SNAPSHOT_SIZE
+
+
+def test_snapshot_is_two_block_transfers(bus, card):
+    emulated = bus.cards[0]
+    emulated.set_u_in(1, 4.5)
+    emulated.set_i_in(2, 12)
+    emulated.set_opto(0b0101)
+    card.set_relay(2, 1)
+    bus.reset_counters()
+
+    snapshot = card.read_snapshot()
+
+    assert bus.transactions == 2
+    assert snapshot.u_in[0] == pytest.approx(4.5)
+    assert snapshot.i_in[1] == pytest.approx(12)
+    assert snapshot.opto == 0b0101
+    assert snapshot.get_relay(2) == 1
+
+
+def test_snapshot_matches_getters(bus, card):
+    bus.cards[0].set_rtd(1, 21.5)
+    card.set_u_out(2, 7.25)
+    card.set_servo(1, -30)
+    snapshot = card.read_snapshot()
+
+    assert snapshot.u_out[1] == card.get_u_out(2)
+    assert snapshot.servo[0] == card.get_servo(1)
+    assert snapshot.rtd_temp[0] == card.get_rtd_temp(1)
+
+
+def test_batch_merges_output_writes(bus, card):
+    with card.batch():
+        card.set_u_out(1, 2.5)
+        card.set_u_out(2, 5)
+        card.set_i_out(1, 12)
+        card.set_i_out(2, 20)
+        assert bus.transactions == 0
+
+    assert bus.transactions == 1
+    assert card.get_u_out(1) == pytest.approx(2.5)
+    assert card.get_u_out(2) == pytest.approx(5)
+    assert card.get_i_out(1) == pytest.approx(12)
+    assert card.get_i_out(2) == pytest.approx(20)
+
+
+def test_batch_drops_writes_on_error(bus, card):
+    with pytest.raises(RuntimeError):
+        with card.batch():
+            card.set_u_out(1, 2.5)
+            raise RuntimeError
+    assert bus.transactions == 0
+    assert card.get_u_out(1) == 0
+
+
+def test_rdwr_reads_past_block_limit(bus):
+    block = SMmultiio(0, bus=bus)
+    rdwr = SMmultiio(0, bus=bus, rdwr=True)
+    bus.cards[0].set_u_in(2, 3.3)
+    length = MEM_END
+    assert length > I2C_BLOCK_MAX
+
+    bus.reset_counters()
+    expected = bytes(block.read_registers(0, length))
+    assert bus.transactions == -(-length // I2C_BLOCK_MAX)
+
+    bus.reset_counters()
+    assert bytes(rdwr.read_registers(0, length)) == expected
+    assert bus.transactions == 1
+
+    assert SNAPSHOT_SIZE > I2C_BLOCK_MAX
+    snapshot = block.read_snapshot()
+    bus.reset_counters()
+    assert rdwr.read_snapshot() == snapshot
+    assert bus.transactions == 1
+
+
+def test_missing_card_raises(bus):
+    with pytest.raises(OSError) as info:
+        SMmultiio(2, bus=bus)
+    assert info.value.errno == errno.EREMOTEIO
@@ -0,0 +1,112 @@
+import time
+
+import pytest
+
+from multiio.events import EventDispatcher, numpy
+
+USE_NUMPY = [False, True] if numpy is not None else [False]
+
+
+@pytest.mark.parametrize("use_numpy", USE_NUMPY)
+def test_threshold_on_the_limit(bus, card, use_numpy):
+    events = EventDispatcher(use_numpy=use_numpy)
+    fired = []
+    events.subscribe_threshold(card, "u_in", 1, lambda event: fired.append(event.value), high=5)
+    for value in (5, 5, 5, 4, 4, 5):
+        bus.cards[0].set_u_in(1, value)
+        events.poll()
+    assert fired == [5.0, 4.0, 5.0]
+
+
+@pytest.mark.parametrize("use_numpy", USE_NUMPY)
+def test_threshold_hysteresis(bus, card, use_numpy):
+    events = EventDispatcher(use_numpy=use_numpy)
+    fired = []
+    events.subscribe_threshold(card, "u_in", 1, lambda event: fired.append(event.value), high=5, low=3)
+    for value in (8, 4, 6, 2.5, 4, 5):
+        bus.cards[0].set_u_in(1, value)
+        events.poll()
+    assert fired == [8.0, 2.5, 5.0]
+
+
+@pytest.mark.parametrize("use_numpy", USE_NUMPY)
+def test_subscriptions_keep_threshold_state(bus, card, use_numpy):
+    events = EventDispatcher(use_numpy=use_numpy)
+    fired = []
+    events.subscribe_threshold(card, "u_in", 1, lambda event: fired.append(event.value), high=5, low=3)
+    bus.cards[0].set_u_in(1, 8)
+    events.poll()
+    handle = events.subscribe_threshold(card, "u_in", 2, lambda event: None, high=5)
+    events.poll()
+    events.unsubscribe(handle)
+    events.poll()
+    assert fired == [8.0]
+    bus.cards[0].set_u_in(1, 2)
+    events.poll()
+    assert fired == [8.0, 2.0]
+
+
+def test_opto_edges(bus, card):
+    events = EventDispatcher()
+    rising, both = [], []
+    events.subscribe_opto(card, 2, lambda event: rising.append(event.value), edge="rising")
+    events.subscribe_opto(card, 2, lambda event: both.append(event.value))
+    for mask in (0, 2, 2, 0, 2):
+        bus.cards[0].set_opto(mask)
+        events.poll()
+    assert rising == [True, True]
+    assert both == [True, False, True]
+
+
+@pytest.mark.parametrize("latch", [False, True])
+def test_button_reports_presses_once(bus, card, latch):
+    events = EventDispatcher()
+    presses = []
+    events.subscribe_button(card, lambda event: presses.append(event.value), latch=latch)
+    emulated = bus.cards[0]
+    emulated.press_button()
+    events.poll()
+    events.poll()
+    events.poll()
+    emulated.release_button()
+    events.poll()
+    emulated.press_button()
+    events.poll()
+    assert presses == [True, True]
+
+
+def test_one_read_per_card_per_cycle(bus, card):
+    events = EventDispatcher()
+    for channel in (1, 2):
+        events.subscribe_threshold(card, "u_in", channel, lambda event: None, high=5)
+        events.subscribe_opto(card, channel, lambda event: None)
+    bus.reset_counters()
+    events.poll()
+    assert bus.transactions == 2
+
+
+def test_failing_callback_does_not_stop_dispatch(bus, card):
+    events = EventDispatcher()
+    delivered = []
+
+    def broken(event):
+        raise RuntimeError("callback bug")
+
+    events.subscribe_opto(card, 1, broken)
+    events.subscribe_opto(card, 1, delivered.append)
+    events.start(period=0.005)
+    try:
+        bus.cards[0].set_opto(1)
+        for _ in range(200):
+            if delivered:
+                break
+            time.sleep(0.005)
+        bus.cards[0].set_opto(0)
+        for _ in range(200):
+            if len(delivered) == 2:
+                break
+            time.sleep(0.005)
+    finally:
+        events.stop()
+    assert [event.value for event in delivered] == [True, False]
+    assert events.callback_errors == 2
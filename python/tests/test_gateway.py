@@ -0,0 +1,80 @@
+import asyncio
+import struct
+
+import pytest
+
+from multiio import SMmultiio
+from multiio.gateway import GATEWAY_PATH_UNAVAILABLE, GATEWAY_TARGET_FAILED, ModbusTcpGateway
+from multiio.modbus import (HOLDING_U_OUT, INPUT_U_IN, READ_INPUT_REGISTERS,
+                            WRITE_SINGLE_COIL, WRITE_SINGLE_REGISTER)
+
+
+def read_u_in(channel):
+    return struct.pack(">BHH", READ_INPUT_REGISTERS, INPUT_U_IN + channel - 1, 1)
+
+
+def write_u_out(channel, millivolts):
+    return struct.pack(">BHH", WRITE_SINGLE_REGISTER, HOLDING_U_OUT + channel - 1, millivolts)
+
+
+@pytest.fixture
+def gateway(bus):
+    cards = [SMmultiio(0, bus=bus), SMmultiio(1, bus=bus)]
+    return ModbusTcpGateway(cards, host="127.0.0.1", port=0, period=10, write_delay=0.01)
+
+
+def test_reads_share_one_snapshot(bus, gateway):
+    bus.cards[1].set_u_in(2, 4.5)
+
+    async def session():
+        return await asyncio.gather(*[gateway.execute(2, read_u_in(2)) for _ in range(5)])
+    responses = asyncio.run(session())
+    assert set(responses) == {bytes([READ_INPUT_REGISTERS, 2]) + struct.pack(">H", 4500)}
+    assert gateway.cache.reads == 1
+
+
+def test_writes_of_clients_merge_into_one_batch(bus, gateway):
+    async def session():
+        return await asyncio.gather(
+            gateway.execute(1, write_u_out(1, 2500)),
+            gateway.execute(1, write_u_out(2, 5000)),
+            gateway.execute(1, struct.pack(">BHH", WRITE_SINGLE_COIL, 0, 0xff00)))
+    bus.reset_counters()
+    responses = asyncio.run(session())
+    assert responses[0] == write_u_out(1, 2500)
+    assert gateway.batches == 1
+    # One block write for both outputs and one relay write
+    assert bus.transactions == 2
+    card = SMmultiio(0, bus=bus)
+    assert card.get_u_out(2) == pytest.approx(5, abs=0.01)
+    assert card.get_relay(1) == 1
+
+
+def test_unreachable_units(bus, gateway):
+    async def session():
+        return (await gateway.execute(7, read_u_in(1)), await gateway.execute(2, read_u_in(1)))
+    bus.remove_card(1)
+    missing, failed = asyncio.run(session())
+    assert missing == bytes([READ_INPUT_REGISTERS | 0x80, GATEWAY_PATH_UNAVAILABLE])
+    assert failed == bytes([READ_INPUT_REGISTERS | 0x80, GATEWAY_TARGET_FAILED])
+    assert gateway.cache.errors == 1
+
+
+def test_tcp_round_trip(bus, gateway):
+    bus.cards[0].set_u_in(1, 1.25)
+
+    async def session():
+        server = await gateway.start()
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        pdu = read_u_in(1)
+        writer.write(struct.pack(">HHHB", 7, 0, len(pdu) + 1, 1) + pdu)
+        await writer.drain()
+        header = await reader.readexactly(7)
+        body = await reader.readexactly(struct.unpack(">HHHB", header)[2] - 1)
+        writer.close()
+        await gateway.close()
+        return header, body
+    header, body = asyncio.run(session())
+    assert struct.unpack(">HHHB", header)[0] == 7
+    assert body == bytes([READ_INPUT_REGISTERS, 2]) + struct.pack(">H", 1250)
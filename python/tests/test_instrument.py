@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+import multiio.multiio_data as data
+from multiio.emulator import EmulatedBus
+from multiio.instrument import OPERATIONS, InstrumentedBus, Metrics
+
+
+def op(name):
+    return OPERATIONS.index(name)
+
+
+def test_counts_transactions_bytes_and_registers(card):
+    metrics = card.instrument(Metrics())
+    card.get_u_in(1)
+    card.set_u_out(1, 2.5)
+    card.read_snapshot()
+    reads = metrics.transactions[op("read_i2c_block_data")]
+    assert reads >= 2
+    assert metrics.transactions[op("write_word_data")] == 1
+    assert metrics.bytes[op("write_word_data")] == 2
+    assert metrics.register_transactions[data.I2C_MEM.U_OUT] == 1
+    assert sum(metrics.latency_buckets[op("write_word_data")]) == 1
+    text = metrics.prometheus(labels={"stack": 0})
+    assert 'multiio_transactions_total{op="write_word_data",stack="0"} 1' in text
+
+
+def test_failed_transaction_counted_and_raised():
+    metrics = Metrics()
+    hooked = []
+    metrics.add_hook(lambda *args: hooked.append(args))
+    bus = InstrumentedBus(EmulatedBus(stacks=[0]), metrics)
+    with pytest.raises(OSError):
+        bus.read_byte_data(data.SLAVE_OWN_ADDRESS_BASE + 3, 0)
+    assert metrics.errors[op("read_byte_data")] == 1
+    assert metrics.register_errors[0] == 1
+    assert metrics.bytes[op("read_byte_data")] == 0
+    assert hooked[0][0] == "read_byte_data" and hooked[0][4] is True
+
+
+def test_threads_share_one_metrics():
+    metrics = Metrics()
+    threads = [threading.Thread(target=lambda: [metrics.record("read_byte_data", 7, 1, 0.001)
+                                                for _ in range(2000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.transactions[op("read_byte_data")] == 16000
+    assert metrics.register_bytes[7] == 16000
@@ -0,0 +1,48 @@
+import pytest
+
+from multiio import SMmultiio
+from multiio.modbus import RtuClient, RtuSlave, SMmultiioModbus, open_pty
+
+
+@pytest.fixture
+def rtu(bus):
+    with open_pty() as pty:
+        slave = RtuSlave(pty.master, [SMmultiio(0, bus=bus), SMmultiio(1, bus=bus)], frame_gap=0.0005)
+        slave.start()
+        client = RtuClient(pty.path, frame_gap=0.0005, timeout=1)
+        try:
+            yield client
+        finally:
+            client.close()
+            slave.stop()
+
+
+def test_rtu_round_trip(bus, rtu):
+    bus.cards[1].set_u_in(1, 4.5)
+    bus.cards[1].set_opto(0b1000)
+    card = SMmultiioModbus(1, client=rtu)
+
+    card.set_u_out(2, 7.5)
+    card.set_relay(2, 1)
+
+    assert card.get_u_in(1) == pytest.approx(4.5)
+    assert card.get_opto(4) == 1
+    snapshot = card.read_snapshot()
+    assert snapshot.u_out[1] == pytest.approx(7.5)
+    assert snapshot.get_relay(2) == 1
+    local = SMmultiio(1, bus=bus)
+    assert local.get_u_out(2) == pytest.approx(7.5)
+    assert local.get_relay(2) == 1
+    assert SMmultiio(0, bus=bus).get_u_out(2) == 0
+
+
+def test_rtu_batch_is_one_request(bus, rtu):
+    card = SMmultiioModbus(0, client=rtu)
+    requests = rtu.requests
+    with card.batch():
+        card.set_u_out(1, 2.5)
+        card.set_u_out(2, 5)
+    assert rtu.requests == requests + 1
+    local = SMmultiio(0, bus=bus)
+    assert local.get_u_out(1) == pytest.approx(2.5)
+    assert local.get_u_out(2) == pytest.approx(5)
@@ -0,0 +1,63 @@
+import errno
+
+import pytest
+
+from multiio import SMmultiio, discover
+from multiio.emulator import EmulatedBus
+from multiio.pool import BusPool, SharedBus, pool
+
+
+@pytest.fixture
+def pooled(monkeypatch):
+    buses = {}
+
+    def factory(i2c):
+        buses[i2c] = EmulatedBus(stacks=[0, 2])
+        return buses[i2c]
+    monkeypatch.setattr(pool, "factory", factory)
+    yield buses
+    pool.close()
+
+
+def test_cards_share_one_bus(pooled):
+    first = SMmultiio(0, i2c=3)
+    second = SMmultiio(2, i2c=3)
+    assert isinstance(first.bus, SharedBus)
+    assert first.bus is second.bus
+    assert len(pooled) == 1
+    first.close()
+    assert len(pool) == 1
+    second.close()
+    assert len(pool) == 0
+
+
+def test_missing_card_raises_without_output(pooled, capsys):
+    with pytest.raises(OSError) as info:
+        SMmultiio(1, i2c=3)
+    assert info.value.errno == errno.EREMOTEIO
+    assert "not detected" in str(info.value)
+    assert capsys.readouterr().out == ""
+    assert len(pool) == 0
+
+
+def test_discover(pooled):
+    found = discover(i2c=3)
+    assert [card.stack for card in found] == [0, 2]
+    assert found[0].hw_version == found[0].card.get_hw_version()
+    for card in found:
+        card.card.close()
+    assert len(pool) == 0
+
+
+def test_release_closes_last_reference():
+    closed = []
+
+    class Bus:
+        def close(self):
+            closed.append(True)
+    buses = BusPool(lambda i2c: Bus())
+    assert buses.acquire(1) is buses.acquire(1)
+    buses.release(1)
+    assert not closed
+    buses.release(1)
+    assert closed == [True]
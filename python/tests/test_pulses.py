@@ -0,0 +1,37 @@
+import pytest
+
+from multiio.sampler import Sampler
+
+
+def test_pulses_in_one_transfer(bus, card):
+    emulator = bus.cards[0]
+    emulator.set_opto_frequency(1, 50, fill=25.5)
+    emulator.set_opto_frequency(4, 1200, fill=80, pps=1190)
+    pulses = card.read_pulses()
+    assert bus.transactions == 1
+    assert pulses.frequency == (50, 0, 0, 1200)
+    assert pulses.pps == (50, 0, 0, 1190)
+    assert pulses.pwm_fill[0] == pytest.approx(25.5)
+    for channel in range(1, 5):
+        assert card.get_opto_pps(channel) == pulses.pps[channel - 1]
+        assert card.get_opto_frequency(channel) == pulses.frequency[channel - 1]
+        assert card.get_opto_pwm_fill(channel) == pytest.approx(pulses.pwm_fill[channel - 1])
+
+
+def test_diagnostics_in_one_transfer(bus, card):
+    bus.cards[0].set_diagnostics(200, 3312)
+    diagnostics = card.read_diagnostics()
+    assert bus.transactions == 1
+    assert diagnostics.temperature == 200 == card.get_diag_temperature()
+    assert diagnostics.v3v3 == pytest.approx(3.312) == card.get_diag_3v3()
+
+
+def test_sampler_reads_pulse_kinds_together(bus, card):
+    bus.cards[0].set_opto_frequency(2, 75, fill=50)
+    sampler = Sampler([(card, "opto_pps", 2), (card, "opto_frequency", 2), (card, "opto_pwm_fill", 2)],
+                      period=0.01, use_numpy=False)
+    bus.reset_counters()
+    sampler.sample_once()
+    assert bus.transactions == 1
+    _, values = sampler.ring.latest(1)
+    assert values.tolist()[0] == pytest.approx([75, 75, 50])
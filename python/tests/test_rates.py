@@ -0,0 +1,38 @@
+import pytest
+
+from multiio.rates import CounterRates, i32_delta, u32_delta
+
+
+def test_counters_in_one_transfer(bus, card):
+    bus.cards[0].count_opto_edges(3, 12)
+    bus.cards[0].move_encoder(2, -5)
+    counters = card.read_counters()
+    assert bus.transactions == 1
+    assert counters.opto == (0, 0, 12, 0)
+    assert counters.encoder == (0, -5)
+    assert card.get_opto_counter(3) == 12
+
+
+def test_deltas_across_wrap():
+    assert u32_delta(3, 0xfffffffe) == 5
+    assert i32_delta(-0x7ffffffe, 0x7ffffffe) == 4
+    assert i32_delta(0x7ffffffe, -0x7ffffffe) == -4
+
+
+def test_rates_across_counter_wrap(bus, card):
+    emulator = bus.cards[0]
+    emulator.count_opto_edges(1, 0xfffffff0)
+    emulator.move_encoder(1, 0x7ffffff0)
+    rates = CounterRates()
+    assert rates.update(card.read_counters(), timestamp=10.0) is None
+    emulator.count_opto_edges(1, 0x20)
+    emulator.move_encoder(1, 0x20)
+    emulator.move_encoder(2, -8)
+    result = rates.update(card.read_counters(), timestamp=12.0)
+    assert card.get_opto_counter(1) == 0x10
+    assert result.opto == pytest.approx((16, 0, 0, 0))
+    assert result.encoder == pytest.approx((16, -4))
+    assert rates.totals.opto == (0x20, 0, 0, 0)
+    assert rates.update(card.read_counters(), timestamp=12.0) is None
+    rates.reset()
+    assert rates.totals.encoder == (0, 0)
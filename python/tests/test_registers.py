@@ -0,0 +1,41 @@
+import pytest
+
+from multiio.registers import REGISTERS, RTD_TEMP, SERVO, U_IN, U_OUT
+
+
+def test_codecs_match_the_card(bus, card):
+    emulator = bus.cards[0]
+    emulator.set_u_in(1, 1.5)
+    emulator.set_u_in(U_IN.count, 9.75)
+    emulator.set_rtd(2, -12.5)
+    buf = card.read_registers(U_IN.address, U_IN.block.size)
+    assert U_IN.decode(buf, U_IN.offset(U_IN.count)) == pytest.approx(9.75)
+    assert U_IN.decode_all(buf)[0] == pytest.approx(1.5)
+    assert U_IN.decode_all(buf)[-1] == pytest.approx(9.75)
+    rtd = card.read_registers(RTD_TEMP.address, RTD_TEMP.block.size)
+    assert RTD_TEMP.decode_all(rtd)[1] == pytest.approx(card.get_rtd_temp(2))
+
+
+def test_setters_and_getters_share_the_table(bus, card):
+    card.set_servo(2, -45.5)
+    assert SERVO.decode(bus.cards[0].mem, SERVO.check(2)) == pytest.approx(-45.5)
+    assert card.get_servo(2) == pytest.approx(-45.5)
+    card.set_u_out(2, 3.3)
+    assert U_OUT.to_raw(3.3) == pytest.approx(U_OUT.item.unpack_from(bus.cards[0].mem, U_OUT.check(2))[0], abs=1)
+
+
+def test_unscaled_values_stay_integers(bus, card):
+    bus.cards[0].count_opto_edges(2, 9)
+    counter = REGISTERS["opto_counter"]
+    value = counter.decode(card.read_registers(counter.address, counter.block.size), counter.offset(2))
+    assert value == 9 and isinstance(value, int)
+
+
+def test_invalid_channels(card):
+    with pytest.raises(ValueError) as info:
+        U_IN.check(U_IN.count + 1)
+    assert str(info.value) == U_IN.error
+    with pytest.raises(ValueError):
+        card.get_u_in(0)
+    with pytest.raises(ValueError):
+        card.set_u_out(U_OUT.count + 1, 1)
@@ -0,0 +1,67 @@
+import array
+import math
+
+import pytest
+
+from multiio import SMmultiio
+from multiio.sampler import RingBuffer, Sampler
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_ring_keeps_latest_rows_contiguous(use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    ring = RingBuffer(2, capacity=4, use_numpy=use_numpy)
+    times, values = ring.latest()
+    assert len(times) == 0 and len(values) == 0
+    for i in range(6):
+        ring.append(float(i), array.array("d", [i, 10 * i]))
+    times, values = ring.latest(3)
+    assert list(times) == [3.0, 4.0, 5.0]
+    assert [list(row) for row in values.tolist()] == [[3, 30], [4, 40], [5, 50]]
+    assert len(ring.latest()[0]) == 4
+
+
+def test_one_read_per_record_and_card(bus, card):
+    bus.cards[0].set_u_in(1, 1.5)
+    bus.cards[0].set_rtd(2, 21.5)
+    bus.cards[0].count_opto_edges(1, 3)
+    sampler = Sampler([(card, "u_in", 1), (card, "rtd_temp", 2), (card, "opto_counter", 1)],
+                      period=0.01)
+    bus.reset_counters()
+    sampler.sample_once()
+    snapshot_and_counters = bus.transactions
+    sampler.sample_once()
+    assert bus.transactions == 2 * snapshot_and_counters
+    _, values = sampler.ring.latest(1)
+    assert list(values.tolist()[0]) == pytest.approx([1.5, 21.5, 3], abs=0.01)
+
+
+def test_failed_card_stores_nan(bus, card):
+    other = SMmultiio(1, bus=bus)
+    sampler = Sampler([(card, "u_in", 1), (other, "u_in", 1)], period=0.01, use_numpy=False)
+    bus.remove_card(1)
+    sampler.sample_once()
+    _, values = sampler.ring.latest(1)
+    assert not math.isnan(values[0, 0])
+    assert math.isnan(values[0, 1])
+    assert sampler.errors == 1
+
+
+def test_invalid_channels_rejected(card):
+    with pytest.raises(ValueError):
+        Sampler([(card, "u_in", 9)], period=0.01)
+    with pytest.raises(ValueError):
+        Sampler([(card, "relay", 1)], period=0.01)
+    with pytest.raises(ValueError):
+        Sampler([(card, "u_in", 1)], period=0)
+
+
+def test_background_thread_streams_samples(card):
+    with Sampler([(card, "u_in", 1)], period=0.005) as sampler:
+        rows = []
+        for row in sampler.ring.samples(timeout=1):
+            rows.append(row)
+            if len(rows) == 3:
+                break
+    assert [t for t, _ in rows] == sorted(t for t, _ in rows)
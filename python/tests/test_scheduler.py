@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+import multiio.multiio_data as data
+from multiio import SMmultiio
+from multiio.scheduler import BusScheduler, LOW, NORMAL, URGENT
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = BusScheduler()
+    yield scheduler
+    scheduler.close()
+
+
+class ContendedBus:
+    # Lets another thread run a card operation while the first read of the
+    # opto edge registers is in progress
+    def __init__(self, bus, contender):
+        self.bus = bus
+        self.contender = contender
+        self.thread = None
+
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        result = self.bus.read_i2c_block_data(i2c_addr, register, length)
+        if register == data.I2C_MEM.OPTO_IT_RISING_ADD and self.thread is None:
+            self.thread = threading.Thread(target=self.contender)
+            self.thread.start()
+            time.sleep(0.05)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+
+
+def test_urgent_requests_run_first(scheduler):
+    release = threading.Event()
+    order = []
+    blocker = scheduler.submit(release.wait)
+    late = [scheduler.submit(order.append, "low", priority=LOW),
+            scheduler.submit(order.append, "normal", priority=NORMAL),
+            scheduler.submit(order.append, "urgent", priority=URGENT)]
+    release.set()
+    for future in [blocker] + late:
+        future.result()
+    assert order == ["urgent", "normal", "low"]
+
+
+def test_missed_deadline_reported(scheduler):
+    misses = []
+
+    def broken(priority, late):
+        raise RuntimeError("callback")
+    scheduler.on_deadline_miss += [lambda priority, late: misses.append(priority), broken]
+    scheduler.call(time.sleep, 0.01, priority=URGENT, deadline=0.001)
+    assert scheduler.missed_deadlines == 1
+    assert misses == [URGENT]
+    assert scheduler.callback_errors == 1
+
+
+def test_read_modify_write_is_not_interleaved(bus, scheduler):
+    other = SMmultiio(0, bus=bus)
+    other.schedule(scheduler)
+    contended = ContendedBus(bus, lambda: other.set_opto_edge(2, 1))
+    card = SMmultiio(0, bus=contended)
+    card.schedule(scheduler)
+    card.set_opto_edge(1, 2)
+    contended.thread.join()
+    assert card.get_opto_edge(1) == 2
+    assert card.get_opto_edge(2) == 1
+
+
+def test_exclusive_is_reentrant_and_orders_other_threads(bus, scheduler):
+    card = SMmultiio(0, bus=bus)
+    card.schedule(scheduler)
+    done = []
+    with scheduler.exclusive():
+        with scheduler.exclusive():
+            writer = threading.Thread(target=lambda: done.append(card.set_relay(1, 1)))
+            writer.start()
+            writer.join(0.05)
+            assert not done
+            assert card.get_relay(1) == 0
+    writer.join()
+    assert card.get_relay(1) == 1
@@ -0,0 +1,55 @@
+import errno
+import time
+
+import pytest
+
+from multiio import SMmultiio
+from multiio.timebase import CardClock, TimeBase, correlate, sync_rtc
+
+
+class FastRtc:
+    # Card whose RTC runs speed times faster than the host clock, so second
+    # edges come quickly; stopped when speed is 0
+    def __init__(self, speed, start=1700000000):
+        self.speed = speed
+        self.start = start
+        self.origin = time.monotonic()
+
+    def get_rtc(self):
+        seconds = self.start + int((time.monotonic() - self.origin) * self.speed)
+        return time.gmtime(seconds)[:6]
+
+
+def test_drift_and_interpolation():
+    card = FastRtc(speed=25)
+    clock = CardClock(card, resolution=0.001, window=0.01)
+    with pytest.raises(ValueError):
+        clock.stamp()
+    for _ in range(4):
+        correlation = clock.correlate(max_wait=1)
+        assert correlation.uncertainty < 0.01
+    assert clock.drift == pytest.approx(24, rel=0.05)
+    now = time.monotonic()
+    expected = card.start + (now - card.origin) * card.speed
+    assert clock.card_time(now) == pytest.approx(expected, abs=0.5)
+    result, stamp = clock.read(lambda: "value")
+    assert result == "value"
+    assert stamp.card_time == pytest.approx(clock.card_time(stamp.monotonic))
+
+
+def test_stopped_rtc_times_out():
+    clock = CardClock(FastRtc(speed=0), resolution=0.001)
+    with pytest.raises(OSError) as info:
+        correlate([clock], max_wait=0.05)
+    assert info.value.errno == errno.ETIMEDOUT
+
+
+def test_synced_cards_follow_host_time(bus):
+    cards = [SMmultiio(0, bus=bus), SMmultiio(1, bus=bus)]
+    delays = sync_rtc(cards)
+    assert all(0 <= delay < 0.05 for delay in delays)
+    timebase = TimeBase(cards, resolution=0.001)
+    timebase.correlate()
+    stamp = timebase.stamp(cards[1])
+    assert stamp.card_time == pytest.approx(stamp.host_time, abs=0.1)
+    assert abs(timebase.skew()[1]) < 0.1
@@ -0,0 +1,96 @@
+import pytest
+from smbus2 import i2c_msg
+
+from multiio import SMmultiio
+from multiio.emulator import EmulatedBus
+from multiio.instrument import InstrumentedBus, Metrics
+from multiio.trace import RecordingBus, ReplayBus, TraceMismatch, TraceRecorder, read_trace
+
+
+def _session(card):
+    card.set_u_out(1, 2.5)
+    with card.batch():
+        card.set_servo(1, 30)
+        card.set_i_out(2, 12)
+    return card.read_snapshot(), card.get_u_in(1), card.get_opto_counter(2)
+
+
+def test_record_replay_round_trip(tmp_path):
+    path = str(tmp_path / "session.trace")
+    bus = EmulatedBus(stacks=[0])
+    bus.cards[0].set_u_in(1, 4.5)
+    bus.cards[0].count_opto_edges(2, 7)
+    with TraceRecorder(path) as recorder:
+        recorded = _session(SMmultiio(0, bus=RecordingBus(bus, recorder)))
+        entries = recorder.entries
+    assert len(list(read_trace(path))) == entries
+
+    replay = ReplayBus(path, strict=True)
+    replayed = _session(SMmultiio(0, bus=replay))
+    assert replayed == recorded
+    assert replay.matched == entries
+    assert replay.unmatched == 0
+
+
+def test_strict_replay_detects_divergence(tmp_path):
+    path = str(tmp_path / "session.trace")
+    with TraceRecorder(path) as recorder:
+        _session(SMmultiio(0, bus=RecordingBus(EmulatedBus(stacks=[0]), recorder)))
+    card = SMmultiio(0, bus=ReplayBus(path, strict=True))
+    with pytest.raises(TraceMismatch):
+        card.set_u_out(2, 1)
+
+
+def test_reopen_drops_torn_entry(tmp_path):
+    path = str(tmp_path / "session.trace")
+    bus = EmulatedBus(stacks=[0])
+    with TraceRecorder(path) as recorder:
+        card = SMmultiio(0, bus=RecordingBus(bus, recorder))
+        card.get_u_in(1)
+    complete = len(list(read_trace(path)))
+    with open(path, "ab") as f:
+        f.write(b"\x01" * 11)
+    assert len(list(read_trace(path))) == complete
+
+    with TraceRecorder(path) as recorder:
+        card.record(recorder)
+        card.get_u_in(2)
+    assert len(list(read_trace(path))) == complete + 1
+
+
+def test_record_removes_nested_wrapper(tmp_path, bus, card):
+    with TraceRecorder(str(tmp_path / "session.trace")) as recorder:
+        card.record(recorder)
+        card.instrument(Metrics())
+        card.record(recorder)
+        assert sum(isinstance(layer, RecordingBus) for layer in _layers(card)) == 1
+        card.record(None)
+        card.get_u_in(1)
+        assert recorder.entries == 0
+    assert [type(layer) for layer in _layers(card)] == [InstrumentedBus, type(bus)]
+
+
+def _layers(card):
+    layer = card.bus
+    while layer is not None:
+        yield layer
+        layer = getattr(layer, "bus", None)
+
+
+def test_rdwr_replay_matches_every_message(tmp_path):
+    path = str(tmp_path / "session.trace")
+    bus = EmulatedBus(stacks=[0])
+    bus.cards[0].set_u_in(1, 4.5)
+    with TraceRecorder(path) as recorder:
+        card = SMmultiio(0, bus=RecordingBus(bus, recorder), rdwr=True)
+        recorded = bytes(card.read_registers(0, 64))
+
+    card = SMmultiio(0, bus=ReplayBus(path, strict=True), rdwr=True)
+    assert bytes(card.read_registers(0, 64)) == recorded
+
+    address = card._hw_address_
+    for second in (i2c_msg.write(address, bytes(64)), i2c_msg.read(address + 1, 64)):
+        replay = ReplayBus(path, strict=True)
+        SMmultiio(0, bus=replay)
+        with pytest.raises(TraceMismatch):
+            replay.i2c_rdwr(i2c_msg.write(address, [0]), second)
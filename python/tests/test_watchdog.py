@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import multiio.multiio_data as data
+from multiio.instrument import InstrumentedBus, Metrics
+from multiio.watchdog import WatchdogKeeper, _KeeperBus
+
+
+class FlakyReloadBus:
+    # Fails the watchdog reloads while fail is set, forwards everything else
+    def __init__(self, bus):
+        self.bus = bus
+        self.fail = False
+
+    def write_byte_data(self, address, register, value):
+        if self.fail and register == data.I2C_MEM.WDT_RESET_ADD:
+            raise OSError("reload lost")
+        self.bus.write_byte_data(address, register, value)
+
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+
+
+def chain(card):
+    bus = card.bus
+    while bus is not None:
+        yield bus
+        bus = getattr(bus, "bus", None)
+
+
+def test_disabled_watchdog_rejected(card):
+    with pytest.raises(ValueError):
+        WatchdogKeeper(card, period=0)
+    with pytest.raises(ValueError):
+        WatchdogKeeper(card, fraction=1, period=10)
+
+
+def test_reload_piggybacks_on_application_traffic(bus, card):
+    keeper = WatchdogKeeper(card, period=60)
+    keeper.start()
+    try:
+        assert bus.cards[0].wdt_reloads == 1
+        card.get_u_in(1)
+        assert keeper.piggybacked == 0
+        keeper._due = 0
+        card.get_u_in(1)
+        assert keeper.piggybacked == 1
+        assert bus.cards[0].wdt_reloads == 2
+    finally:
+        keeper.stop()
+
+
+def test_idle_timer_reloads(bus, card):
+    keeper = WatchdogKeeper(card, period=0.2)
+    keeper.start()
+    try:
+        deadline = time.monotonic() + 2
+        while keeper.timer_reloads == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert keeper.timer_reloads > 0
+        assert bus.cards[0].wdt_reloads == keeper.reloads
+    finally:
+        keeper.stop()
+
+
+def test_stop_unwraps_keeper_below_other_wrappers(card):
+    keeper = WatchdogKeeper(card, period=60)
+    keeper.start()
+    card.instrument(Metrics())
+    keeper.stop()
+    wrappers = list(chain(card))
+    assert not any(isinstance(bus, _KeeperBus) for bus in wrappers)
+    assert isinstance(card.bus, InstrumentedBus)
+
+
+def test_failed_piggyback_keeps_application_result(bus, card):
+    flaky = card.bus = FlakyReloadBus(card.bus)
+    keeper = WatchdogKeeper(card, period=60)
+    keeper.start()
+    try:
+        bus.cards[0].set_u_in(1, 4.5)
+        flaky.fail = True
+        keeper._due = 0
+        assert card.get_u_in(1) == pytest.approx(4.5, abs=0.01)
+        assert keeper.piggyback_errors == 1
+        flaky.fail = False
+        card.get_u_in(1)
+        assert keeper.piggybacked == 1
+        assert keeper.metrics()["piggyback_errors"] == 1
+    finally:
+        keeper.stop()
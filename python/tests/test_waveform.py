@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from multiio.waveform import Periodic, PiecewiseLinear, Ramp, WaveformGenerator
+
+
+class StallingBus:
+    # Stalls the first block write, so the run falls far behind its timeline
+    def __init__(self, bus, stall):
+        self.bus = bus
+        self.stall = stall
+
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        if self.stall:
+            time.sleep(self.stall)
+            self.stall = 0
+        self.bus.write_i2c_block_data(i2c_addr, register, data)
+
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+
+
+def test_profiles():
+    ramp = Ramp(0, 10, duration=2, shape="s-curve")
+    assert ramp(-1) == 0
+    assert ramp(1) == pytest.approx(5)
+    assert ramp(3) == 10
+    points = PiecewiseLinear([(0, 0), (1, 10), (2, 0)])
+    assert points(0.5) == pytest.approx(5)
+    assert points(5) == 0
+    square = Periodic("square", period=1, amplitude=2, offset=1)
+    assert square(0.25) == 3
+    assert square(0.75) == -1
+    with pytest.raises(ValueError):
+        Ramp(0, 1, duration=1, shape="cubic")
+    with pytest.raises(ValueError):
+        PiecewiseLinear([(1, 0), (0, 1)])
+
+
+def test_table_values_and_limits(card):
+    generator = WaveformGenerator(card, {
+        ("u_out", 1): Ramp(0, 10, duration=1),
+        ("servo", 2): Ramp(0, 100, duration=0.5),
+    }, rate=10)
+    assert len(generator) == 11
+    assert generator.values(5) == {("u_out", 1): pytest.approx(5), ("servo", 2): pytest.approx(100)}
+    with pytest.raises(ValueError):
+        WaveformGenerator(card, {("motor", 1): Ramp(0, 200, duration=1)}, rate=10)
+    with pytest.raises(ValueError):
+        WaveformGenerator(card, {("u_in", 1): Ramp(0, 1, duration=1)}, rate=10)
+
+
+def test_run_writes_every_step(bus, card):
+    generator = WaveformGenerator(card, {("u_out", 1): Ramp(0, 10, duration=0.05)}, rate=200)
+    timing = generator.run()
+    assert timing.steps + timing.missed == len(generator)
+    assert timing.errors == 0
+    assert card.get_u_out(1) == pytest.approx(10, abs=0.01)
+
+
+def test_late_run_still_writes_last_step(bus, card):
+    card.bus = StallingBus(card.bus, stall=0.2)
+    generator = WaveformGenerator(card, {("u_out", 1): Ramp(0, 10, duration=0.05)}, rate=200)
+    timing = generator.run()
+    assert timing.steps == 2
+    assert timing.missed == len(generator) - 2
+    assert card.get_u_out(1) == pytest.approx(10, abs=0.01)
+
+
+def test_repeat_until_stopped(card):
+    with WaveformGenerator(card, {("u_out", 2): Periodic("sine", 0.02, 1, offset=5)},
+                           rate=500, repeat=True) as generator:
+        time.sleep(0.05)
+    assert generator.timing.steps > len(generator)